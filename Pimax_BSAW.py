@@ -13,33 +13,36 @@
 
 import argparse
 import asyncio
-import atexit
 import binascii
+import collections
 import configparser
-import datetime
+import contextlib
+import heapq
+import io
+import itertools
 import json
 import logging
 import os
+import random
 import re
 import sys
 import threading
 import time
 from datetime import datetime
-from datetime import timedelta
 
-import pywinusb.hid as hid
-import wx
-import wx.lib
-import wx.lib.newevent
-import wx.lib.colourdb
-import wx.dataview as dv
-from bleak import BleakClient
-from bleak import _logger as logger
-from bleak import discover
-from infi.systray import SysTrayIcon
-from win10toast import ToastNotifier
+T_START = time.monotonic()
 
-LogMsgEvent, EVT_LOG_MSG = wx.lib.newevent.NewEvent()
+# wx, bleak, infi.systray and win10toast are imported on first use to keep the startup fast and light,
+# the status panel lives in bsaw_panel and is loaded the first time it is opened
+
+
+def isdebug():
+    """
+    Return True if DEBUG records are logged, guard for the expensive log payloads (hex and GATT dumps)
+    The hot paths log with % arguments so nothing is formatted when DEBUG is off
+    :return:
+    """
+    return logging.root.isEnabledFor(logging.DEBUG)
 
 
 class MainObj:
@@ -52,154 +55,1642 @@ class MainObj:
         self.version = "1.5.2"
         self.pimax_usb_vendor_id = 0
         self.lh_db_file = ""
+        self.lh_universe = ""
+        self.lh_db_watch = 5
+        self.lhdb = None
         self.sleep_time_sec_usb_find = 7
+        self.hs_presence = "auto"
+        self.logring = LogRing(5000)
+        self.panel_preload = False
         self.debug_logs = False
         self.debug_bypass_usb = False
+        self.dump_gatt = False
 
         self.tray_icon = "pimax.ico"
         self.logformat = "%(asctime)s %(levelname)s (%(module)s): %(message)s"
 
         self.hs_label = 'HeadSet'
-        self.bs1_label = 'BS1'
-        self.bs2_label = 'BS2'
+        self.bs_label = 'BS'
         self.bs_timeout_in_sec = 60
         self.bs_disco_sleep = 5
 
         self.toomanynoted = False
         self.quit_main = False
+        self.quitevent = threading.Event()
         self.stations = []
         self.bs_serials = []
 
-        self.systray = None
-        self.hsthr = None
-        self.bs1thr = None
-        self.bs2thr = None
-        self.logthr = None
-        self.toaster = None
+        self.systray = None
+        self.bleengine = None
+        self.hsthr = None
+        self.statusbus = StatusBus()
+        self.bsreg = StationRegistry(self)
+        self.logthr = None
+        self.toaster = None
+
+        self.ble_concurrency = 1
+        self.ble_lock_timeout = 30
+        self.bs_broadcast_timeout = 15
+        self.bs_quit_timeout = 5
+        self.discache = None
+        self.discache_file = "discoverycache.json"
+        self.discache_ttl = 7 * 24 * 3600
+        self.quitfuture = None
+        self.discovery = None
+        self.disco = True
+        self.mode = "Auto"
+
+        self.startup = StartupTimer(T_START)
+        self.startup_file = ""
+        self.ble_backend = None
+        self.presence_backend = None
+        self.tray_factory = None
+
+        self.panelupdate = "Initializing"
+        self.panelstatus = [(0, ("Dashboard", "Status", self.panelupdate)), (1, ("", "", ""))]
+        self.paneldata = [[str(k)] + list(v) for k, v in self.panelstatus]
+
+    def set_threads(self, _systray, _hsthr, _logthr):
+        """
+        Set infi.systray, headset thread and log thread in main instance
+        :type _logthr: object
+        :param _hsthr:
+        :type _systray: object
+        """
+        self.systray = _systray
+        self.hsthr = _hsthr
+        self.logthr = _logthr
+
+    def setengine(self, _bleengine):
+        """
+        Set the shared BLE engine in main instance
+        :type _bleengine: object
+        """
+        self.bleengine = _bleengine
+
+    def settoaster(self, _toaster):
+        """
+        Set toaster object in main instance
+        :type _toaster: object
+        """
+        self.toaster = _toaster
+
+    def gettoaster(self):
+        """
+        Return the toaster object, win10toast is imported on first use
+        :return:
+        """
+        if self.toaster is None:
+            from win10toast import ToastNotifier
+            self.toaster = ToastNotifier()
+        return self.toaster
+
+    def get_quit_main(self):
+        """
+        Return quit main value from main instance
+        :return:
+        """
+        return self.quit_main
+
+    def setquit(self):
+        """
+        Set the quit main flag and wake up the Basestations state machines and the Headset thread
+        """
+        self.quit_main = True
+        self.quitevent.set()
+        self.notifyall()
+        if self.hsthr:
+            self.hsthr.notify()
+
+    def setdisco(self, _disco):
+        """
+        Set the discovery running flag and wake up the Basestations state machines
+        :param _disco:
+        """
+        self.disco = _disco
+        self.notifyall()
+        if self.hsthr:
+            self.hsthr.notify()
+
+    def notifyall(self):
+        """
+        Wake up the state machine of all the Basestations
+        """
+        for bsthr in self.bsreg.all():
+            bsthr.notify()
+
+    def get_dashboard_except(self):
+        self.panelstatus = [(0, ("Dashboard", "Status", self.panelupdate)), (1, ("", "", ""))]
+        self.paneldata = [[str(k)] + list(v) for k, v in self.panelstatus]
+        return self.paneldata
+
+    def toast_err(self, _msg):
+        """
+        Function to display the error message as a Windows 10 toast notification
+        :param _msg:
+        """
+        self.gettoaster().show_toast("PIMAX_BSAW",
+                           _msg,
+                           icon_path=maininst.tray_icon,
+                           duration=5,
+                           threaded=True)
+        while self.toaster.notification_active(): time.sleep(0.1)
+
+    def load_configuration(self, _toaster):
+        """
+        Load configuration file
+        :param _toaster:
+        """
+        try:
+            config = configparser.ConfigParser()
+            config.read('configuration.ini')
+            logging.debug("Configuration file Headset USB ID: " + config['HeadSet']['USB_VENDOR_ID'])
+            self.pimax_usb_vendor_id = int(config['HeadSet']['USB_VENDOR_ID'], 0)
+            self.hs_presence = config['HeadSet'].get('PRESENCE', self.hs_presence).strip().lower()
+            logging.debug("Configuration file Headset presence backend: " + self.hs_presence)
+            self.panel_preload = config.getboolean('Panel', 'PRELOAD', fallback=False)
+            conf_log_lines = int(config.get('Panel', 'LOG_LINES', fallback='5000'), 0)
+            if 100 <= conf_log_lines <= 1000000:
+                self.logring.resize(conf_log_lines)
+                logging.debug("Configuration file status panel log lines: " + str(conf_log_lines))
+            conf_bs_timeout_in_sec = int(config['BaseStation']['BS_TIMEOUT_IN_SEC'], 0)
+            if 30 <= conf_bs_timeout_in_sec <= 120:
+                self.bs_timeout_in_sec = conf_bs_timeout_in_sec
+                logging.debug("Configuration file BS timeout: " + config['BaseStation']['bs_timeout_in_sec'])
+                for bsthr in self.bsreg.all():
+                    bsthr.settimeout(self.bs_timeout_in_sec)
+            self.lh_db_file = config['HeadSet']['LH_DB_FILE']
+            logging.debug("Configuration file LightHouse DB filepath: " + self.lh_db_file)
+            self.lh_universe = config['HeadSet'].get('LH_UNIVERSE', self.lh_universe).strip()
+            if self.lh_universe:
+                logging.debug("Configuration file LightHouse DB universe: " + self.lh_universe)
+            conf_lh_db_watch = int(config['HeadSet'].get('LH_DB_WATCH_SECS', '5'), 0)
+            if 0 <= conf_lh_db_watch <= 3600:
+                self.lh_db_watch = conf_lh_db_watch
+                logging.debug("Configuration file LightHouse DB watch: " + str(conf_lh_db_watch) + " seconds")
+            self.lhdb = LighthouseDB(self.lh_db_file, self.lh_universe)
+            conf_ble_concurrency = int(config['BaseStation'].get('BLE_CONCURRENCY', '1'), 0)
+            if 1 <= conf_ble_concurrency <= 8:
+                self.ble_concurrency = conf_ble_concurrency
+                logging.debug("Configuration file BLE concurrency: " + str(self.ble_concurrency))
+            conf_ble_lock_timeout = int(config['BaseStation'].get('BLE_LOCK_TIMEOUT', '30'), 0)
+            if 5 <= conf_ble_lock_timeout <= 300:
+                self.ble_lock_timeout = conf_ble_lock_timeout
+                logging.debug("Configuration file BLE lock timeout: " + str(self.ble_lock_timeout))
+            self.discache_file = config['BaseStation'].get('DISCOVERY_CACHE_FILE', self.discache_file)
+            conf_discache_ttl = int(config['BaseStation'].get('DISCOVERY_CACHE_TTL_HOURS', '168'), 0)
+            if 0 <= conf_discache_ttl <= 8760:
+                self.discache_ttl = conf_discache_ttl * 3600
+                logging.debug("Configuration file discovery cache TTL: " + str(conf_discache_ttl) + " hours")
+            self.discache = DiscoveryCache(self.discache_file, self.discache_ttl)
+            self.discache.load()
+        except Exception as err:
+            if not self.quit_main:
+                self.toast_err("Load configuration file exception: " + str(err))
+                self.setquit()
+
+    def setstandby(self, _timeout=None):
+        """
+        Send standby command to all the Basestations
+        :param _timeout: seconds to wait for each Basestation, defaults to self.bs_broadcast_timeout
+        :return: concurrent.futures.Future with the BroadcastResult, None if the BLE engine is not running
+        """
+        logging.info("Sending Standby to Basestations")
+        return self.broadcast("Standby", _timeout)
+
+    def setwakeup(self, _timeout=None):
+        """
+        Send wakeup command to all the Basestations
+        :param _timeout: seconds to wait for each Basestation, defaults to self.bs_broadcast_timeout
+        :return: concurrent.futures.Future with the BroadcastResult, None if the BLE engine is not running
+        """
+        logging.info("Sending Wakeup to Basestations")
+        return self.broadcast("Wakeup", _timeout)
+
+    def broadcast(self, _action, _timeout=None):
+        """
+        Send the action to all the Basestations at once and track the completion
+        The outcome is logged when all the Basestations are done or timed out
+        :param _action: Standby or Wakeup
+        :param _timeout: seconds to wait for each Basestation, defaults to self.bs_broadcast_timeout
+        :return: concurrent.futures.Future with the BroadcastResult, None if the BLE engine is not running
+        """
+        if _timeout is None:
+            _timeout = self.bs_broadcast_timeout
+        if self.bleengine is None or not self.bleengine.is_alive():
+            for bsthr in self.bsreg.all():
+                bsthr.setaction(_action)
+            return None
+        future = self.bleengine.submit(broadcast_action(self.bsreg.all(), _action, _timeout))
+
+        def log_result(_future):
+            if not _future.cancelled() and _future.exception() is None:
+                logging.info(_future.result().getsummary())
+
+        future.add_done_callback(log_result)
+        return future
+
+    def setmode(self):
+        """
+        Switch the mode of all the Basestations between Auto and Idle
+        """
+        if self.mode == "Auto":
+            _mode = "Idle"
+        else:
+            _mode = "Auto"
+        self.mode = _mode
+        logging.info("Set BS mode to " + str(_mode))
+        for bsthr in self.bsreg.all():
+            bsthr.setmode(_mode)
+
+
+class StartupTimer:
+
+    def __init__(self, _t0=None):
+        """
+        Phase timing of the startup, each phase is recorded only the first time it runs
+        The times are seconds since _t0, the module import start
+        :param _t0: monotonic reference time
+        """
+        self.t0 = time.monotonic() if _t0 is None else _t0
+        self.lock = threading.Lock()
+        self.phases = collections.OrderedDict()
+        self.saved = False
+
+    def begin(self, _name):
+        """
+        Start the phase _name
+        :param _name:
+        """
+        with self.lock:
+            if _name not in self.phases:
+                self.phases[_name] = [time.monotonic() - self.t0, None]
+
+    def end(self, _name):
+        """
+        End the phase _name, a phase never begun starts at the reference time
+        :param _name:
+        :return: True the first time the phase ends
+        """
+        with self.lock:
+            phase = self.phases.setdefault(_name, [0.0, None])
+            if phase[1] is not None:
+                return False
+            phase[1] = time.monotonic() - self.t0
+            return True
+
+    def mark(self, _name):
+        """
+        Record the instant event _name, e.g. the first successful wakeup
+        :param _name:
+        :return: True the first time the event is recorded
+        """
+        self.begin(_name)
+        return self.end(_name)
+
+    @contextlib.contextmanager
+    def phase(self, _name):
+        """
+        Context manager timing the phase _name
+        :param _name:
+        """
+        self.begin(_name)
+        try:
+            yield
+        finally:
+            self.end(_name)
+
+    def getreport(self):
+        """
+        Return the phases as a dict ready to be dumped as JSON, phases still running have no end
+        :return:
+        """
+        with self.lock:
+            phases = [(name, start, end) for name, (start, end) in self.phases.items()]
+        return {"phases": [{"name": name, "start": round(start, 4),
+                            "end": None if end is None else round(end, 4),
+                            "duration": None if end is None else round(end - start, 4)}
+                           for name, start, end in phases]}
+
+    def getsummary(self):
+        """
+        Return string with the end time of each phase
+        :return:
+        """
+        return ", ".join(f"{phase['name']} {phase['end']:.3f}s" for phase in self.getreport()["phases"]
+                         if phase["end"] is not None)
+
+    def save(self, _filename):
+        """
+        Dump the report as JSON in _filename, the summary is logged
+        :param _filename:
+        """
+        logging.info("Startup timing: " + self.getsummary())
+        self.saved = True
+        if not _filename:
+            return
+        try:
+            with open(_filename, "w") as json_file:
+                json.dump(self.getreport(), json_file, indent=2)
+        except Exception as err:
+            logging.error("Error saving startup timing: " + str(err))
+
+
+JSON_TOKEN = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)(?![0-9.eE+-])'
+                        r'|(true|false|null)|([{}\[\]:,]))')
+JSON_SKIP = re.compile(r'[^"{}\[\]]*(?:([{\[])|([}\]])|("(?:[^"\\]|\\.)*"))?')
+JSON_LITERALS = {"true": ("boolean", True), "false": ("boolean", False), "null": ("null", None)}
+
+LH_DB_UNIVERSE = "known_universes.item"
+LH_DB_UNIVERSE_ID = "known_universes.item.universe_id"
+LH_DB_SERIAL = "known_universes.item.base_stations.item.base_serial_number"
+
+
+def iterjson(_file, _paths=None, _chunk=65536):
+    """
+    Incremental JSON parser yielding ijson style events (prefix, event, value), the file is read in chunks
+    With _paths only the containers on the way to the _paths prefixes are parsed, the others are skipped
+    without decoding, the memory use does not depend on the file size
+    :param _file: text file object
+    :param _paths: prefixes of the values to parse, None for all of them
+    :param _chunk: characters read at once
+    """
+    wanted = None
+    if _paths is not None:
+        wanted = set()
+        for path in _paths:
+            parts = path.split(".")
+            wanted.update(".".join(parts[:idx]) for idx in range(len(parts) + 1))
+    buf = ""
+    pos = 0
+    eof = False
+    stack = []  # [prefix, True, last key] for maps, [prefix, None, None] for arrays
+    expect = "value"  # value, first (value or ]), key, firstkey (key or }), colon, sep (, or close), end
+
+    def fill():
+        nonlocal buf, pos
+        data = _file.read(_chunk)
+        buf = buf[pos:] + data
+        pos = 0
+        return len(data) > 0
+
+    def invalid(_token, _prefix):
+        return ValueError("Invalid JSON, unexpected " + _token + " in " + (_prefix or "the root"))
+
+    while True:
+        match = JSON_TOKEN.match(buf, pos)
+        if match is None or (match.end() == len(buf) and not eof):
+            if not eof:
+                eof = not fill()
+                continue
+            if buf[pos:].strip():
+                raise ValueError("Invalid JSON near: " + buf[pos:pos + 32].strip())
+            break
+        pos = match.end()
+        string, number, literal, punct = match.groups()
+        token = match.group().strip()
+        top = stack[-1] if stack else None
+        where = top[0] if top is not None else ""
+        if punct == ",":
+            if expect != "sep":
+                raise invalid(token, where)
+            expect = "key" if top[1] else "value"
+            continue
+        if punct == ":":
+            if expect != "colon":
+                raise invalid(token, where)
+            expect = "value"
+            continue
+        if punct == "}" or punct == "]":
+            if top is None or (punct == "}") != bool(top[1]) or \
+                    expect not in ("sep", "firstkey" if punct == "}" else "first"):
+                raise invalid(token, where)
+            stack.pop()
+            expect = "sep" if stack else "end"
+            yield top[0], "end_map" if punct == "}" else "end_array", None
+            continue
+        if expect in ("key", "firstkey"):
+            if string is None:
+                raise ValueError("Invalid JSON, expected a key in " + (where or "the root object"))
+            expect = "colon"
+            top[2] = json.loads('"' + string + '"') if "\\" in string else string
+            yield top[0], "map_key", top[2]
+            continue
+        if expect not in ("value", "first"):
+            raise invalid(token, where)
+        if top is None:
+            prefix = ""
+        else:
+            prefix = (top[0] + "." if top[0] else "") + (top[2] if top[1] else "item")
+        expect = "sep" if stack else "end"
+        if punct is not None:
+            if wanted is not None and prefix not in wanted:
+                depth = 1
+                while depth:
+                    skip = JSON_SKIP.match(buf, pos)
+                    pos = skip.end()
+                    if skip.group(1):
+                        depth += 1
+                    elif skip.group(2):
+                        depth -= 1
+                    elif skip.group(3) is None:
+                        # end of the buffer or a string split across two chunks
+                        if eof:
+                            raise ValueError("Invalid JSON, truncated in " + prefix)
+                        eof = not fill()
+                continue
+            stack.append([prefix, True, None] if punct == "{" else [prefix, None, None])
+            expect = "firstkey" if punct == "{" else "first"
+            yield prefix, "start_map" if punct == "{" else "start_array", None
+            continue
+        if wanted is not None and prefix not in wanted:
+            continue
+        if string is not None:
+            yield prefix, "string", json.loads('"' + string + '"') if "\\" in string else string
+        elif number is not None:
+            yield prefix, "number", float(number) if "." in number or "e" in number or "E" in number \
+                else int(number)
+        else:
+            event, value = JSON_LITERALS[literal]
+            yield prefix, event, value
+    if stack:
+        raise ValueError("Invalid JSON, truncated in " + (stack[-1][0] or "the root"))
+    if expect != "end":
+        raise ValueError("Invalid JSON, no value")
+
+
+def jsonevents(_file, _paths=None):
+    """
+    Return the ijson style events of a JSON file opened in binary mode
+    ijson is used when installed, the built-in iterjson otherwise
+    :param _file:
+    :param _paths: prefixes of the values needed, a hint for iterjson
+    :return:
+    """
+    try:
+        import ijson
+    except ImportError:
+        return iterjson(io.TextIOWrapper(_file, encoding="utf-8-sig"), _paths)
+    return ijson.parse(_file)
+
+
+class LighthouseDB:
+
+    def __init__(self, _filename, _universe=""):
+        """
+        Lighthouse DB written by Pitool, the file is parsed again only when its mtime or size change
+        The Basestation serial numbers are cached for each universe
+        :param _filename: JSON file
+        :param _universe: universe_id of the room setup, empty for the first universe
+        """
+        self.filename = _filename
+        self.universe = str(_universe)
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.universes = collections.OrderedDict()
+        self.parses = 0
+        self.watcher = None
+
+    def getstamp(self):
+        """
+        Return the file mtime and size, raise OSError if the file is missing
+        :return:
+        """
+        stat = os.stat(self.filename)
+        return stat.st_mtime_ns, stat.st_size
+
+    def parse(self):
+        """
+        Stream the file and return OrderedDict universe_id -> list of Basestation serial numbers
+        Only the universe ids and the serial numbers are decoded, the calibration data is skipped
+        :return:
+        """
+        universes = collections.OrderedDict()
+        idx = -1
+        universe = None
+        serials = []
+        with open(self.filename, "rb") as json_file:
+            for prefix, event, value in jsonevents(json_file, (LH_DB_UNIVERSE_ID, LH_DB_SERIAL)):
+                if prefix == LH_DB_UNIVERSE:
+                    if event == "start_map":
+                        idx += 1
+                        universe = None
+                        serials = []
+                    elif event == "end_map":
+                        universes[str(idx if universe is None else universe)] = serials
+                elif prefix == LH_DB_UNIVERSE_ID:
+                    universe = value
+                elif prefix == LH_DB_SERIAL:
+                    serials.append(value)
+        return universes
+
+    def load(self):
+        """
+        Parse the file if it changed since the last load, raise on missing or broken file
+        :return: True if the file has been parsed
+        """
+        stamp = self.getstamp()
+        with self.lock:
+            if stamp == self.stamp:
+                return False
+        universes = self.parse()
+        with self.lock:
+            self.stamp = stamp
+            self.universes = universes
+            self.parses += 1
+        logging.debug("LightHouse DB loaded " + str(len(universes)) + " universes")
+        return True
+
+    def getserials(self):
+        """
+        Return the Basestation serial numbers of the universe, the file is parsed only if changed
+        :return:
+        """
+        self.load()
+        with self.lock:
+            if self.universe:
+                return list(self.universes.get(self.universe, []))
+            for serials in self.universes.values():
+                return list(serials)
+            return []
+
+    def watch(self, _interval, _quitevent, _callback):
+        """
+        Check the file mtime and size every _interval seconds in a thread until _quitevent is set
+        _callback(serials) is called when the file changes and called again on the next check until it returns True
+        :param _interval:
+        :param _quitevent:
+        :param _callback:
+        """
+        if _interval <= 0 or self.watcher is not None:
+            return
+        self.watcher = threading.Thread(target=self.watchloop, args=(_interval, _quitevent, _callback), daemon=True)
+        self.watcher.start()
+
+    def watchloop(self, _interval, _quitevent, _callback):
+        with self.lock:
+            stamp = self.stamp
+        serials = []
+        pending = False
+        while not _quitevent.wait(_interval):
+            try:
+                if self.getstamp() != stamp:
+                    serials = self.getserials()
+                    with self.lock:
+                        stamp = self.stamp
+                    pending = True
+                if pending:
+                    pending = not _callback(serials)
+            except Exception as err:
+                logging.debug("LightHouse DB watch: " + str(err))
+
+
+class DiscoveryCache:
+
+    def __init__(self, _filename, _ttl):
+        """
+        Persistent cache of the discovery results keyed by serial number: MAC, version and GATT characteristics
+        :param _filename: JSON file
+        :param _ttl: seconds an entry is valid, 0 disables the cache
+        """
+        self.filename = _filename
+        self.ttl = _ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def load(self):
+        """
+        Load the cache file, a missing or broken file is an empty cache
+        """
+        try:
+            with open(self.filename) as json_file:
+                entries = json.load(json_file)
+            with self.lock:
+                self.entries = {str(k): v for k, v in entries.items()}
+            logging.debug("Discovery cache loaded " + str(len(self.entries)) + " entries")
+        except FileNotFoundError:
+            logging.debug("Discovery cache file not found: " + self.filename)
+        except Exception as err:
+            logging.info("Discovery cache file ignored: " + str(err))
+
+    def save(self):
+        """
+        Write the cache file atomically
+        """
+        try:
+            with self.lock:
+                data = json.dumps(self.entries, indent=2, sort_keys=True)
+            tmpfile = self.filename + ".tmp"
+            with open(tmpfile, "w") as json_file:
+                json_file.write(data)
+            os.replace(tmpfile, self.filename)
+        except Exception as err:
+            logging.error("Discovery cache save error: " + str(err))
+
+    def get(self, _serial):
+        """
+        Return the cache entry for the serial number, None if missing or expired
+        :param _serial:
+        :return:
+        """
+        with self.lock:
+            entry = self.entries.get(str(_serial))
+        if entry is None or self.ttl <= 0 or time.time() - entry.get("seen", 0) > self.ttl:
+            return None
+        return entry
+
+    def put(self, _bsthr):
+        """
+        Store the discovery results of a Basestation
+        :param _bsthr:
+        """
+        with self.lock:
+            self.entries[str(_bsthr.sn)] = {
+                "mac": _bsthr.mac,
+                "version": _bsthr.bs_version,
+                "model": _bsthr.bs_model,
+                "manufacturer": _bsthr.bs_manufacturer,
+                "soc": _bsthr.bs_soc,
+                "fw": _bsthr.bs_fw,
+                "fw2": _bsthr.bs_fw2,
+                "seen": time.time(),
+            }
+
+    def drop(self, _serial):
+        """
+        Remove the cache entry for the serial number
+        :param _serial:
+        """
+        with self.lock:
+            self.entries.pop(str(_serial), None)
+
+    def apply(self, _bsthr, _entry):
+        """
+        Pair the Basestation with the cached MAC and restore the GATT characteristics
+        :param _bsthr:
+        :param _entry:
+        """
+        _bsthr.bs_model = _entry.get("model", "")
+        _bsthr.bs_manufacturer = _entry.get("manufacturer", "")
+        _bsthr.bs_soc = _entry.get("soc", "")
+        _bsthr.bs_fw = _entry.get("fw", "")
+        _bsthr.bs_fw2 = _entry.get("fw2", "")
+        if _bsthr.bs_version_force > 0:
+            _bsthr.setpairing(_entry["mac"], _bsthr.bs_version_force)
+        else:
+            _bsthr.setpairing(_entry["mac"], int(_entry.get("version", 1)))
+
+
+StationOutcome = collections.namedtuple("StationOutcome", "label outcome latency")
+
+
+class BroadcastResult:
+
+    def __init__(self, _action, _outcomes, _latency):
+        """
+        Result of a broadcast to all the Basestations
+        :param _action:
+        :param _outcomes: list of StationOutcome
+        :param _latency: seconds until the last Basestation was done
+        """
+        self.action = _action
+        self.outcomes = _outcomes
+        self.latency = _latency
+
+    def isdone(self):
+        """
+        Return true if the action was sent to all the Basestations
+        :return:
+        """
+        return all(o.outcome == "Done" for o in self.outcomes)
+
+    def getdone(self):
+        """
+        Return the number of Basestations the action was sent to
+        :return:
+        """
+        return sum(1 for o in self.outcomes if o.outcome == "Done")
+
+    def getsummary(self):
+        """
+        Return string with the outcome of every Basestation
+        :return:
+        """
+        details = ", ".join(f"{o.label} {o.outcome} {o.latency * 1000:.0f} ms" for o in self.outcomes)
+        return f"{self.action} done on {self.getdone()}/{len(self.outcomes)} Basestations " \
+               f"in {self.latency:.2f} seconds" + (": " + details if details else "")
+
+
+async def broadcast_action(_stations, _action, _timeout):
+    """
+    Async function which sends the action to all the Basestations concurrently, runs on the BLE engine
+    Each Basestation outcome is Done, Timeout, Superseded by a later action, Not discovered, Not running
+    or the reason it was skipped
+    :param _stations:
+    :param _action:
+    :param _timeout:
+    :return: BroadcastResult
+    """
+    t_start = time.monotonic()
+
+    async def waitone(_bsthr, _waiter):
+        if isinstance(_waiter, str):
+            outcome = _waiter
+        else:
+            try:
+                outcome = await asyncio.wait_for(_waiter, _timeout)
+            except asyncio.TimeoutError:
+                outcome = "Timeout"
+        return StationOutcome(_bsthr.label, outcome, time.monotonic() - t_start)
+
+    waiters = []
+    for bsthr in _stations:
+        if len(bsthr.mac) < 1:
+            waiters.append("Not discovered")
+        elif not bsthr.is_alive():
+            waiters.append("Not running")
+        else:
+            waiters.append(bsthr.addwaiter(_action))
+        bsthr.setaction(_action)
+    outcomes = await asyncio.gather(*(waitone(b, w) for b, w in zip(_stations, waiters)))
+    return BroadcastResult(_action, list(outcomes), time.monotonic() - t_start)
+
+
+StationSnapshot = collections.namedtuple(
+    "StationSnapshot", "label tray status mode state next serial snhx mac connected version disconnects connection "
+                       "errors errclasses lasterr model manufacturer soc fw fw2")
+HeadsetSnapshot = collections.namedtuple("HeadsetSnapshot", "label tray status vendor product")
+RadioSnapshot = collections.namedtuple("RadioSnapshot", "slots wait")
+
+
+class StatusBus:
+
+    def __init__(self):
+        """
+        Status bus, the components publish immutable snapshots of their state and the consumers subscribe
+        Publishing a snapshot equal to the current one is a no-op, the subscribers run only on changes
+        Safe to use from any thread
+        """
+        self.lock = threading.Lock()
+        self.snapshots = collections.OrderedDict()
+        self.subscribers = []
+
+    def subscribe(self, _callback):
+        """
+        Register _callback(topic, snapshot), called from the publishing thread on every change
+        :param _callback:
+        """
+        with self.lock:
+            self.subscribers.append(_callback)
+
+    def unsubscribe(self, _callback):
+        """
+        Remove a subscriber
+        :param _callback:
+        """
+        with self.lock:
+            if _callback in self.subscribers:
+                self.subscribers.remove(_callback)
+
+    def publish(self, _topic, _snapshot):
+        """
+        Store the snapshot of _topic and notify the subscribers if it changed, None removes the topic
+        :param _topic:
+        :param _snapshot:
+        :return: True if the snapshot changed
+        """
+        with self.lock:
+            if self.snapshots.get(_topic) == _snapshot:
+                return False
+            if _snapshot is None:
+                del self.snapshots[_topic]
+            else:
+                self.snapshots[_topic] = _snapshot
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(_topic, _snapshot)
+            except Exception as err:
+                logging.error("Status bus subscriber exception: " + str(err))
+        return True
+
+    def get(self, _topic):
+        """
+        Return the current snapshot of _topic or None
+        :param _topic:
+        :return:
+        """
+        with self.lock:
+            return self.snapshots.get(_topic)
+
+    def getall(self):
+        """
+        Return the current snapshots in publishing order
+        :return:
+        """
+        with self.lock:
+            return list(self.snapshots.values())
+
+
+class StationRegistry:
+
+    def __init__(self, _maininst):
+        """
+        Registry of the Basestations keyed by serial number, grows to the stations listed in the Lighthouse DB
+        :param _maininst:
+        """
+        self.maininst = _maininst
+        self.lock = threading.Lock()
+        self.stations = collections.OrderedDict()
+        self.started = False
+
+    def __len__(self):
+        return len(self.stations)
+
+    def all(self):
+        """
+        Return a snapshot list of the Basestations, safe to iterate from any thread
+        :return:
+        """
+        with self.lock:
+            return list(self.stations.values())
+
+    def get(self, _serial):
+        """
+        Return the Basestation with serial number _serial or None
+        :param _serial:
+        :return:
+        """
+        with self.lock:
+            return self.stations.get(_serial)
+
+    def newlabel(self):
+        """
+        Return the first free label BS1, BS2, ...
+        :return:
+        """
+        labels = set(bsthr.label for bsthr in self.stations.values())
+        idx = 1
+        while self.maininst.bs_label + str(idx) in labels:
+            idx += 1
+        return self.maininst.bs_label + str(idx)
+
+    def add(self, _serial):
+        """
+        Return the Basestation with serial number _serial, create it if missing
+        The keepalive is started right away if the registry has been started already
+        :param _serial:
+        :return:
+        """
+        with self.lock:
+            bsthr = self.stations.get(_serial)
+            if bsthr is not None:
+                return bsthr
+            bsthr = BaseStations(self.newlabel(), self.maininst, self.maininst.bs_timeout_in_sec)
+            bsthr.setmode(self.maininst.mode)
+            bsthr.setlock(True)
+            self.stations[_serial] = bsthr
+        logging.debug("Registry added " + bsthr.label + " serial " + str(_serial))
+        if self.started:
+            bsthr.start()
+        return bsthr
+
+    def remove(self, _serial):
+        """
+        Stop and remove the Basestation with serial number _serial
+        Its pooled connection is dropped, Standby is sent first if the headset is off
+        :param _serial:
+        """
+        with self.lock:
+            bsthr = self.stations.pop(_serial, None)
+        if bsthr is not None:
+            logging.debug("Registry removed " + bsthr.label + " serial " + str(_serial))
+            hsthr = self.maininst.hsthr
+            bsthr.destroy(hsthr is not None and not hsthr.connected)
+            self.maininst.statusbus.publish(bsthr.label, None)
+
+    def sync(self, _serials):
+        """
+        Make the registry match the serial numbers list, return the Basestations in list order
+        :param _serials:
+        :return:
+        """
+        with self.lock:
+            removed = [sn for sn in self.stations if sn not in _serials]
+        for serial in removed:
+            self.remove(serial)
+        return [self.add(serial) for serial in _serials]
+
+    def startall(self):
+        """
+        Start the keepalive of all the Basestations, the ones added later start on add
+        """
+        self.started = True
+        for bsthr in self.all():
+            if not bsthr.is_alive():
+                bsthr.start()
+
+    def gettray(self):
+        """
+        Return string with all the Basestations for the system tray hover text
+        :return:
+        """
+        return " ".join(bsthr.gettray() for bsthr in self.all())
+
+
+class BleArbiter:
+
+    def __init__(self, _concurrency=1, _timeout=30, _bus=None):
+        """
+        Arbiter for the BLE radio, FIFO fair semaphore limiting the number of BLE operations in flight
+        Must be used from coroutines running on the BLE engine loop
+        :param _concurrency: number of BLE operations allowed at the same time
+        :param _timeout: default seconds to wait for a slot
+        :param _bus: status bus where the radio snapshot is published
+        """
+        self.bus = _bus
+        self.concurrency = max(1, int(_concurrency))
+        self.timeout = _timeout
+        self.active = 0
+        self.waiters = collections.deque()
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+    async def acquire(self, _timeout=None):
+        """
+        Wait for a free slot, waiters are served in arrival order
+        :param _timeout: seconds to wait, defaults to self.timeout
+        :raise asyncio.TimeoutError: no slot freed in time
+        """
+        if _timeout is None:
+            _timeout = self.timeout
+        t_start = time.monotonic()
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+        else:
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            # asyncio.wait, wait_for swallows the cancellation when the slot is handed over at the same time
+            try:
+                await asyncio.wait((waiter,), timeout=_timeout)
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # the slot was handed over while cancelling, pass it on
+                    self.release()
+                else:
+                    self.dropwaiter(waiter)
+                raise
+            if not waiter.done():
+                self.dropwaiter(waiter)
+                self.timeouts += 1
+                self.publish()
+                raise asyncio.TimeoutError()
+        self.setwait(time.monotonic() - t_start)
+        self.publish()
+
+    def dropwaiter(self, _waiter):
+        """
+        Cancel a waiter which gives up waiting and remove it from the queue
+        :param _waiter:
+        """
+        _waiter.cancel()
+        if _waiter in self.waiters:
+            self.waiters.remove(_waiter)
+
+    def release(self):
+        """
+        Release a slot, handing it over to the first waiter still waiting
+        """
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+        self.publish()
+
+    def publish(self):
+        """
+        Publish the radio snapshot in the status bus
+        """
+        if self.bus is not None:
+            self.bus.publish("radio", RadioSnapshot(self.getbusy(), self.getstats()))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, _timeout=None):
+        """
+        Async context manager holding one radio slot
+        :param _timeout:
+        """
+        await self.acquire(_timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, _coro, _timeout=None):
+        """
+        Await a coroutine while holding one radio slot
+        :param _coro:
+        :param _timeout:
+        :return:
+        """
+        try:
+            await self.acquire(_timeout)
+        except BaseException:
+            _coro.close()
+            raise
+        try:
+            return await _coro
+        finally:
+            self.release()
+
+    def setwait(self, _secs):
+        """
+        Update the wait time metrics
+        :param _secs:
+        """
+        self.acquired += 1
+        self.wait_last = _secs
+        self.wait_total += _secs
+        if _secs > self.wait_max:
+            self.wait_max = _secs
+
+    def getstats(self):
+        """
+        Return string with the wait time metrics
+        :return:
+        """
+        if self.acquired == 0:
+            return "no waits"
+        return f"{self.acquired} waits, avg {self.wait_total / self.acquired * 1000:.0f} ms, " \
+               f"max {self.wait_max * 1000:.0f} ms, timeouts {self.timeouts}"
+
+    def getbusy(self):
+        """
+        Return string with slots in use and queued waiters
+        :return:
+        """
+        return f"{self.active}/{self.concurrency} in use, {len(self.waiters)} queued"
+
+
+class KeepaliveScheduler:
+
+    def __init__(self, _loop, _stagger=0.5):
+        """
+        Central heap based scheduler holding the next keepalive deadline of every Basestation
+        A single coroutine on the BLE engine sleeps until the earliest deadline and wakes up the station
+        :param _loop: BLE engine loop
+        :param _stagger: minimum seconds between two deadlines, spreads the radio writes
+        """
+        self.loop = _loop
+        self.stagger = _stagger
+        self.lock = threading.Lock()
+        self.heap = []
+        self.deadlines = {}
+        self.callbacks = {}
+        self.seq = itertools.count()
+        self.wake = None  # asyncio.Event created on the BLE engine loop
+
+    def register(self, _key, _callback):
+        """
+        Register the callback run when the deadline of _key expires
+        :param _key:
+        :param _callback:
+        """
+        with self.lock:
+            self.callbacks[_key] = _callback
+
+    def unregister(self, _key):
+        """
+        Remove _key and its deadline
+        :param _key:
+        """
+        with self.lock:
+            self.callbacks.pop(_key, None)
+            self.deadlines.pop(_key, None)
+
+    def schedule(self, _key, _delay, _reason="Ping", _stagger=True, _spread=10, _period=None):
+        """
+        Set the next deadline of _key, safe to call from any thread
+        With _stagger the deadline is moved later, at most by _spread seconds, to keep the stagger spacing
+        from the other deadlines. The spacing is self.stagger, shrunk to _period / stations when more stations
+        than fit in one keepalive period are scheduled. When no slot is free before the _spread limit the
+        deadline goes in the middle of the widest gap, never on top of another deadline
+        :param _key:
+        :param _delay: seconds from now
+        :param _reason: action due at the deadline
+        :param _stagger:
+        :param _spread:
+        :param _period: keepalive period of the stations, None to always use self.stagger
+        :return: the deadline as time.monotonic() value
+        """
+        t_deadline = time.monotonic() + max(0, _delay)
+        with self.lock:
+            if _stagger and self.stagger > 0:
+                spacing = self.stagger
+                stations = len(self.deadlines) + (0 if _key in self.deadlines else 1)
+                if _period is not None and _period > 0:
+                    spacing = min(spacing, _period / stations)
+                t_start = t_deadline
+                t_limit = t_deadline + _spread
+                others = sorted(d for k, (d, r) in self.deadlines.items() if k != _key)
+                for t_other in others:
+                    if t_other - spacing < t_deadline < t_other + spacing:
+                        t_deadline = t_other + spacing
+                if t_deadline > t_limit:
+                    points = [t_start] + [d for d in others if t_start < d < t_limit] + [t_limit]
+                    t_prev, t_next = max(zip(points, points[1:]), key=lambda gap: gap[1] - gap[0])
+                    t_deadline = (t_prev + t_next) / 2
+            self.deadlines[_key] = (t_deadline, _reason)
+            heapq.heappush(self.heap, (t_deadline, next(self.seq), _key))
+        self.notify()
+        return t_deadline
+
+    def cancel(self, _key):
+        """
+        Remove the deadline of _key
+        :param _key:
+        """
+        with self.lock:
+            self.deadlines.pop(_key, None)
+
+    def due_in(self, _key):
+        """
+        Return the seconds until the deadline of _key, None if nothing is scheduled
+        :param _key:
+        :return:
+        """
+        with self.lock:
+            entry = self.deadlines.get(_key)
+        if entry is None:
+            return None
+        return entry[0] - time.monotonic()
+
+    def getschedule(self):
+        """
+        Return the schedule sorted by deadline as list of (key, reason, seconds from now)
+        :return:
+        """
+        t_now = time.monotonic()
+        with self.lock:
+            entries = sorted((d, k, r) for k, (d, r) in self.deadlines.items())
+        return [(k, r, d - t_now) for d, k, r in entries]
+
+    def getnext(self, _key):
+        """
+        Return string with next scheduled action of _key and its wall clock time for the dashboard
+        :param _key:
+        :return:
+        """
+        with self.lock:
+            entry = self.deadlines.get(_key)
+        if entry is None:
+            return "N/A"
+        t_remaining = entry[0] - time.monotonic()
+        if t_remaining <= 0:
+            return f"{entry[1]} due"
+        return f"{entry[1]} at {datetime.fromtimestamp(time.time() + t_remaining).strftime('%H:%M:%S')}"
+
+    def notify(self):
+        """
+        Wake up the scheduler coroutine, safe to call from any thread
+        """
+        if self.wake is not None:
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    def popdue(self):
+        """
+        Pop the expired deadlines from the heap, stale entries are dropped
+        :return: list of callbacks to run and seconds until the next deadline or None
+        """
+        t_now = time.monotonic()
+        due = []
+        with self.lock:
+            while self.heap:
+                t_deadline, seq, key = self.heap[0]
+                entry = self.deadlines.get(key)
+                if entry is None or entry[0] != t_deadline:
+                    heapq.heappop(self.heap)
+                    continue
+                if t_deadline > t_now:
+                    return due, t_deadline - t_now
+                heapq.heappop(self.heap)
+                if key in self.callbacks:
+                    due.append(self.callbacks[key])
+        return due, None
+
+    async def run(self):
+        """
+        Scheduler coroutine, sleeps until the earliest deadline or a schedule change
+        """
+        self.wake = asyncio.Event()
+        while True:
+            self.wake.clear()
+            due, timeout = self.popdue()
+            for callback in due:
+                try:
+                    callback()
+                except Exception as err:
+                    logging.error("Keepalive scheduler callback exception: " + str(err))
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class BleConnectionPool:
+
+    def __init__(self, _engine, _backoff_base=3, _backoff_max=60, _health_ttl=5):
+        """
+        Pool of BLE clients keyed by MAC, the connections are kept open across commands
+        Must be used from coroutines running on the BLE engine loop
+        :param _engine: BLE engine creating the clients
+        :param _backoff_base: seconds to wait after the first connection failure
+        :param _backoff_max: maximum seconds to wait between reconnections
+        :param _health_ttl: seconds a successful operation counts as health check
+        """
+        self.engine = _engine
+        self.backoff_base = _backoff_base
+        self.backoff_max = _backoff_max
+        self.health_ttl = _health_ttl
+        self.clients = {}
+        self.locks = {}
+        self.checked = {}
+        self.failures = {}
+        self.connects = {}
+        self.reuses = {}
+
+    async def get(self, _mac, _timeout=10, _arbiter=None):
+        """
+        Return a connected client for _mac, reuse the pooled one if healthy
+        A client failing the handshake is disconnected before being dropped, no half-open connection is left
+        :param _mac:
+        :param _timeout: seconds for the connection handshake
+        :param _arbiter: BLE arbiter slot taken for the handshake, None if the caller holds a slot already
+        :return:
+        """
+        lock = self.locks.get(_mac)
+        if lock is None:
+            lock = self.locks[_mac] = asyncio.Lock()
+        async with lock:
+            if _mac in self.clients:
+                if await self.ishealthy(_mac):
+                    self.reuses[_mac] = self.reuses.get(_mac, 0) + 1
+                    return self.clients[_mac]
+                await self.discard(_mac)
+            if _arbiter is not None:
+                async with _arbiter.slot():
+                    client = await self.connect(_mac, _timeout)
+            else:
+                client = await self.connect(_mac, _timeout)
+            self.clients[_mac] = client
+            self.checked[_mac] = time.monotonic()
+            return client
+
+    async def connect(self, _mac, _timeout):
+        """
+        Return a new client connected to _mac, disconnect it if the handshake fails
+        :param _mac:
+        :param _timeout:
+        :return:
+        """
+        client = self.engine.newclient(_mac)
+        self.connects[_mac] = self.connects.get(_mac, 0) + 1
+        try:
+            await client.connect(timeout=_timeout)
+            if not await client.is_connected():
+                raise Exception("not connected after handshake")
+        except BaseException:
+            try:
+                await client.disconnect()
+            except Exception as err:
+                logging.debug("BLE pool disconnect " + _mac + " after failed connect exception: " + str(err))
+            raise
+        return client
+
+    async def ishealthy(self, _mac, _force=False):
+        """
+        Return true if the pooled client for _mac is connected
+        The BLE stack is only queried when the last successful operation is older than self.health_ttl
+        :param _mac:
+        :param _force: always query the BLE stack
+        :return:
+        """
+        client = self.clients.get(_mac)
+        if client is None:
+            return False
+        if not _force and time.monotonic() - self.checked.get(_mac, 0) < self.health_ttl:
+            return True
+        try:
+            healthy = await client.is_connected()
+        except Exception:
+            healthy = False
+        if healthy:
+            self.checked[_mac] = time.monotonic()
+        return healthy
+
+    def markok(self, _mac):
+        """
+        Record a successful operation on _mac, resets the backoff
+        :param _mac:
+        """
+        self.failures[_mac] = 0
+        self.checked[_mac] = time.monotonic()
+
+    def backoff(self, _mac):
+        """
+        Record a connection failure on _mac and return the seconds to wait before reconnecting
+        Exponential backoff with jitter to avoid reconnection storms
+        :param _mac:
+        :return:
+        """
+        failures = self.failures.get(_mac, 0) + 1
+        self.failures[_mac] = failures
+        delay = min(self.backoff_max, self.backoff_base * 2 ** min(failures - 1, 16))
+        return random.uniform(delay / 2, delay)
+
+    async def discard(self, _mac):
+        """
+        Drop the pooled client for _mac and disconnect it
+        :param _mac:
+        """
+        client = self.clients.pop(_mac, None)
+        self.checked.pop(_mac, None)
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception as err:
+                logging.debug("BLE pool disconnect " + _mac + " exception: " + str(err))
+
+    async def closeall(self):
+        """
+        Disconnect all the pooled clients
+        """
+        for mac in list(self.clients):
+            await self.discard(mac)
+
+    def getstats(self, _mac):
+        """
+        Return string with the connection statistics of _mac
+        :param _mac:
+        :return:
+        """
+        return f"{self.connects.get(_mac, 0)} connects, {self.reuses.get(_mac, 0)} reuses, " \
+               f"{self.failures.get(_mac, 0)} failures"
+
+
+class BleakBackend:
+
+    name = "bleak"
+
+    def __init__(self):
+        """
+        BLE backend of the engine, the simulated one in bsaw_sim has the same attributes:
+        client_factory(mac, loop=) returning a BleakClient like object
+        and scanner_factory(detection_callback=) a BleakScanner like class
+        """
+        from bleak import BleakClient
+        from bleak import BleakScanner
+        self.client_factory = BleakClient
+        self.scanner_factory = BleakScanner
+
+
+class BleEngine(threading.Thread):
+
+    def __init__(self, _maininst, autostart=False):
+        """
+        Single BLE engine: one asyncio event loop in one thread shared by every Basestation keepalive,
+        the discovery scans and the GATT reads
+        :param _maininst:
+        :param autostart:
+        """
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.start_orig = self.start
+        self.start = self.start_local
+        self.lock = threading.Lock()
+        self.lock.acquire()  # lock until the loop is running
+        self.maininst = _maininst
+        self.label = "BLE engine"
+        self.backend = _maininst.ble_backend or BleakBackend()
+        self.client_factory = self.backend.client_factory
+        self.scanner_factory = self.backend.scanner_factory
+        self.arbiter = BleArbiter(_maininst.ble_concurrency, _maininst.ble_lock_timeout, _maininst.statusbus)
+        self.tasks = []
+
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_debug(_maininst.debug_logs)
+        self.scheduler = KeepaliveScheduler(self.loop)
+        self.pool = BleConnectionPool(self)
 
-        self.blelock = False
-        self.discovery = None
-        self.disco = True
-        self.mode = "Auto"
+        if autostart:
+            self.start()  # automatically start thread on init
 
-        self.panelupdate = "Initializing"
-        self.panelstatus = [(0, ("Dashboard", "Status", self.panelupdate)), (1, ("", "", ""))]
-        self.paneldata = [[str(k)] + list(v) for k, v in self.panelstatus]
+    def run(self):
+        """
+        Run function called by self.start_orig() will run the event loop forever, the lock is released
+        as soon as the loop is processing callbacks
+        """
+        asyncio.set_event_loop(self.loop)
+        self.tasks.append(self.loop.create_task(self.scheduler.run()))
+        self.loop.call_soon(self.lock.release)
+        self.loop.run_forever()
+        logging.debug(self.label + " loop stopped")
 
-    def set_threads(self, _systray, _hsthr, _bs1thr, _bs2thr, _logthr):
+    def submit(self, _coro):
         """
-        Set infi.systray, headset thread and basestations threads in main instance
-        :type _logthr: object
-        :param _bs2thr:
-        :param _bs1thr:
-        :param _hsthr:
-        :type _systray: object
+        Schedule a coroutine on the engine loop from any thread
+        :param _coro:
+        :return: concurrent.futures.Future
         """
-        self.systray = _systray
-        self.hsthr = _hsthr
-        self.bs1thr = _bs1thr
-        self.bs2thr = _bs2thr
-        self.logthr = _logthr
+        future = asyncio.run_coroutine_threadsafe(_coro, self.loop)
+        self.tasks.append(future)
+        self.tasks = [t for t in self.tasks if not t.done()]
+        return future
 
-    def settoaster(self, _toaster):
+    def run_sync(self, _coro, _timeout=None):
         """
-        Set toaster object in main instance
-        :type _toaster: object
+        Run a coroutine on the engine loop and block the calling thread until it's done
+        Must not be called from the engine thread itself
+        :param _coro:
+        :param _timeout:
+        :return:
         """
-        self.toaster = _toaster
+        return self.submit(_coro).result(_timeout)
 
-    def get_quit_main(self):
+    def offload(self, _func, *args):
         """
-        Return quit main value from main instance
+        Run a blocking function (e.g. a toast notification) outside of the engine loop
+        :param _func:
         :return:
         """
-        return self.quit_main
+        return self.loop.run_in_executor(None, _func, *args)
 
-    def get_dashboard_except(self):
-        self.panelstatus = [(0, ("Dashboard", "Status", self.panelupdate)), (1, ("", "", ""))]
-        self.paneldata = [[str(k)] + list(v) for k, v in self.panelstatus]
-        return self.paneldata
+    def newclient(self, _mac):
+        """
+        Return a new BLE client bound to the engine loop
+        :param _mac:
+        :return:
+        """
+        return self.client_factory(_mac, loop=self.loop)
 
-    def toast_err(self, _msg):
+    async def shutdown(self):
         """
-        Function to display the error message as a Windows 10 toast notification
-        :param _msg:
+        Async function which cancels the tasks running on the engine loop, waits for them to finish
+        and then closes the pooled connections
         """
-        self.toaster.show_toast("PIMAX_BSAW",
-                           _msg,
-                           icon_path=maininst.tray_icon,
-                           duration=5,
-                           threaded=True)
-        while self.toaster.notification_active(): time.sleep(0.1)
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.pool.closeall()
 
-    def load_configuration(self, _toaster):
+    def stop(self, _timeout=5):
         """
-        Load configuration file
-        :param _toaster:
+        Cancel the pending tasks, close the pooled connections and stop the engine loop
+        :param _timeout: seconds to wait for the tasks to finish and the connections to close
         """
         try:
-            config = configparser.ConfigParser()
-            config.read('configuration.ini')
-            logging.debug("Configuration file Headset USB ID: " + config['HeadSet']['USB_VENDOR_ID'])
-            self.pimax_usb_vendor_id = int(config['HeadSet']['USB_VENDOR_ID'], 0)
-            conf_bs_timeout_in_sec = int(config['BaseStation']['BS_TIMEOUT_IN_SEC'], 0)
-            if 30 <= conf_bs_timeout_in_sec <= 120:
-                self.bs_timeout_in_sec = conf_bs_timeout_in_sec
-                logging.debug("Configuration file BS timeout: " + config['BaseStation']['bs_timeout_in_sec'])
-            self.lh_db_file = config['HeadSet']['LH_DB_FILE']
-            logging.debug("Configuration file LightHouse DB filepath: " + self.lh_db_file)
+            self.run_sync(self.shutdown(), _timeout)
         except Exception as err:
-            if not self.quit_main:
-                self.toast_err("Load configuration file exception: " + str(err))
-                self.quit_main = True
+            logging.debug(self.label + " shutdown exception: " + str(err))
+            for task in self.tasks:
+                task.cancel()
+        self.tasks = []
+        self.loop.call_soon_threadsafe(self.loop.stop)
 
-    def setstandby(self):
+    def start_local(self):
         """
-        Send standby command to both Basestations
+        Start the thread with original run and acquire the lock
         """
-        logging.info("Sending Standby to Basestations")
-        self.bs1thr.setaction("Standby")
-        self.bs2thr.setaction("Standby")
+        self.start_orig()
+        self.lock.acquire()
+
+
+BleCommand = collections.namedtuple("BleCommand", "action frame hex")
 
-    def setwakeup(self):
+
+class ErrorCounter:
+
+    def __init__(self, _windows=(60, 180, 3600)):
         """
-        Send wakeup command to both Basestations
+        Sliding window error counter, one deque of monotonic timestamps and counts per class for each window
+        Every error is appended and expired once per window, constant cost per error
+        :param _windows: window lengths in seconds
         """
-        logging.info("Sending Wakeup to Basestations")
-        self.bs1thr.setaction("Wakeup")
-        self.bs2thr.setaction("Wakeup")
+        self.windows = tuple(sorted(_windows))
+        self.events = dict((window, collections.deque()) for window in self.windows)
+        self.counts = dict((window, {}) for window in self.windows)
+        self.lock = threading.Lock()
+        self.total = 0
+        self.last = None
+        self.lastwall = None
+
+    def expire(self, _t_now):
+        """
+        Drop the errors older than each window, must be called with the lock held
+        :param _t_now:
+        """
+        for window in self.windows:
+            events = self.events[window]
+            counts = self.counts[window]
+            t_limit = _t_now - window
+            while events and events[0][0] <= t_limit:
+                t_event, errclass = events.popleft()
+                counts[errclass] -= 1
+                if counts[errclass] == 0:
+                    del counts[errclass]
+
+    def add(self, _class="error"):
+        """
+        Record an error of class _class
+        :param _class:
+        """
+        t_now = time.monotonic()
+        with self.lock:
+            self.expire(t_now)
+            for window in self.windows:
+                self.events[window].append((t_now, _class))
+                self.counts[window][_class] = self.counts[window].get(_class, 0) + 1
+            self.total += 1
+            self.last = t_now
+            self.lastwall = time.time()
+
+    def count(self, _window, _class=None):
+        """
+        Return the errors in the last _window seconds, only of class _class if not None
+        :param _window: one of self.windows
+        :param _class:
+        :return:
+        """
+        with self.lock:
+            self.expire(time.monotonic())
+            if _class is None:
+                return len(self.events[_window])
+            return self.counts[_window].get(_class, 0)
 
-    def setmode(self):
+    def getclasses(self, _window):
+        """
+        Return dict error class -> errors in the last _window seconds
+        :param _window:
+        :return:
         """
-        Send wakeup command to both Basestations
+        with self.lock:
+            self.expire(time.monotonic())
+            return dict(self.counts[_window])
+
+    def getsummary(self):
         """
-        if self.mode == "Auto":
-            _mode = "Idle"
-        else:
-            _mode = "Auto"
-        self.mode = _mode
-        logging.info("Set BS mode to " + str(_mode))
-        self.bs1thr.setmode(_mode)
-        self.bs2thr.setmode(_mode)
-        self.mode = _mode
+        Return string with the errors in each window, e.g. "2 in 1m, 5 in 3m, 9 in 1h"
+        :return:
+        """
+        with self.lock:
+            self.expire(time.monotonic())
+            counts = [(window, len(self.events[window])) for window in self.windows]
+        return ", ".join(f"{count} in {self.getlabel(window)}" for window, count in counts)
+
+    def getclasssummary(self):
+        """
+        Return string with the errors of each class in the longest window, empty if none
+        :return:
+        """
+        window = self.windows[-1]
+        classes = self.getclasses(window)
+        if not classes:
+            return ""
+        return ", ".join(f"{errclass} {count}" for errclass, count in sorted(classes.items())) + \
+            " in " + self.getlabel(window)
+
+    @staticmethod
+    def getlabel(_window):
+        """
+        Return the short label of a window length, e.g. 1m or 1h
+        :param _window:
+        :return:
+        """
+        if _window % 3600 == 0:
+            return f"{_window // 3600}h"
+        if _window % 60 == 0:
+            return f"{_window // 60}m"
+        return f"{_window}s"
 
 
-class BaseStations(threading.Thread):
+class BaseStations:
 
     def __init__(self, label, _maininst, _bs_timeout_in_sec, autostart=False):
         """
-        Init function will initialize the thread with default values and store reference to the main instance
+        Init function will initialize the Basestation with default values and store reference to the main instance
+        The keepalive runs as a coroutine task on the shared BLE engine
         :param label:
         :param _maininst:
         :param _bs_timeout_in_sec:
         :param autostart:
         """
-        threading.Thread.__init__(self)
-        self.setDaemon(True)
-        self.start_orig = self.start
-        self.start = self.start_local
-        self.lock = threading.Lock()
-        self.lock.acquire()  # lock until variables are set
         self.maininst = _maininst
         self.label = label
         self.bs_cmd_verify = False
@@ -213,9 +1704,9 @@ class BaseStations(threading.Thread):
         self.bs_cmd_id_wakeup_timeout = 0x1202
         self.bs_default_id = 0xffffffff
         self.bs_timeout_in_sec = _bs_timeout_in_sec
+        self.bs_timeout_margin = 5
         self.bs_loop_sleep = 25
         self.bs_loop_retry = 3
-        self.bs_loop_retry_disconnect = 7
         self.bs_disconnects = 0
         self.bs_version = 1
         self.bs_version_force = 0
@@ -238,178 +1729,287 @@ class BaseStations(threading.Thread):
         self.connected = False
         self.paired = False
         self.standby = False
-        self.errque = []
         self.toomanysecs = 180
         self.toomanycnt = 20
+        self.errors = ErrorCounter((60, self.toomanysecs, 3600))
+        self.toomanywarned = None
         self.client = None
         self.test = 0
         self.test2 = 0
         self.mode = "Auto"
-
-        self.loop = asyncio.new_event_loop()
-        self.loop.set_debug(maininst.debug_logs)
+        self.task = None
+        self.looptask = None
 
         self.t_wait_loop = 1
         self.t_last_cmd = time.time()
         self.action = "Wakeup"
         self.state = 0
+        self.fsm_state = "Init"
+        self.wake = None  # asyncio.Event created on the BLE engine loop
+        self.waiters = []
+        self.cmdtable = {}
+        self.buildcmdtable()
 
         if autostart:
             self.start()  # automatically start thread on init
 
-    def run(self):
+    def start(self):
         """
-        Run function called by self.start_orig() will release the lock, run the async function
-        :rtype: object
+        Schedule the keepalive coroutine on the shared BLE engine and register it in the keepalive scheduler
         """
-        self.lock.release()
-        self.loop.run_until_complete(self.connect_bs(self.loop))
+        self.maininst.bleengine.scheduler.register(self.label, self.notify)
+        self.task = self.maininst.bleengine.submit(self.connect_bs())
 
-    async def connect_bs(self, _loop):
+    def is_alive(self):
+        """
+        Return true while the keepalive task is running
+        :return:
+        """
+        return self.task is not None and not self.task.done()
+
+    async def connect_bs(self):
         """
         Async function what will loop connection to the BS
-        :param _loop:
         """
+        self.wake = asyncio.Event()
+        self.looptask = asyncio.current_task()
+        try:
+            await self.bs_loop()
+        finally:
+            self.resolvewaiters(None, "Skipped: " + self.fsm_state)
+
+    async def bs_loop(self):
+        """
+        Async function with the BS connection loop, the BLE connection is kept open in the connection pool
+        """
+        pool = self.maininst.bleengine.pool
 
         while True:
 
-            self.state = self.bs_pre_loop()
+            self.state = await self.bs_wait_ready()
 
             prevact = self.action
             nextact = self.action
 
             if self.state == 9:
+                if self.connected:
+                    logging.debug("%s disconnecting", self.label)
+                    await pool.discard(self.mac)
+                    self.connected = False
+                    self.publish()
                 break
-            elif self.state == 1:
-                continue
 
             try:
-                # not implemented yet
-                # def disconnect_bs_cb(_client):
-                #    logging.debug(self.label + " disconnected MAC={}".format(_client.address))
-                #    self.connected = False
-                async with BleakClient(self.mac, loop=_loop) as self.client:
-                    # not implemented yet
-                    # client.set_disconnected_callback(disconnect_bs_cb)
-                    await self.client.connect(timeout=10)
-                    if await self.client.is_connected():
-                        logging.debug(self.label + " connected")
-                        self.connected = True
-
-                        while await self.client.is_connected():
-
-                            self.state = self.bs_pre_loop()
-
-                            self.t_wait_loop = self.bs_loop_sleep
-
-                            if self.state == 9:
-                                logging.debug(self.label + " disconnecting")
-                                await self.client.disconnect()
-                                break
-                            elif self.state == 1:
-                                continue
+                self.client = await pool.get(self.mac, _arbiter=self.maininst.bleengine.arbiter)
+            except Exception as err:
+                self.bs_proc_err(False, prevact, nextact, "connect", "error initiating BLE connection: %s", err)
+                continue
+            if not self.connected:
+                logging.debug("%s connected", self.label)
+                self.connected = True
 
-                            cmd, prevact, nextact = self.bs_pre_action()
+            self.t_wait_loop = self.bs_loop_sleep
 
-                            self.purgeerrque()
+            cmd, prevact, nextact = self.bs_pre_action()
 
-                            try:
-                                if len(cmd) < 1:
-                                    logging.debug(self.label + " skipping cmd for action=" + prevact + " next=" + nextact)
-                                    self.setstatus(prevact)
-                                else:
-                                    logging.debug(self.label + " sending cmd for action=" + prevact + " next=" + nextact)
-                                    while maininst.blelock:
-                                        time.sleep(0.2)
-                                    maininst.blelock = True
-                                    if self.is_version() == 2:
-                                        await self.client.write_gatt_char(self.bs_cmd_ble_id, cmd, self.bs_cmd_verify)
-                                    else:
-                                        await self.client.write_gatt_char(self.bs_cmd_ble_id, cmd, self.bs_cmd_verify)
-                                    maininst.blelock = False
-                                    if self.is_standby() and prevact == "Standby":
-                                        logging.info(self.label + " set Standby done, status Off")
-                                        self.standby = False
-                                        self.setstatus("Off")
-                                    elif self.wakeup_cmd:
-                                        logging.debug(self.label + " set Wakeup flag to False")
-                                        self.wakeup_cmd = False
-                                        self.setstatus(prevact)
-                                    else:
-                                        self.setstatus(prevact)
-                                self.action = nextact
-                                self.t_last_cmd = time.time()
-                            except Exception as err:
-                                connected = await self.client.is_connected()
-                                maininst.blelock = False
-                                errmsg = self.label + " action: " + self.action + " exception triggered:" + str(err)
-                                self.bs_proc_err(connected, prevact, nextact, errmsg)
-                                continue
+            try:
+                if len(cmd) < 1:
+                    logging.debug("%s skipping cmd for action=%s next=%s", self.label, prevact, nextact)
+                    self.setstatus(prevact)
+                else:
+                    logging.debug("%s sending cmd for action=%s next=%s", self.label, prevact, nextact)
+                    async with self.maininst.bleengine.arbiter.slot():
+                        if self.is_version() == 2:
+                            await self.client.write_gatt_char(self.bs_cmd_ble_id, cmd, self.bs_cmd_verify)
+                        else:
+                            await self.client.write_gatt_char(self.bs_cmd_ble_id, cmd, self.bs_cmd_verify)
+                    pool.markok(self.mac)
+                    self.resolvewaiters(prevact, "Done")
+                    if prevact == "Wakeup" and self.maininst.startup.mark("first_wakeup"):
+                        self.maininst.bleengine.offload(self.maininst.startup.save, self.maininst.startup_file)
+                    if self.is_standby() and prevact == "Standby":
+                        logging.info("%s set Standby done, status Off", self.label)
+                        self.standby = False
+                        self.setstatus("Off")
+                    elif self.wakeup_cmd:
+                        logging.debug("%s set Wakeup flag to False", self.label)
+                        self.wakeup_cmd = False
+                        self.setstatus(prevact)
                     else:
-                        errmsg = self.label + " while " + self.action + " got disconnected: " + str(
-                        self.bs_disconnects)
-                        self.bs_proc_err(False, prevact, nextact, errmsg)
-                        continue
+                        self.setstatus(prevact)
+                self.action = nextact
+                self.t_last_cmd = time.time()
+                self.setdeadline(self.bs_ping_period(), nextact)
             except Exception as err:
-                errmsg = self.label + " error initiating BLE connection: " + str(err)
-                self.bs_proc_err(False, prevact, nextact, errmsg)
+                connected = await pool.ishealthy(self.mac, True)
+                if not connected:
+                    await pool.discard(self.mac)
+                errclass = "write"
+                if isinstance(err, asyncio.TimeoutError):
+                    err = "timeout waiting for the BLE radio, " + self.maininst.bleengine.arbiter.getbusy()
+                    errclass = "radio"
+                self.bs_proc_err(connected, prevact, nextact, errclass, "action: %s exception triggered:%s",
+                                 self.action, err)
                 continue
 
-    def bs_proc_err(self, _connected, _prev, _next, _errmsg):
+    def bs_proc_err(self, _connected, _prev, _next, _errclass, _errmsg, *_args):
+        """
+        Count the error and schedule the retry
+        :param _connected:
+        :param _prev:
+        :param _next:
+        :param _errclass: connect, write or radio
+        :param _errmsg: debug log message, formatted lazily with _args
+        :param _args:
+        """
         self.t_last_cmd = time.time()
         self.t_wait_loop = self.bs_loop_retry
         self.action = _prev
+        logging.debug("%s " + _errmsg, self.label, *_args)
+        self.logmanyerrors(_errclass)
         self.setstatus(_prev + "-error")
-        logging.debug(_errmsg)
-        self.logmanyerrors()
         if not _connected:
             self.connected = False
-            self.t_wait_loop = self.bs_loop_retry_disconnect
+            self.t_wait_loop = self.maininst.bleengine.pool.backoff(self.mac)
             self.bs_disconnects += 1
+        self.setdeadline(self.t_wait_loop, _prev, False)
 
-    def bs_pre_loop(self):
+    def addwaiter(self, _action):
         """
-        bs_connect pre loop
+        Return a future resolved when _action has been sent, must be called on the BLE engine loop
+        :param _action:
         :return:
         """
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters = [w for w in self.waiters if not w[1].done()]
+        self.waiters.append((_action, waiter))
+        return waiter
 
-        if len(self.mac) < 1:
-            logging.debug(self.label + " not found, skipping keepalive")
-            time.sleep(2)
-            return 1
+    def resolvewaiters(self, _action, _outcome):
+        """
+        Resolve the futures waiting for _action, all of them if _action is None
+        :param _action: action sent, the -error suffix of retries is ignored
+        :param _outcome:
+        """
+        if _action is not None and _action[-6:] == "-error":
+            _action = _action[:-6]
+        pending = []
+        for action, waiter in self.waiters:
+            if waiter.done():
+                continue
+            if _action is None or action == _action:
+                waiter.set_result(_outcome)
+            else:
+                pending.append((action, waiter))
+        self.waiters = pending
+
+    def supersede(self, _action):
+        """
+        Resolve the futures waiting for an action other than _action, replaced before it was sent
+        :param _action:
+        """
+        pending = []
+        for action, waiter in self.waiters:
+            if waiter.done():
+                continue
+            if action != _action:
+                waiter.set_result("Superseded")
+            else:
+                pending.append((action, waiter))
+        self.waiters = pending
+
+    def bs_ping_period(self):
+        """
+        Return the seconds between two keepalives, well within the BS timeout
+        :return:
+        """
+        return min(self.bs_loop_sleep, self.bs_timeout_in_sec / 2)
+
+    def setdeadline(self, _delay, _reason, _stagger=True):
+        """
+        Set the next keepalive deadline in the central scheduler, staggered with the other stations
+        :param _delay:
+        :param _reason:
+        :param _stagger:
+        """
+        _spread = self.bs_timeout_in_sec - self.bs_timeout_margin - self.bs_ping_period()
+        self.maininst.bleengine.scheduler.schedule(self.label, _delay, _reason or "Idle", _stagger, _spread,
+                                                   self.bs_ping_period())
+        self.publish()
+
+    def getdeadline(self):
+        """
+        Return the seconds until the next keepalive deadline, None if nothing is scheduled
+        :return:
+        """
+        if self.maininst.bleengine is None:
+            return None
+        return self.maininst.bleengine.scheduler.due_in(self.label)
+
+    def bs_next_state(self):
+        """
+        Evaluate the state machine, return the state and the seconds to wait before evaluating again
+        The timeout is None when only an event can change the state, the keepalive scheduler
+        wakes up the station when its deadline expires
+        :return:
+        """
+        t_remaining = self.getdeadline()
         if self.is_standby() and self.is_connected():
-            logging.debug(self.label + " go to action, standby requested")
-            self.action = "Standby"
-            time.sleep(1)
-            return 0
-        if maininst.get_quit_main():
-            logging.debug(self.label + " thread exiting due to quit main, connected=" + str(self.is_connected()))
-            return 9
-        if maininst.disco:
-            logging.debug(self.label + " skipping action due to running discovery")
-            time.sleep(2)
-            return 1
+            if self.status[-6:] == "-error" and t_remaining is not None and t_remaining > 0:
+                return "Waiting", None
+            return "Standby", 0
+        if self.maininst.get_quit_main():
+            return "Quit", 0
+        if len(self.mac) < 1:
+            return "NoMac", None
+        if self.maininst.disco:
+            return "Discovery", None
         if self.tlock:
-            logging.debug(self.label + " skipping action due to thread lock")
-            time.sleep(2)
-            return 1
-        if not maininst.hsthr.connected:
-            logging.debug(self.label + " skipping action due to HS Off status")
-            time.sleep(2)
-            return 1
+            return "Locked", None
+        if not self.maininst.hsthr.connected:
+            return "HSOff", None
         if self.action == "":
-            logging.debug(self.label + " skipping action due to empty action")
-            time.sleep(2)
-            return 1
-        if time.time() - self.t_last_cmd <= self.t_wait_loop:
-            #logging.debug(self.label + " skipping action due to timer")
-            time.sleep(1)
-            return 1
-        return 0
+            return "NoAction", None
+        if t_remaining is not None and t_remaining > 0:
+            return "Waiting", None
+        return "Ready", 0
+
+    async def bs_wait_ready(self):
+        """
+        bs_connect state machine, sleeps until an event (headset changed, action requested,
+        discovery finished, lock released, quit) or the scheduler deadline moves it to a runnable state
+        :return: 0 to run the action, 9 to exit
+        """
+        while True:
+            self.wake.clear()
+            state, timeout = self.bs_next_state()
+            if state != self.fsm_state:
+                logging.debug("%s state %s -> %s", self.label, self.fsm_state, state)
+                self.fsm_state = state
+                self.publish()
+            if state == "Quit":
+                logging.debug("%s thread exiting due to quit main, connected=%s", self.label, self.is_connected())
+                return 9
+            if state == "Standby":
+                self.action = "Standby"
+                return 0
+            if state == "Ready":
+                return 0
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self):
+        """
+        Wake up the state machine, safe to call from any thread
+        """
+        if self.wake is not None and self.maininst.bleengine is not None:
+            self.maininst.bleengine.loop.call_soon_threadsafe(self.wake.set)
 
     def bs_pre_action(self):
 
-        logging.debug(self.label + " build cmd for action=" + self.action)
+        logging.debug("%s build cmd for action=%s", self.label, self.action)
 
         _prev = self.action
         _next = ""
@@ -429,7 +2029,7 @@ class BaseStations(threading.Thread):
         elif self.wakeup_cmd:
             _exec = "Wakeup"
         elif self.ping_cmd:
-            if not self.wakeup_cmd and (time.time() - self.t_last_cmd > self.bs_timeout_in_sec - 5
+            if not self.wakeup_cmd and (time.time() - self.t_last_cmd > self.bs_timeout_in_sec - self.bs_timeout_margin
                                           and not self.ping_cmd):
                 _exec = "Wakeup"
             elif self.ping_cmd:
@@ -441,16 +2041,31 @@ class BaseStations(threading.Thread):
         if len(_exec) < 1:
             return "", _prev, _next
         else:
-            logging.debug(
-                self.label + " prebuild_cmd=" + _exec)
-            cmd = self.build_bs_ble_cmd(_exec)
-            logging.debug(
-                self.label + " MAC=" + self.mac + " BLE CMD : " + str(binascii.hexlify(cmd)) +
-                " UUID: " + self.bs_cmd_ble_id)
-            return cmd, _prev, _next
+            command = self.cmdtable.get(_exec)
+            if command is None:
+                command = self.buildcmd(_exec)
+            logging.debug("%s %s MAC=%s BLE CMD : %s UUID: %s",
+                          self.label, _exec, self.mac, command.hex, self.bs_cmd_ble_id)
+            return command.frame, _prev, _next
 
     def build_bs_ble_cmd(self, action):
-        return self.build_2_bs_ble_cmd(action)
+        return self.buildcmd(action).frame
+
+    def buildcmd(self, _action):
+        """
+        Return the BleCommand for _action, the frame is immutable bytes
+        :param _action:
+        :return:
+        """
+        frame = bytes(self.build_2_bs_ble_cmd(_action))
+        return BleCommand(_action, frame, str(binascii.hexlify(frame)))
+
+    def buildcmdtable(self):
+        """
+        Build the commands sent by the keepalive loop, must be called again when the serial number,
+        the version or the timeout change
+        """
+        self.cmdtable = dict((action, self.buildcmd(action)) for action in ("Wakeup", "Ping", "Standby"))
 
     def build_2_bs_ble_cmd(self, action):
         """
@@ -467,8 +2082,6 @@ class BaseStations(threading.Thread):
                 cmd_id = self.bs_cmd_id_sleep_v2
             ba = bytearray()
             ba += cmd_id.to_bytes(1, byteorder='big')
-            logging.debug(
-                self.label + " build2 action:" + action + " MAC=" + self.mac + " BLE CMD : " + str(binascii.hexlify(ba)))
             return ba
         else:
             cmd_id = self.bs_cmd_id_wakeup_default_timeout
@@ -485,39 +2098,31 @@ class BaseStations(threading.Thread):
             ba += cmd_timeout.to_bytes(2, byteorder='big')
             ba += cmd_bs_id.to_bytes(4, byteorder='little')
             ba += (0).to_bytes(12, byteorder='big')
-            logging.debug(
-                self.label + " build2 action:" + action + " MAC=" + self.mac + " BLE CMD : " + str(
-                    binascii.hexlify(ba)))
             return ba
 
-    def purgeerrque(self):
-        t_now = datetime.now()
-        t_delta = t_now - timedelta(seconds=self.toomanysecs)
-        for errevt in self.errque:
-            if (errevt - t_delta).total_seconds() < 0:
-                self.errque.remove(errevt)
-
-    def logmanyerrors(self):
+    def logmanyerrors(self, _errclass="write"):
         """
-        Store errors timestamp in a list
-        Write warning in log if more than self.toomanycnt errors are logged over self.toomanysecs seconds
-        :rtype: object
+        Count the error in the sliding windows
+        Write warning in log if more than self.toomanycnt errors are logged over self.toomanysecs seconds,
+        at most once every self.toomanysecs seconds
+        :param _errclass: connect, write or radio
         """
         try:
-            t_now = datetime.now()
-            self.errque.append(t_now)
-            if len(self.errque) >= self.toomanycnt:
+            self.errors.add(_errclass)
+            t_now = time.monotonic()
+            if self.errors.count(self.toomanysecs) >= self.toomanycnt and (
+                    self.toomanywarned is None or t_now - self.toomanywarned >= self.toomanysecs):
+                self.toomanywarned = t_now
                 warningmsg = "Too many errors from " + self.label + " (" + str(self.toomanycnt) + " over "\
                              + str(self.toomanysecs)\
                              + " seconds), hints: check distance, re-plug BT dongle or re-pair the BS in Windows!"
                 logging.warning(warningmsg)
                 if not self.maininst.toomanynoted:
-                    self.maininst.toast_err(warningmsg)
+                    self.maininst.bleengine.offload(self.maininst.toast_err, warningmsg)
                     self.maininst.toomanynoted = True
-                self.errque.clear()
         except Exception as err:
             logging.error("Too many errors exception: " + str(err))
-            self.maininst.toast_err("Too many errors exception: " + str(err))
+            self.maininst.bleengine.offload(self.maininst.toast_err, "Too many errors exception: " + str(err))
 
     def is_active(self):
         if not self.tlock or self.status == "Off" or len(self.mac) < 1:
@@ -525,12 +2130,6 @@ class BaseStations(threading.Thread):
         else:
             return False
 
-    def getlasterrsecs(self):
-        if self.errque:
-            return str((datetime.now()-self.errque[-1]).seconds)
-        else:
-            return ""
-
     def setserial(self, serial):
         """
         Set BS serial number
@@ -549,6 +2148,8 @@ class BaseStations(threading.Thread):
         else:
             self.snhx = hex(self.sn)
             self.snshx = hex(self.sn)[-4:].upper()
+        self.buildcmdtable()
+        self.publish()
 
     def setpairing(self, _mac, _version):
         """
@@ -558,6 +2159,8 @@ class BaseStations(threading.Thread):
         """
         if not _mac:
             pass
+        if self.mac and self.mac != _mac and self.maininst.bleengine is not None:
+            self.maininst.bleengine.submit(self.maininst.bleengine.pool.discard(self.mac))
         self.mac = _mac
         if int(_version) == 2:
             self.bs_cmd_ble_id = str(UUID(self.bs_cmd_ble_id_v2))
@@ -565,7 +2168,18 @@ class BaseStations(threading.Thread):
         else:
             self.bs_cmd_ble_id = self.bs_cmd_ble_id_v1
             self.bs_version = 1
+        self.buildcmdtable()
         self.setstatus("Discovered")
+        self.notify()
+
+    def settimeout(self, _bs_timeout_in_sec):
+        """
+        Set the timeout sent to v1 Basestations with the keepalive
+        :param _bs_timeout_in_sec:
+        """
+        if self.bs_timeout_in_sec != _bs_timeout_in_sec:
+            self.bs_timeout_in_sec = _bs_timeout_in_sec
+            self.buildcmdtable()
 
     def setlock(self, _lock):
         """
@@ -574,11 +2188,14 @@ class BaseStations(threading.Thread):
         """
         self.islocked = False
         self.tlock = _lock
+        self.notify()
 
     def setaction(self, _action):
         """
         Set standby flag is the BS is connected
+        The pending waiters of a different action are resolved as Superseded
         """
+        self.supersede(_action)
         if _action == "Standby":
             self.setstatus("Standby")
             self.standby = True
@@ -587,9 +2204,14 @@ class BaseStations(threading.Thread):
             self.action = "Wakeup"
             self.standby = False
             self.wakeup_cmd = True
+            if self.maininst.bleengine is not None:
+                self.setdeadline(0, "Wakeup", False)
+        self.notify()
 
     def setmode(self, _mode):
         self.mode = _mode
+        self.publish()
+        self.notify()
 
     def setstatus(self, _status):
         """
@@ -612,20 +2234,36 @@ class BaseStations(threading.Thread):
             self.wakeup_cmd = False
         if self.status != _status:
             if _status == "Discovered":
-                logging.info(self.label + " v" + str(self.bs_version) + " via BLE")
+                logging.info("%s v%s via BLE", self.label, self.bs_version)
             elif _status == "Wakeup-error":
                 logging.error(self.label + " error sending Wakeup command")
             elif _status == "Wakeup":
-                logging.info(self.label + " success sending Wakeup command")
+                logging.info("%s success sending Wakeup command", self.label)
             elif _status == "Ping-error":
                 logging.error(self.label + " error sending Ping command")
             elif _status == "Ping":
-                logging.info(self.label + " success sending Ping command")
+                logging.info("%s success sending Ping command", self.label)
             elif _status == "Standby":
-                logging.debug(self.label + " set status to Standby")
+                logging.debug("%s set status to Standby", self.label)
             elif _status == "Off":
-                logging.debug(self.label + " set status to Off")
+                logging.debug("%s set status to Off", self.label)
         self.status = _status
+        self.publish()
+
+    def publish(self):
+        """
+        Publish the Basestation snapshot in the status bus
+        """
+        lasterr = datetime.fromtimestamp(self.errors.lastwall).strftime("%H:%M:%S") if self.errors.lastwall else ""
+        nextact = connection = None
+        if self.maininst.bleengine is not None:
+            nextact = self.maininst.bleengine.scheduler.getnext(self.label)
+            connection = self.maininst.bleengine.pool.getstats(self.mac)
+        self.maininst.statusbus.publish(self.label, StationSnapshot(
+            self.label, self.gettray(), self.getstatus(), self.mode, self.fsm_state, nextact, self.getserial(),
+            self.getsnhx(), self.getmac(), self.connected, self.bs_version, self.bs_disconnects, connection,
+            self.errors.getsummary(), self.errors.getclasssummary(), lasterr, self.bs_model, self.bs_manufacturer, self.bs_soc,
+            self.bs_fw, self.bs_fw2))
 
     def gettray(self):
         """
@@ -669,49 +2307,351 @@ class BaseStations(threading.Thread):
         Return string with full hex type serial number
         :return:
         """
-        return f"{self.snhx}"
+        return f"{self.snhx}"
+
+    def getversion(self):
+        """
+        Return string with bs version
+        :return:
+        """
+        return f"{self.bs_version}"
+
+    def is_connected(self):
+        """
+        Return boolean for BLE connected status
+        :return:
+        """
+        return self.connected
+
+    def is_standby(self):
+        """
+        Return boolean for go to standby command
+        :return:
+        """
+        return bool(self.standby)
+
+    def is_version(self):
+        """
+        Return integer for BS version
+        :return:
+        """
+        return int(self.bs_version)
+
+    def destroy(self, _standby=False):
+        """
+        Cancel the keepalive task and remove it from the keepalive scheduler
+        :param _standby: send Standby before dropping the pooled connection
+        """
+        bleengine = self.maininst.bleengine
+        if bleengine is not None and bleengine.is_alive():
+            bleengine.submit(self.retire(_standby))
+        elif self.task is not None:
+            self.task.cancel()
+        if bleengine is not None:
+            bleengine.scheduler.unregister(self.label)
+
+    async def retire(self, _standby=False):
+        """
+        Async function which stops the keepalive task and drops the pooled connection, runs on the BLE engine
+        :param _standby: send Standby before disconnecting
+        """
+        if self.looptask is not None and not self.looptask.done():
+            self.looptask.cancel()
+            await asyncio.gather(self.looptask, return_exceptions=True)
+        elif self.task is not None:
+            self.task.cancel()
+        pool = self.maininst.bleengine.pool
+        arbiter = self.maininst.bleengine.arbiter
+        if len(self.mac) < 1:
+            return
+        if _standby:
+            try:
+                client = await pool.get(self.mac, _arbiter=arbiter)
+                async with arbiter.slot():
+                    await client.write_gatt_char(self.bs_cmd_ble_id, self.cmdtable["Standby"].frame,
+                                                 self.bs_cmd_verify)
+                logging.info("%s removed, set Standby done", self.label)
+            except Exception as err:
+                logging.error("%s removed, error sending Standby command: %s", self.label, err)
+        await pool.discard(self.mac)
+        self.connected = False
+
+
+class HidPollPresence:
+
+    name = "poll"
+
+    def __init__(self, _vendor_id, _interval=7):
+        """
+        Headset presence by periodic USB HID enumeration with pywinusb, no change notifications
+        :param _vendor_id: USB vendor id of the headset
+        :param _interval: seconds between two enumerations
+        """
+        import pywinusb.hid as hid
+        self.hid = hid
+        self.vendor_id = _vendor_id
+        self.interval = _interval
+        self.settle = 0
+
+    def start(self, _notify):
+        """
+        Start the change notifications, _notify is called from any thread on a device change
+        :param _notify:
+        :return: true if notifications are delivered
+        """
+        return False
+
+    def stop(self):
+        """
+        Stop the change notifications
+        """
+        pass
+
+    def getdevices(self, _all=False):
+        """
+        Return the HID devices of the headset vendor, all of them with _all
+        :param _all:
+        :return:
+        """
+        if _all:
+            return self.hid.HidDeviceFilter().get_devices()
+        return self.hid.HidDeviceFilter(vendor_id=self.vendor_id).get_devices()
+
+
+class WinHotplugPresence(HidPollPresence):
+
+    name = "hotplug"
+    guid_devinterface_hid = "{4D1E55B2-F16F-11CF-88CB-001111000030}"
+    dbt_devicearrival = 0x8000
+    dbt_deviceremovecomplete = 0x8004
+
+    def __init__(self, _vendor_id, _interval=60, _pollinterval=7):
+        """
+        Headset presence driven by the Windows WM_DEVICECHANGE notifications for the HID interface class
+        The enumeration runs only on a notification, with a slow poll as safety net
+        :param _vendor_id: USB vendor id of the headset
+        :param _interval: seconds between two safety net enumerations
+        :param _pollinterval: seconds between two enumerations if the notifications can't be registered
+        """
+        HidPollPresence.__init__(self, _vendor_id, _interval)
+        import win32api
+        import win32con
+        import win32gui
+        import win32gui_struct
+        self.win32api = win32api
+        self.win32con = win32con
+        self.win32gui = win32gui
+        self.win32gui_struct = win32gui_struct
+        self.settle = 0.25
+        self.pollinterval = _pollinterval
+        self.notify = None
+        self.thread = None
+        self.threadid = None
+        self.hwnd = None
+        self.ready = threading.Event()
+        self.registered = False
+
+    def start(self, _notify, _timeout=5):
+        """
+        Start the message only window thread receiving the device notifications
+        Wait for the thread to register them, fall back to polling every self.pollinterval seconds if it fails
+        :param _notify:
+        :param _timeout: seconds to wait for the registration
+        :return: true if notifications are delivered
+        """
+        self.notify = _notify
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        if not self.ready.wait(_timeout):
+            logging.error("Headset hotplug notifications not registered after %s seconds", _timeout)
+            self.stop()
+        if not self.registered:
+            self.interval = self.pollinterval
+        return self.registered
+
+    def run(self):
+        """
+        Register for HID device notifications and pump the window messages
+        """
+        try:
+            self.threadid = self.win32api.GetCurrentThreadId()
+            wc = self.win32gui.WNDCLASS()
+            wc.lpfnWndProc = {self.win32con.WM_DEVICECHANGE: self.ondevicechange}
+            wc.lpszClassName = "PimaxBSAWHotplug"
+            wc.hInstance = self.win32api.GetModuleHandle(None)
+            classatom = self.win32gui.RegisterClass(wc)
+            self.hwnd = self.win32gui.CreateWindow(classatom, wc.lpszClassName, 0, 0, 0, 0, 0,
+                                                   self.win32con.HWND_MESSAGE, 0, wc.hInstance, None)
+            devfilter = self.win32gui_struct.PackDEV_BROADCAST_DEVICEINTERFACE(self.guid_devinterface_hid)
+            self.win32gui.RegisterDeviceNotification(self.hwnd, devfilter,
+                                                     self.win32con.DEVICE_NOTIFY_WINDOW_HANDLE)
+            logging.debug("Headset hotplug notifications registered")
+        except Exception as err:
+            logging.error("Headset hotplug notifications error, polling USB: " + str(err))
+            if self.hwnd is not None:
+                self.win32gui.DestroyWindow(self.hwnd)
+                self.hwnd = None
+            self.ready.set()
+            return
+        self.registered = True
+        self.ready.set()
+        try:
+            self.win32gui.PumpMessages()
+        except Exception as err:
+            logging.error("Headset hotplug notifications error: " + str(err))
+
+    def ondevicechange(self, _hwnd, _msg, _wparam, _lparam):
+        """
+        Window procedure for WM_DEVICECHANGE
+        """
+        if _wparam in (self.dbt_devicearrival, self.dbt_deviceremovecomplete) and self.notify:
+            self.notify()
+        return True
+
+    def stop(self):
+        """
+        Stop the message pump
+        """
+        if self.threadid is not None:
+            self.win32api.PostThreadMessage(self.threadid, self.win32con.WM_QUIT, 0, 0)
 
-    def getversion(self):
+
+class SysfsHidDevice:
+
+    def __init__(self, _path, _vendor_id, _product_id, _name):
         """
-        Return string with bs version
-        :return:
+        HID device read from sysfs, same attributes as the pywinusb HidDevice used by HeadSet
+        :param _path:
+        :param _vendor_id:
+        :param _product_id:
+        :param _name:
         """
-        return f"{self.bs_version}"
+        self.device_path = _path
+        self.vendor_id = _vendor_id
+        self.product_id = _product_id
+        self.vendor_name = _name
+        self.product_name = _name
 
-    def is_connected(self):
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return f"HID device {self.vendor_id:04x}:{self.product_id:04x} {self.product_name} at {self.device_path}"
+
+
+class SysfsPresence:
+
+    name = "sysfs"
+
+    def __init__(self, _vendor_id, _root="/sys/class/hidraw", _interval=60, _watch=0.25):
         """
-        Return boolean for BLE connected status
-        :return:
+        Headset presence for Linux from the hidraw class in sysfs, also used as hotplug stand-in for testing
+        Changes come from pyudev when available, otherwise from an inotify-style watcher of the class directory
+        :param _vendor_id: USB vendor id of the headset
+        :param _root: hidraw class directory, a plain directory with the same layout works as well
+        :param _interval: seconds between two safety net enumerations
+        :param _watch: seconds between two checks of the class directory without pyudev
         """
-        return self.connected
+        self.vendor_id = _vendor_id
+        self.root = _root
+        self.interval = _interval
+        self.watch = _watch
+        self.settle = 0.1
+        self.notify = None
+        self.stopped = threading.Event()
+        self.thread = None
 
-    def is_standby(self):
+    def start(self, _notify):
         """
-        Return boolean for go to standby command
+        Start the change notifications
+        :param _notify:
         :return:
         """
-        return bool(self.standby)
+        self.notify = _notify
+        try:
+            import pyudev
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by(subsystem="hidraw")
+            self.thread = pyudev.MonitorObserver(monitor, callback=lambda _device: _notify(), name="hs-udev")
+            self.thread.daemon = True
+            self.thread.start()
+            logging.debug("Headset udev notifications registered")
+        except Exception:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return True
 
-    def is_version(self):
+    def run(self):
         """
-        Return integer for BS version
-        :return:
+        Watch the class directory entries, notify on any change
         """
-        return int(self.bs_version)
+        entries = self.listentries()
+        while not self.stopped.wait(self.watch):
+            current = self.listentries()
+            if current != entries:
+                entries = current
+                self.notify()
 
-    def start_local(self):
+    def listentries(self):
+        try:
+            return frozenset(os.listdir(self.root))
+        except OSError:
+            return frozenset()
+
+    def stop(self):
         """
-        Start the thread with original run and acquire the lock
+        Stop the change notifications
         """
-        self.start_orig()
-        self.lock.acquire()
+        self.stopped.set()
+        if self.thread is not None and hasattr(self.thread, "stop") and self.thread is not threading.current_thread():
+            self.thread.stop()
 
-    def destroy(self):
+    def getdevices(self, _all=False):
         """
-        Override the destroy thread adding lock release and loop close
+        Return the HID devices of the headset vendor, all of them with _all
+        The vendor and product come from the HID_ID line of the device uevent file
+        :param _all:
+        :return:
         """
-        self.lock.release()
-        self.loop.close()
+        devices = []
+        for entry in sorted(self.listentries()):
+            try:
+                with open(os.path.join(self.root, entry, "device", "uevent")) as uevent:
+                    fields = dict(line.rstrip("\n").split("=", 1) for line in uevent if "=" in line)
+                _bus, vendor, product = fields["HID_ID"].split(":")
+                device = SysfsHidDevice(os.path.join(self.root, entry), int(vendor, 16), int(product, 16),
+                                        fields.get("HID_NAME", ""))
+            except (OSError, KeyError, ValueError):
+                continue
+            if _all or device.vendor_id == self.vendor_id:
+                devices.append(device)
+        return devices
+
+
+def getpresence(_maininst):
+    """
+    Return the headset presence backend selected by the PRESENCE configuration:
+    auto, hotplug (Windows device notifications), sysfs (Linux) or poll
+    Auto picks the event driven backend of the platform and falls back to the poller
+    :param _maininst:
+    :return:
+    """
+    if _maininst.presence_backend is not None:
+        return _maininst.presence_backend
+    vendor_id = _maininst.pimax_usb_vendor_id
+    presence = _maininst.hs_presence
+    if presence in ("auto", "hotplug") and sys.platform == "win32":
+        try:
+            return WinHotplugPresence(vendor_id, _pollinterval=_maininst.sleep_time_sec_usb_find)
+        except ImportError as err:
+            logging.info("Headset hotplug notifications not available, polling USB: " + str(err))
+    if presence == "sysfs" or (presence == "auto" and sys.platform.startswith("linux")):
+        return SysfsPresence(vendor_id)
+    return HidPollPresence(vendor_id, _maininst.sleep_time_sec_usb_find)
 
 
 class HeadSet(threading.Thread):
@@ -739,6 +2679,11 @@ class HeadSet(threading.Thread):
         self.hs_vendor = ""
         self.hs_product = ""
         self.dumpusb = False
+        self.changed = threading.Event()
+        self.backend = None
+        self.hidcache = {}
+        self.hidpresent = frozenset()
+        self.publish()
 
         if autostart:
             self.start()  # automatically start thread on init
@@ -750,19 +2695,28 @@ class HeadSet(threading.Thread):
         try:
             self.lock.release()
 
+            self.backend = getpresence(self.maininst)
+            hotplug = self.backend.start(self.notify)
+            logging.info("%s presence backend: %s (%s)", self.label, self.backend.name,
+                         "hotplug" if hotplug else "polling")
+            self.changed.set()
+
             while True:
 
-                time.sleep(maininst.sleep_time_sec_usb_find)
+                if self.changed.wait(self.backend.interval):
+                    self.changed.clear()
+                    time.sleep(self.backend.settle)
 
                 if maininst.get_quit_main():
-                    logging.debug(self.label + " thread exiting due to quit main")
+                    logging.debug("%s thread exiting due to quit main", self.label)
+                    self.backend.stop()
                     break
                 if self.tlock:
-                    logging.debug(self.label + " thread lock active")
+                    logging.debug("%s thread lock active", self.label)
                     self.islocked = True
                     continue
                 if maininst.disco:
-                    logging.debug(self.label + " detection paused, discovery running")
+                    logging.debug("%s detection paused, discovery running", self.label)
                     self.islocked = True
                     continue
                 if self.maininst.debug_bypass_usb:
@@ -770,31 +2724,27 @@ class HeadSet(threading.Thread):
                     self.islocked = False
                     continue
                 self.islocked = False
-                all_devices = hid.HidDeviceFilter().get_devices()
-                flt_devices = hid.HidDeviceFilter(vendor_id=self.maininst.pimax_usb_vendor_id).get_devices()
-                if maininst.debug_logs:
+                if maininst.debug_logs and isdebug():
                     if not self.dumpusb:
                         self.dumpusb = True
                         logging.debug("DUMP USB DEVICES:")
-                        for device in all_devices:
-                            device.open()
-                            hs_vendor = str(device.vendor_name) + " (" + str(device.vendor_id) + ")"
-                            hs_product = str(device.product_name) + " (" + str(device.product_id) + ")"
-                            logging.debug("USB V: " + hs_vendor + " P:" + hs_product)
-                            device.close()
+                        for device in self.backend.getdevices(True):
+                            hs_vendor, hs_product = self.identify(device, False)
+                            logging.debug("USB V: %s P:%s", hs_vendor, hs_product)
+                flt_devices = self.backend.getdevices()
+                present = frozenset(self.devicekey(device) for device in flt_devices)
                 if not flt_devices:
-                    logging.debug(self.label + " not found on USB")
+                    logging.debug("%s not found on USB", self.label)
                     self.setstatus("Off")
                 else:
-                    for device in flt_devices:
-                        try:
-                            device.open()
-                            self.setstatus("On")
-                            logging.debug(self.label + " found on USB: " + str(device))
-                            self.hs_vendor = str(device.vendor_name) + " (" + str(device.vendor_id) + ")"
-                            self.hs_product = str(device.product_name) + " (" + str(device.product_id) + ")"
-                        finally:
-                            device.close()
+                    if present != self.hidpresent:
+                        for device in flt_devices:
+                            logging.debug("%s found on USB: %s", self.label, device)
+                            self.hs_vendor, self.hs_product = self.identify(device)
+                    self.setstatus("On")
+                for key in [key for key in self.hidcache if key not in present]:
+                    del self.hidcache[key]
+                self.hidpresent = present
 
         except Exception as err:
             logging.error("Error: %s in %s thread: %s" % (self.__class__.__name__, self.label, str(err)))
@@ -806,6 +2756,43 @@ class HeadSet(threading.Thread):
         """
         self.islocked = False
         self.tlock = _lock
+        self.notify()
+
+    def notify(self):
+        """
+        Wake up the presence check, safe to call from any thread
+        """
+        self.changed.set()
+
+    @staticmethod
+    def devicekey(_device):
+        """
+        Return the identity key of a HID device: device path, serial number or its description
+        :param _device:
+        :return:
+        """
+        return getattr(_device, "device_path", None) or getattr(_device, "serial_number", None) or str(_device)
+
+    def identify(self, _device, _cache=True):
+        """
+        Return vendor and product strings of a HID device
+        The device is opened only the first time it appears, then the cached identity is used
+        :param _device:
+        :param _cache:
+        :return:
+        """
+        key = self.devicekey(_device)
+        identity = self.hidcache.get(key)
+        if identity is None:
+            try:
+                _device.open()
+                identity = (str(_device.vendor_name) + " (" + str(_device.vendor_id) + ")",
+                            str(_device.product_name) + " (" + str(_device.product_id) + ")")
+            finally:
+                _device.close()
+            if _cache:
+                self.hidcache[key] = identity
+        return identity
 
     def gettray(self):
         """
@@ -826,24 +2813,35 @@ class HeadSet(threading.Thread):
         Set Headset status
         :param _status:
         """
+        connected = self.connected
         if _status == "On":
             self.connected = True
         elif _status == "Off":
             self.connected = False
         elif _status == "DEBUG":
             self.connected = True
+        if self.connected != connected:
+            self.maininst.notifyall()
         if self.status != _status:
             if _status == "On":
-                logging.info(self.label + " is active")
+                logging.info("%s is active", self.label)
                 self.maininst.setwakeup()
             elif _status == "Off":
-                logging.info(self.label + " is Off")
+                logging.info("%s is Off", self.label)
                 if self.status != self.status_initial:
                     self.maininst.setstandby()
             elif _status == "DEBUG":
-                logging.info(self.label + " is forced On")
+                logging.info("%s is forced On", self.label)
                 self.maininst.setwakeup()
         self.status = _status
+        self.publish()
+
+    def publish(self):
+        """
+        Publish the Headset snapshot in the status bus
+        """
+        self.maininst.statusbus.publish(self.label, HeadsetSnapshot(
+            self.label, self.gettray(), self.getstatus(), self.hs_vendor, self.hs_product))
 
     def isoff(self):
         """
@@ -868,13 +2866,14 @@ class HeadSet(threading.Thread):
 
 class WxLogHandler(logging.Handler):
 
-    def __init__(self, get_log_dest_func):
+    def __init__(self, _ring):
         """
         Logging handler to redirect messages to the wxPython window
-        :param get_log_dest_func:
+        The records are queued in the ring buffer and the window drains them in batches on a timer
+        :param _ring:
         """
         logging.Handler.__init__(self)
-        self._get_log_dest_func = get_log_dest_func
+        self.ring = _ring
         self.level = logging.DEBUG
 
     def flush(self):
@@ -882,403 +2881,100 @@ class WxLogHandler(logging.Handler):
 
     def emit(self, record):
         """
-        This function will forward the event message to the destination window
+        This function will queue the message for the destination window, no wx call is made
         :param record:
         """
         try:
-            msg = self.format(record)
-            event = LogMsgEvent(message=msg, levelname=record.levelname, levelno=record.levelno)
-
-            log_dest = self._get_log_dest_func()
-
-            def after_func(get_log_dest_func=self._get_log_dest_func, event=event):
-                _log_dest = get_log_dest_func()
-                if _log_dest:
-                    wx.PostEvent(_log_dest, event)
-
-            wx.CallAfter(after_func)
+            self.ring.put(record.levelno, self.format(record))
 
         except Exception as err:
             sys.stderr.write("Error: %s failed while emitting a log record (%s): %s\n" % (
                 self.__class__.__name__, repr(record), str(err)))
 
 
-class LevelFilter(object):
-    def __init__(self, level):
-        """
-        Filter for log level
-        :param level:
-        """
-        self.level = level
-
-    def filter(self, record):
-        """
-        Filter will forward only records with a level greater or equal self.level
-        :type record: object
-        """
-        return record.levelno >= self.level
-
-
-class LogWnd(wx.Frame):
+class LogRing:
 
-    def __init__(self):
+    def __init__(self, _capacity=5000):
         """
-        wxPython logging window
+        Fixed capacity ring buffer of the log lines shown in the status panel, the oldest lines are dropped
+        Messages from other threads are queued with put() and moved in with drain() by the GUI thread
+        :param _capacity: number of lines
         """
-        #import wx.lib.inspection
-        #wx.lib.inspection.InspectionTool().Show()
-
-        try:
-            frame_style = wx.DEFAULT_FRAME_STYLE | wx.RESIZE_BORDER
-            frame_style = frame_style & ~ (wx.RESIZE_BORDER | wx.MAXIMIZE_BOX)
-
-            wx.lib.colourdb.updateColourDB()
-
-            self.wxorange = wx.Colour("ORANGE RED")
-            self.wxdarkgreen = wx.Colour("DARK GREEN")
-
-            wx.Frame.__init__(self, None,
-                              title="Status panel", style=frame_style)
-
-            self.Bind(EVT_LOG_MSG, self.on_log_msg)
-
-            self.Bind(wx.EVT_CLOSE, self.oncloseevt)
-
-            self.SetIcon(wx.Icon("pimax.ico"))
-
-            (self.display_width_, self.display_height_) = wx.GetDisplaySize()
-
-            frame_width = self.display_width_ * 90 / 100
-            frame_height = self.display_height_ * 85 / 100
-            self.SetSize(wx.Size(frame_width, frame_height))
-
-            panel_width = self.GetClientSize().GetWidth()-2
-            panel_height = self.GetClientSize().GetHeight()-46
-
-            status_width = 500
-            text_width = panel_width - status_width
-            text_height = panel_height
-            if text_width < 1:
-                text_width = 100
-
-            value_width = panel_width - text_width
-            unit_width = value_width/10
-            c0_width = int(unit_width*2)
-            c1_width = int(unit_width*2)
-            if c0_width < 120:
-                c0_width = 120
-            if c1_width < 120:
-                c1_width = 120
-            c2_width = int(unit_width*6)
-            delta = (c0_width+c1_width+c2_width)-value_width
-            if delta > 10:
-                c2_width = c2_width - delta
-            if c2_width < 260:
-                c2_width = 260
-
-            status_width = c0_width + c1_width + c2_width
-
-            self.dvc = dv.DataViewCtrl(self,
-                                       style=wx.BORDER_THEME
-                                       | dv.DV_ROW_LINES # nice alternating bg colors
-                                       #| dv.DV_HORIZ_RULES
-                                       | dv.DV_VERT_RULES
-                                       | dv.DV_MULTIPLE
-                                       | dv.DV_NO_HEADER
-                                       , size=(status_width, text_height)
-                                       )
-
-            self.model = StatusModel(getpaneldata())
-
-            self.dvc.AssociateModel(self.model)
-
-            c0 = self.dvc.AppendTextColumn("Item " + str(c0_width) + " " + str(value_width),  1, width=c0_width, align=wx.ALIGN_RIGHT, mode=dv.DATAVIEW_CELL_INERT)
-            c1 = self.dvc.AppendTextColumn("Characteristic " + str(c1_width),   2, width=c1_width, align=wx.ALIGN_RIGHT, mode=dv.DATAVIEW_CELL_INERT)
-            c2 = self.dvc.AppendTextColumn("Value " + str(c2_width-4),   3, width=c2_width-4, align=wx.ALIGN_LEFT, mode=dv.DATAVIEW_CELL_INERT)
-
-            for c in self.dvc.Columns:
-                c.Sortable = False
-                c.Reorderable = False
-
-            log_font = wx.Font(9, wx.FONTFAMILY_MODERN, wx.NORMAL, wx.FONTWEIGHT_NORMAL)
-
-            panel = wx.Panel(self, wx.ID_ANY)
-
-            style = wx.TE_MULTILINE | wx.TE_READONLY | wx.HSCROLL | wx.TE_RICH2
-
-            self.text = wx.TextCtrl(panel, wx.ID_ANY, size=(text_width, text_height),
-                                    style=style)
-            self.text.SetFont(log_font)
-
-            sizer = wx.BoxSizer(wx.VERTICAL)
-            wbox = wx.BoxSizer(wx.HORIZONTAL)
-            hbox = wx.BoxSizer(wx.HORIZONTAL)
-            wbox.Add(self.text, 0, wx.ALL | wx.EXPAND | wx.LEFT, 0)
-            wbox.Add(self.dvc, 0, wx.ALL | wx.EXPAND | wx.RIGHT, 0)
-
-            self.closebtn = wx.Button(panel, wx.ID_ANY, 'Close')
-            self.closebtn.Bind(wx.EVT_BUTTON, self.onclosebutton)
-            self.Bind(wx.EVT_BUTTON, self.onclosebutton, self.closebtn)
-            self.copybtn = wx.Button(panel, wx.ID_ANY, label="Copy to clipboard")
-            self.copybtn.Bind(wx.EVT_BUTTON, self.oncopybutton)
-            self.Bind(wx.EVT_BUTTON, self.oncopybutton, self.copybtn)
-            self.debugbtn = wx.Button(panel, wx.ID_ANY, label="Headset Debug")
-            self.debugbtn.Bind(wx.EVT_BUTTON, self.ondebugbutton)
-            self.Bind(wx.EVT_BUTTON, self.ondebugbutton, self.debugbtn)
-            self.bsmodebtn = wx.Button(panel, wx.ID_ANY, label="BS Switch mode")
-            self.bsmodebtn.Bind(wx.EVT_BUTTON, self.onbsmodebutton)
-            self.Bind(wx.EVT_BUTTON, self.onbsmodebutton, self.bsmodebtn)
-            self.wakeupbtn = wx.Button(panel, wx.ID_ANY, label="BS Wakeup")
-            self.wakeupbtn.Bind(wx.EVT_BUTTON, self.onwakeupbutton)
-            self.Bind(wx.EVT_BUTTON, self.onwakeupbutton, self.wakeupbtn)
-            self.standbybtn = wx.Button(panel, wx.ID_ANY, label="BS Standby")
-            self.standbybtn.Bind(wx.EVT_BUTTON, self.onstandbybutton)
-            self.Bind(wx.EVT_BUTTON, self.onstandbybutton, self.standbybtn)
-            self.discobtn = wx.Button(panel, wx.ID_ANY, label="Run BS discovery")
-            self.discobtn.Bind(wx.EVT_BUTTON, self.ondiscobutton)
-            self.Bind(wx.EVT_BUTTON, self.ondiscobutton, self.discobtn)
-
-            hbox.Add(self.copybtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
-            hbox.Add(self.debugbtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
-            hbox.Add(self.bsmodebtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
-            hbox.Add(self.standbybtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
-            hbox.Add(self.wakeupbtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
-            hbox.Add(self.discobtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
-            hbox.Add(self.closebtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
-            sizer.Add(wbox, flag=wx.ALL | wx.EXPAND)
-            sizer.Add(hbox, 1, flag=wx.ALL | wx.ALIGN_CENTER, border=5)
-            panel.SetSizer(sizer)
-            panel.Layout()
-            panel.Fit()
-
-            self.CenterOnScreen()
-            self.dataObj = None
-
-            self.Raise()
-
-        except Exception as err:
-            toast_err("Status panel error: " + str(err))
+        self.lock = threading.Lock()
+        self.lines = collections.deque(maxlen=_capacity)
+        self.pending = collections.deque(maxlen=_capacity)
+        self.dropped = 0
 
-    def oncloseevt(self, e):
-        """
-        The close button will hide the window without destroying it to keep the logging messages flowing in
-        :param e:
-        """
-        e.Veto()
-        self.Show(False)
-        self.Hide()
+    def __len__(self):
+        return len(self.lines)
 
-    def onclosebutton(self, e):
-        """
-        The close button will hide the window without destroying it to keep the logging messages flowing in
-        :param e:
-        """
-        self.Show(False)
-        self.Hide()
+    def __getitem__(self, _idx):
+        return self.lines[_idx]
 
-    def ondiscobutton(self, e):
+    def append(self, _levelno, _message):
         """
-        The close button will hide the window without destroying it to keep the logging messages flowing in
-        :param e:
+        Append a log message, one line per row
+        :param _levelno:
+        :param _message:
         """
-        call_bs_discovery(maininst.systray)
+        for line in _message.splitlines() or [""]:
+            if len(self.lines) == self.lines.maxlen:
+                self.dropped += 1
+            self.lines.append((_levelno, line))
 
-    def oncopybutton(self, e):
+    def put(self, _levelno, _message):
         """
-        The copy button will fill the clipboard with the logging messages in the window
-        :param e:
+        Queue a log message from any thread, the lock only guards against resize() swapping the queue
+        :param _levelno:
+        :param _message:
         """
-        self.dataObj = wx.TextDataObject()
-        self.dataObj.SetText(self.text.GetValue())
-        if wx.TheClipboard.Open():
-            wx.TheClipboard.SetData(self.dataObj)
-            wx.TheClipboard.Close()
-        else:
-            wx.MessageBox("Unable to open the clipboard", "Error")
-
-    def ondebugbutton(self, e):
-        if maininst.debug_bypass_usb:
-            maininst.debug_bypass_usb = False
-            self.debugbtn.SetLabel("Headset Debug")
-        else:
-            maininst.debug_bypass_usb = True
-            self.debugbtn.SetLabel("Headset Auto")
-
-    def onwakeupbutton(self, e):
-        maininst.setwakeup()
-
-    def onstandbybutton(self, e):
-        maininst.setstandby()
+        with self.lock:
+            self.pending.append((_levelno, _message))
 
-    def onbsmodebutton(self, e):
-        maininst.setmode()
-
-    def on_log_msg(self, e):
+    def drain(self):
         """
-        This function is triggered by the bind for the EVT_LOG_MSG event.
-        Autoscroll is enabled if vertical scrollbar is near the bottom
-        :param e:
+        Move the queued messages to the ring buffer, to be called from the GUI thread
+        :return: number of messages moved
         """
-        try:
-            msg = re.sub("\r\n?", "\n", e.message)
-
-            if e.levelno >= 40:
-                self.text.SetDefaultStyle(wx.TextAttr(wx.RED))
-            elif e.levelno >= 30:
-                self.text.SetDefaultStyle(wx.TextAttr(self.wxorange))
-            elif e.levelno >= 20:
-                self.text.SetDefaultStyle(wx.TextAttr(wx.BLACK))
-            elif e.levelno >= 10:
-                self.text.SetDefaultStyle(wx.TextAttr(self.wxdarkgreen))
-
-            # msg = msg + " sc=" + str(self.text.GetScrollPos(wx.VERTICAL))
-
-            sbrng = self.text.GetScrollRange(wx.VERTICAL)
-            sbpos = self.text.GetScrollPos(wx.VERTICAL)+self.text.GetVirtualSize().GetHeight()
-            sboldpos = self.text.GetScrollPos(wx.VERTICAL)
-
-            current_pos = self.text.GetInsertionPoint()
-            end_pos = self.text.GetLastPosition()
-
-            # autoscroll = (current_pos == end_pos)
-
-            if sbrng-sbpos <= 10:
-                # msg = msg + " YESASB"
-                reposition = False
-                autoscroll = True
-            else:
-                current_pos = self.text.GetScrollPos(wx.VERTICAL)
-                # msg = msg + " NOASB"
-                reposition = True
-                autoscroll = False
-
-            # msg = msg + " sbrng=" + str(sbrng) + " sbpos=" + str(sbpos) + " cur=" + str(current_pos) + " end=" + str(
-            #    end_pos)
-
-            if autoscroll:
-                # msg = msg + " YESA"
-                self.text.AppendText("%s\n" % msg)
-                if reposition:
-                    self.text.SetScrollPos(wx.VERTICAL, self.text.GetScrollRange(wx.VERTICAL), True)
-            else:
-                # msg = msg + " NOA"
-                self.text.Freeze()
-                (selection_start, selection_end) = self.text.GetSelection()
-                self.text.SetEditable(True)
-                self.text.SetInsertionPoint(end_pos)
-                self.text.WriteText("%s\n" % msg)
-                self.text.SetEditable(False)
-                self.text.SetInsertionPoint(current_pos)
-                self.text.SetSelection(selection_start, selection_end)
-                self.text.Thaw()
-                if reposition:
-                    self.text.SetScrollPos(wx.VERTICAL, sboldpos, True)
-                else:
-                    self.text.SetScrollPos(wx.VERTICAL, self.text.GetScrollRange(wx.VERTICAL), True)
-                #self.text.Refresh()
-
-        except Exception as err:
-            sys.stderr.write(
-                "Error: %s failed while responding to a log message: %s.\n" % (self.__class__.__name__, str(err)))
-
-        if e is not None:
-            e.Skip(True)
-
-
-class StatusModel(dv.DataViewIndexListModel):
-    def __init__(self, data):
-        dv.DataViewIndexListModel.__init__(self, len(data))
-        self.wxgray = wx.Colour(47, 79, 79)
-        self.data = data
-
-    def GetColumnType(self, col):
-        return "string"
-
-    # This method is called to provide the data object for a
-    # particular row,col
-    def GetValueByRow(self, row, col):
-        return self.data[row][col]
-
-    # Report how many columns this model provides data for.
-    def GetColumnCount(self):
-        return len(self.data[0])
-
-    # Report the number of rows in the model
-    def GetCount(self):
-        return len(self.data)
-
-    # Called to check if non-standard attributes should be used in the
-    # cell at (row, col)
-    def GetAttrByRow(self, row, col, attr):
-        if col == 1:
-            attr.SetColour(self.wxgray)
-            attr.SetBold(True)
-            attr.SetItalic(True)
-            return True
-        if col == 3:
-            attr.SetColour('blue')
-            attr.SetBold(True)
-            return True
-        return False
+        with self.lock:
+            pending = self.pending
+            self.pending = collections.deque(maxlen=pending.maxlen)
+            for levelno, message in pending:
+                self.append(levelno, message)
+        return len(pending)
 
-    def AddRow(self, value):
-        # update data structure
-        self.data.append(value)
-        # notify views
-        self.RowAppended()
-
-
-class LogThread(threading.Thread):
-
-    def __init__(self, autostart=True):
+    def resize(self, _capacity):
         """
-        Run the log window in a thread.
-        Access the frame with self.frame
-
-        :type autostart: object
+        Change the capacity keeping the newest lines
+        :param _capacity:
         """
-        threading.Thread.__init__(self)
-        self.setDaemon(True)
-        self.start_orig = self.start
-        self.start = self.start_local
-        self.frame = None  # to be defined in self.run
-        self.framepnl = None
-        self.status = ""
-        self.lock = threading.Lock()
-        self.lock.acquire()  # lock until variables are set
-
-        if autostart:
-            self.start()  # automatically start thread on init
+        with self.lock:
+            self.dropped += max(0, len(self.lines) - _capacity)
+            self.lines = collections.deque(self.lines, maxlen=_capacity)
+            self.pending = collections.deque(self.pending, maxlen=_capacity)
 
-    def run(self):
+    def gettext(self):
         """
-        Initialize the frame with with the wxPython class and run the window MainLoop
+        Return all the lines as text
+        :return:
         """
-        import wx
-        atexit.register(disable_asserts)
-
-        app = wx.App(False)
+        return "".join(line + "\n" for levelno, line in list(self.lines))
 
-        frame = LogWnd()
 
-        # define frame and release lock
-        self.frame = frame
-        self.lock.release()
-
-        app.MainLoop()
-
-    def destroy(self):
+class LevelFilter(object):
+    def __init__(self, level):
         """
-         Override the destroy adding frame destroy first
+        Filter for log level
+        :param level:
         """
-        self.frame.Destroy()
+        self.level = level
 
-    def start_local(self):
+    def filter(self, record):
         """
-        Start the thread with original run and acquire the lock
+        Filter will forward only records with a level greater or equal self.level
+        :type record: object
         """
-        self.start_orig()
-        self.lock.acquire()
+        return record.levelno >= self.level
 
 
 class UUID:
@@ -1325,15 +3021,20 @@ class UUID:
         return s
 
 
-def runlogthread():
+panellock = threading.Lock()
+
+
+def loadpanel():
     """
-    Run the Logging window thread and makes the frame accessible
-    :return:
+    Import wxPython and build the status panel on first use, the log lines buffered so far are shown
+    :return: the log thread running the panel
     """
-    lt = LogThread()  # run wx MainLoop as thread
-    #frame = lt.frame  # access to wx Frame
-    lt.frame.Show(False)
-    return lt
+    with panellock:
+        if maininst.logthr is None or not maininst.logthr.is_alive():
+            import bsaw_panel
+            logging.debug("Loading status panel")
+            maininst.logthr = bsaw_panel.runlogthread(sys.modules[__name__])
+    return maininst.logthr
 
 
 def consolewin(systray):
@@ -1342,112 +3043,222 @@ def consolewin(systray):
     :param systray:
 """
     try:
-        maininst.logthr.frame.Show(True)
-        maininst.logthr.frame.Raise()
+        loadpanel().showpanel()
     except Exception as err:
-        maininst.logthr = runlogthread()
-        maininst.logthr.frame.Show(True)
-        maininst.logthr.frame.Raise()
-        toast_err("ex=" + str(err))
+        toast_err("Status panel error: " + str(err))
 
 
-def disable_asserts():
-    """
-    Disable wxPython error messages when destroying the windows
-    """
-    import wx
-    wx.DisableAsserts()
+class StreamingScanner:
+
+    def __init__(self, _engine, _wanted):
+        """
+        BLE scanner handling the advertisements as they arrive, stops as soon as all the wanted Basestations are seen
+        :param _engine: BLE engine
+        :param _wanted: short hex serial numbers (last 4 digits) of the Basestations to find
+        """
+        self.engine = _engine
+        self.wanted = set(str(sn).upper() for sn in _wanted)
+        self.remaining = set(self.wanted)
+        self.found = collections.OrderedDict()
+        self.done = None  # asyncio.Event created on the BLE engine loop
+
+    @staticmethod
+    def parse(_name):
+        """
+        Return the short hex id and the version of a Basestation advertised name, None if not a Basestation
+        :param _name:
+        :return:
+        """
+        bsid = re.match(r"HTC BS \w\w(\w\w\w\w)", _name)
+        if bsid:
+            return bsid.group(1).upper(), 1
+        bsid = re.match(r"LHB-\w\w\w\w(\w\w\w\w)", _name)
+        if bsid:
+            return bsid.group(1).upper(), 2
+        return None
+
+    def ondetect(self, _device, _advdata=None):
+        """
+        Advertisement callback, record the Basestation and flag the end of the scan when nothing is missing
+        :param _device:
+        :param _advdata:
+        """
+        name = getattr(_advdata, "local_name", None) or getattr(_device, "name", None) or ""
+        parsed = self.parse(name)
+        if parsed is None:
+            return
+        mac = str(_device.address).upper()
+        if mac in self.found:
+            return
+        self.found[mac] = parsed
+        logging.info("Found BS v" + str(parsed[1]) + " via BLE Scan: " + mac + " " + parsed[0])
+        self.remaining.discard(parsed[0])
+        if not self.remaining and self.done is not None:
+            self.done.set()
+
+    async def scan(self, _timeout=10):
+        """
+        Run the scan until all the wanted Basestations are seen or _timeout seconds elapsed
+        :param _timeout:
+        :return: dict MAC -> (short hex id, version)
+        """
+        self.done = asyncio.Event()
+        if not self.remaining:
+            return self.found
+        scanner = self.engine.scanner_factory(detection_callback=self.ondetect)
+        await scanner.start()
+        try:
+            await asyncio.wait_for(self.done.wait(), _timeout)
+        except asyncio.TimeoutError:
+            logging.debug("BLE scan timeout, missing: " + " ".join(sorted(self.remaining)))
+        finally:
+            await scanner.stop()
+        return self.found
 
 
-async def basescan():
+async def basescan(_wanted):
     """
-    Async function which runs the BLE discovery
+    Async function which runs the BLE discovery, stops as soon as all the wanted Basestations are seen
+    :param _wanted: short hex serial numbers of the Basestations to find
     """
     try:
-        devices = await discover(timeout=10)
-        for d in devices:
-            bs = re.search("HTC BS", str(d))
-            bs2 = re.search("LHB-", str(d))
-            found = False
-            if bs:
-                _bsmac = re.search(r"(\A\w+:\w+:\w+:\w+:\w+:\w+)", str(d))
-                _bsid = re.search(r"HTC BS \w\w(\w\w\w\w)", str(d))
-                bsmac = _bsmac.group(1)
-                bsid = _bsid.group(1)
-                if any(str(macs[:17]).upper() == str(bsmac).upper() in macs for macs in maininst.stations):
-                    logging.debug("Skipping BS v1 already discovered: " + bsmac + " " + bsid)
-                else:
-                    maininst.stations.append(bsmac + " " + bsid + " 1")
-                    logging.info("Found BS v1 via BLE Scan: " + bsmac + " " + bsid)
-            elif bs2:
-                _bsmac = re.search(r"(\A\w+:\w+:\w+:\w+:\w+:\w+)", str(d))
-                _bsid = re.search(r"LHB-\w\w\w\w(\w\w\w\w)", str(d))
-                bsmac = _bsmac.group(1)
-                bsid = _bsid.group(1)
-                if any(str(macs[:17]).upper() == str(bsmac).upper() in macs for macs in maininst.stations):
-                    logging.debug("Found BS v2 already discovered, skip: " + bsmac + " " + bsid)
-                else:
-                    maininst.stations.append(bsmac + " " + bsid + " 2")
-                    logging.info("Found BS v2 via BLE Scan: " + bsmac + " " + bsid)
+        found = await StreamingScanner(maininst.bleengine, _wanted).scan(10)
+        for bsmac, (bsid, bsver) in found.items():
+            if any(str(macs[:17]).upper() == bsmac for macs in maininst.stations):
+                logging.debug("Skipping BS v" + str(bsver) + " already discovered: " + bsmac + " " + bsid)
+            else:
+                maininst.stations.append(bsmac + " " + bsid + " " + str(bsver))
     except Exception as err:
         logging.debug("BLE scan exception")
-        toast_err("Discovery scan exception: " + str(err))
+        maininst.bleengine.offload(toast_err, "Discovery scan exception: " + str(err))
+
+
+GATT_SOC_SERVICE = "0000fe59-0000-1000-8000-00805f9b34fb"
+GATT_CHARS_V1 = {
+    "00002a00-0000-1000-8000-00805f9b34fb": "bs_model",
+    "00002a23-0000-1000-8000-00805f9b34fb": "bs_manufacturer",
+    "00002a29-0000-1000-8000-00805f9b34fb": "bs_soc",
+    "00002a24-0000-1000-8000-00805f9b34fb": "bs_fw",
+}
+GATT_CHARS_V2 = {
+    "00002a00-0000-1000-8000-00805f9b34fb": "bs_model",
+    "00002a29-0000-1000-8000-00805f9b34fb": "bs_manufacturer",
+    "00002a24-0000-1000-8000-00805f9b34fb": "bs_fw",
+    "00002a25-0000-1000-8000-00805f9b34fb": "bs_fw2",
+}
 
 
-async def getsvcs(_bsthr, _loop):
+async def getsvcs(_bsthr, _fulldump=False):
     """
-    Async function which runs the get services and dump in debug logs
+    Async function which reads the GATT characteristics used by the dashboard, the reads are run concurrently
+    With _fulldump all the readable characteristics and descriptors are read and dumped in debug logs
+    :param _bsthr:
+    :param _fulldump:
     """
+    async def readchar(_client, _uuid):
+        try:
+            return bytes(await _client.read_gatt_char(_uuid))
+        except Exception as e:
+            return e
+
+    async def readdesc(_client, _handle):
+        try:
+            return bytes(await _client.read_gatt_descriptor(_handle))
+        except Exception as e:
+            return e
+
     try:
-        async with BleakClient(_bsthr.mac, loop=_loop) as client:
-            logging.debug(_bsthr.label + " DEBUG Get services: " + str(_bsthr.mac))
-            x = await client.is_connected()
-            logging.debug(_bsthr.label + " Connected: {0}".format(x))
-            for service in client.services:
-                logging.debug(_bsthr.label + "[Service] {0}: {1}".format(service.uuid, service.description))
-                if service.uuid == "0000fe59-0000-1000-8000-00805f9b34fb":
-                    _bsthr.bs_soc = str(service.description)
-                for char in service.characteristics:
-                    if "read" in char.properties:
-                        try:
-                            value = bytes(await client.read_gatt_char(char.uuid))
-                            if _bsthr.bs_version == 2:
-                                if char.uuid == "00002a00-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_model = str(value.decode("utf-8"))
-                                if char.uuid == "00002a29-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_manufacturer = str(value.decode("utf-8"))
-                                if char.uuid == "00002a24-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_fw = str(value.decode("utf-8"))
-                                if char.uuid == "00002a25-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_fw2 = str(value.decode("utf-8"))
-                            else:
-                                if char.uuid == "00002a00-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_model = str(value.decode("utf-8"))
-                                if char.uuid == "00002a23-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_manufacturer = str(value.decode("utf-8"))
-                                if char.uuid == "00002a29-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_soc = str(value.decode("utf-8"))
-                                if char.uuid == "00002a24-0000-1000-8000-00805f9b34fb":
-                                    _bsthr.bs_fw = str(value.decode("utf-8"))
-                        except Exception as e:
-                            value = str(e).encode()
-                    else:
-                        value = None
-                    logging.debug(_bsthr.label +
-                        " \t[Characteristic] {0}: ({1}) | Name: {2}, Value: {3} ".format(
-                            char.uuid, ",".join(char.properties), char.description, value
-                        )
-                    )
-                    for descriptor in char.descriptors:
-                        value = await client.read_gatt_descriptor(descriptor.handle)
-                        logging.debug(_bsthr.label +
-                            "\t\t[Descriptor] {0}: (Handle: {1}) | Value: {2} ".format(
-                                descriptor.uuid, descriptor.handle, bytes(value)
-                            )
-                        )
+        client = await maininst.bleengine.pool.get(_bsthr.mac)
+        logging.debug("%s DEBUG Get services: %s", _bsthr.label, _bsthr.mac)
+        wanted = GATT_CHARS_V2 if _bsthr.bs_version == 2 else GATT_CHARS_V1
+        chars = []
+        for service in client.services:
+            if service.uuid == GATT_SOC_SERVICE:
+                _bsthr.bs_soc = str(service.description)
+            for char in service.characteristics:
+                if "read" in char.properties and (_fulldump or char.uuid in wanted):
+                    chars.append((service, char))
+        values = await asyncio.gather(*(readchar(client, char.uuid) for service, char in chars))
+        for (service, char), value in zip(chars, values):
+            if char.uuid in wanted and isinstance(value, bytes):
+                setattr(_bsthr, wanted[char.uuid], str(value.decode("utf-8", errors="replace")))
+        _bsthr.publish()
+        if not _fulldump or not isdebug():
+            return
+        descs = [descriptor for service, char in chars for descriptor in char.descriptors]
+        descvalues = await asyncio.gather(*(readdesc(client, descriptor.handle) for descriptor in descs))
+        descmap = dict(zip([descriptor.handle for descriptor in descs], descvalues))
+        charmap = dict(zip([char.uuid for service, char in chars], values))
+        for service in client.services:
+            logging.debug("%s[Service] %s: %s", _bsthr.label, service.uuid, service.description)
+            for char in service.characteristics:
+                logging.debug("%s \t[Characteristic] %s: (%s) | Name: %s, Value: %s ", _bsthr.label,
+                              char.uuid, ",".join(char.properties), char.description, charmap.get(char.uuid))
+                for descriptor in char.descriptors:
+                    logging.debug("%s\t\t[Descriptor] %s: (Handle: %s) | Value: %s ", _bsthr.label,
+                                  descriptor.uuid, descriptor.handle, descmap.get(descriptor.handle))
     except Exception as err:
-        logging.debug(_bsthr.label + "BLE Getsvcs exception:" + str(err))
-        pass
+        logging.debug("%sBLE Getsvcs exception:%s", _bsthr.label, err)
+
+
+async def enumerate_gatt(_stations, _fulldump=False):
+    """
+    Async function which reads the GATT characteristics of the Basestations in parallel,
+    bounded by the BLE radio concurrency
+    :param _stations:
+    :param _fulldump:
+    """
+    await asyncio.gather(*(maininst.bleengine.arbiter.run(getsvcs(bsthr, _fulldump)) for bsthr in _stations),
+                         return_exceptions=True)
+
+
+async def validatecached(_stations):
+    """
+    Async function which connects to the Basestations paired from the discovery cache
+    The connections stay in the pool for the first keepalive, stale entries are dropped
+    :param _stations:
+    :return: list of the Basestations that could not be reached
+    """
+    async def validateone(_bsthr):
+        try:
+            await maininst.bleengine.arbiter.run(maininst.bleengine.pool.get(_bsthr.mac))
+            logging.info(_bsthr.label + " cached MAC validated: " + _bsthr.mac)
+            return None
+        except Exception as err:
+            logging.info(_bsthr.label + " cached MAC " + _bsthr.mac + " not reachable: " + str(err))
+            return _bsthr
+
+    failed = await asyncio.gather(*(validateone(bsthr) for bsthr in _stations))
+    return [bsthr for bsthr in failed if bsthr is not None]
+
+
+def validate_discovery_cache(_stations, _systray):
+    """
+    Validate the cached Basestations in the background, run a full discovery if any of them is stale
+    :param _stations:
+    :param _systray:
+    """
+    def on_validated(_future):
+        try:
+            failed = _future.result()
+        except Exception as err:
+            logging.debug("Discovery cache validation exception: " + str(err))
+            return
+        for bsthr in _stations:
+            if bsthr in failed:
+                maininst.discache.drop(bsthr.sn)
+            else:
+                maininst.discache.put(bsthr)
+        maininst.discache.save()
+        if failed:
+            logging.info("Discovery cache stale, running discovery for the missing Basestations")
+            threading.Thread(target=rediscover).start()
+
+    def rediscover():
+        maininst.discovery.join()
+        call_bs_discovery(_systray, True)
+
+    maininst.bleengine.submit(validatecached(_stations)).add_done_callback(on_validated)
 
 
 def do_nothing(systray):
@@ -1458,27 +3269,32 @@ def do_nothing(systray):
     pass
 
 
-def call_bs_discovery(systray):
+def call_bs_discovery(systray, _usecache=False):
     """
     Run the bs_discovery function in its own thread
+    :param systray:
+    :param _usecache: pair the Basestations from the discovery cache, a full scan runs only on a miss
     :rtype: object
     """
     try:
         if not maininst.discovery.is_alive():
-            maininst.discovery = threading.Thread(target=bs_discovery, args=(systray,))
+            maininst.discovery = threading.Thread(target=bs_discovery, args=(systray, _usecache))
             maininst.discovery.start()
     except Exception as err:
         logging.debug("Exception on call bs_discovery: " + str(err))
-        maininst.discovery = threading.Thread(target=bs_discovery, args=(systray,))
+        maininst.discovery = threading.Thread(target=bs_discovery, args=(systray, _usecache))
         maininst.discovery.start()
     #bs_discovery(systray)
 
 
-def bs_discovery(systray):
+def bs_discovery(systray, _usecache=False):
     """
     Function for the system tray menu to trigger a new BS discovery
     The serial numbers are loaded from the Lighthouse DB and then a BLE discovery is run
+    With _usecache the Basestations found in the discovery cache are paired right away
+    and validated in the background, the BLE scan runs only for the missing ones
     :param systray:
+    :param _usecache:
     :return:
     """
 
@@ -1491,243 +3307,277 @@ def bs_discovery(systray):
             _thisbs.setpairing(_base_list[0], int(_base_list[2]))
         logging.info("Found " + _thisbs.label + ": v" + str(_thisbs.bs_version) + " MAC=" + str(
             _thisbs.mac) + " ID=" + _thisbs.getsnhx())
-        while maininst.blelock:
-            time.sleep(0.2)
-        maininst.blelock = True
-        try:
-            scanloop.run_until_complete(getsvcs(_thisbs, scanloop))
-        except Exception as err:
-            logging.debug(_thisbs.label + " Gesvsc failed: " + str(err))
-            pass
-        maininst.blelock = False
+        scanned.append(_thisbs)
 
     try:
-        scanloop = asyncio.new_event_loop()
-        scanloop.set_debug(False)
-        maininst.disco = True
+        maininst.startup.begin("discovery")
+        maininst.setdisco(True)
         bs_paired = 0
         logging.info("Starting Basestations discovery")
 
         maininst.stations.clear()
-        maininst.bs_serials.clear()
-        maininst.bs1thr.setlock(True)
-        maininst.bs2thr.setlock(True)
-
-        logging.debug("Reset serials")
-
-        maininst.bs1thr.setserial(0)
-        maininst.bs2thr.setserial(0)
+        for bsthr in maininst.bsreg.all():
+            bsthr.setlock(True)
 
         logging.debug("Going to read the LH DB file")
 
         try:
-            with open(maininst.lh_db_file) as json_file:
-                data = json.loads(json_file.read())
-                # known = data['known_universes']
-                try:
-                    maininst.bs1thr.setserial(data['known_universes'][0]['base_stations'][0]['base_serial_number'])
-                    logging.info("Found BS1 serial in DB: " + maininst.bs1thr.getsnhx())
-                    bs_paired += 1
-                except Exception:
-                    logging.info("Not Found BS1 serial in DB")
-                try:
-                    maininst.bs2thr.setserial(data['known_universes'][0]['base_stations'][1]['base_serial_number'])
-                    logging.info("Found BS2 serial in DB: " + maininst.bs2thr.getsnhx())
-                    bs_paired += 1
-                except Exception:
-                    logging.info("Not Found BS2 serial in DB")
-            json_file.close()
+            bs_serials = maininst.lhdb.getserials()
+            if not bs_serials:
+                logging.info("Not Found BS serials in DB")
         except Exception as err:
-            logging.error("Error parsing LightHouse DB JSON file: " + str(err))
-            toast_err("Error parsing LightHouse DB JSON file: " + str(err))
-            try:
-                json_file.close()
-            except Exception:
-                logging.error("Error closing LightHouse DB JSON file, wrong path?")
-                toast_err("Error closing LightHouse DB JSON file, wrong path?")
+            if isinstance(err, OSError):
+                err_msg = "Error opening LightHouse DB JSON file, wrong path? " + str(err)
+            else:
+                err_msg = "Error parsing LightHouse DB JSON file: " + str(err)
+            logging.error(err_msg)
+            toast_err(err_msg)
+            # the file may be rewritten by SteamVR right now, keep the Basestations already registered
+            maininst.setdisco(False)
+            for bsthr in maininst.bsreg.all():
+                bsthr.setlock(False)
+            return
+        maininst.bs_serials.clear()
+        maininst.bs_serials.extend(bs_serials)
+
+        logging.debug("Reset serials")
+
+        for bsthr, serial in zip(maininst.bsreg.sync(maininst.bs_serials), maininst.bs_serials):
+            bsthr.setlock(True)
+            bsthr.setserial(0)
+            bsthr.setserial(serial)
+            logging.info("Found " + bsthr.label + " serial in DB: " + bsthr.getsnhx())
+            bs_paired += 1
+            entry = maininst.discache.get(serial) if _usecache else None
+            if entry is not None:
+                maininst.discache.apply(bsthr, entry)
+                logging.info("Found " + bsthr.label + " in discovery cache: v" + str(bsthr.bs_version) + " MAC=" +
+                             str(bsthr.mac) + " ID=" + bsthr.getsnhx())
         if bs_paired == 0:
             logging.error("Use Pitool to pair at least one Basestation with the Headset")
             toast_err("Use Pitool to pair at least one Basestation with the Headset")
+            maininst.setdisco(False)
             return
-        logging.debug("Starting BLE discovery...")
+        cached = [bsthr for bsthr in maininst.bsreg.all() if len(bsthr.mac) > 0]
+        scanned = []
+        missing = [bsthr for bsthr in maininst.bsreg.all() if len(bsthr.mac) < 1]
+        disco_retries = 0
+        if missing:
+            logging.debug("Starting BLE discovery...")
+            maininst.startup.begin("scan")
         try:
-            while maininst.blelock:
-                time.sleep(0.2)
-            maininst.blelock = True
-            disco_retries = 0
-            while len(maininst.stations) < bs_paired:
+            while missing:
                 disco_retries += 1
                 logging.info("BLE Discovery scan number: " + str(disco_retries))
-                scanloop.run_until_complete(basescan())
-                time.sleep(4)
+                wanted = [bsthr.getshortsnhx() for bsthr in missing]
+                maininst.bleengine.run_sync(maininst.bleengine.arbiter.run(basescan(wanted)))
+                for base in maininst.stations:
+                    base_list = base.split(" ")
+                    for bsthr in missing:
+                        if len(bsthr.mac) < 1 and re.search(r'(' + bsthr.getshortsnhx() + ')$', base_list[1].upper()):
+                            logging.debug("Add BS: " + str(bsthr.getshortsnhx()))
+                            addbs(bsthr, base)
+                missing = [bsthr for bsthr in missing if len(bsthr.mac) < 1]
+                if not missing:
+                    break
                 if disco_retries > 19:
                     err_msg = "Couldn't find all Basestations, found " + str(
-                        len(maininst.stations)) + " expected " + str(bs_paired)
+                        bs_paired - len(missing)) + " expected " + str(bs_paired)
                     logging.info(err_msg)
                     toast_err(err_msg)
                     break
-            maininst.blelock = False
-            logging.info("Found BS count via BLE Discovery: " + str(len(maininst.stations)))
-            if len(maininst.stations) > 0:
-                for base in maininst.stations:
-                    base_list = base.split(" ")
-                    if re.search(r'(' + maininst.bs1thr.getshortsnhx() + ')$', base_list[1].upper()):
-                        logging.debug("Add BS: " + str(maininst.bs1thr.getshortsnhx()))
-                        addbs(maininst.bs1thr, base)
-                    if re.search(r'(' + maininst.bs2thr.getshortsnhx() + ')$', base_list[1].upper()):
-                        logging.debug("Add BS: " + str(maininst.bs2thr.getshortsnhx()))
-                        addbs(maininst.bs2thr, base)
+                time.sleep(4)
+            if disco_retries > 0:
+                maininst.startup.end("scan")
+                logging.info("Found BS count via BLE Discovery: " + str(len(maininst.stations)))
+            if scanned:
+                try:
+                    with maininst.startup.phase("gatt"):
+                        maininst.bleengine.run_sync(enumerate_gatt(scanned, maininst.dump_gatt))
+                except Exception as err:
+                    logging.debug("Gesvsc failed: " + str(err))
+                for bsthr in scanned:
+                    maininst.discache.put(bsthr)
+                maininst.discache.save()
         except Exception as err:
-            maininst.blelock = False
-            maininst.disco = False
+            maininst.setdisco(False)
             logging.error("BLE discovery exception: " + str(err))
             toast_err("BLE Discovery exception: " + str(err))
-        time.sleep(maininst.bs_disco_sleep)
-        scanloop.close()
-        maininst.disco = False
-        maininst.bs1thr.setlock(False)
-        time.sleep(1)
-        maininst.bs2thr.setlock(False)
+        if disco_retries > 0:
+            time.sleep(maininst.bs_disco_sleep)
+        if cached:
+            validate_discovery_cache(cached, systray)
+        maininst.setdisco(False)
+        for bsthr in maininst.bsreg.all():
+            bsthr.setlock(False)
+        maininst.startup.end("discovery")
         logging.info("Basestations discovery done")
     except Exception as err:
-        scanloop.close()
-        maininst.disco = False
-        maininst.blelock = False
+        maininst.setdisco(False)
         logging.error("Main discovery exception: " + str(err))
         toast_err("Main discovery exception: " + str(err))
 
 
+def lhdb_changed(_serials, _systray):
+    """
+    Callback of the LightHouse DB watch, run a discovery to sync the registry with the new serial numbers
+    :param _serials:
+    :param _systray:
+    :return: False if a discovery is already running, the watch calls again on the next check
+    """
+    if maininst.get_quit_main():
+        return True
+    if _serials == maininst.bs_serials:
+        return True
+    if maininst.disco or (maininst.discovery is not None and maininst.discovery.is_alive()):
+        return False
+    logging.info("LightHouse DB changed, running discovery for " + str(len(_serials)) + " Basestations")
+    call_bs_discovery(_systray, True)
+    return True
+
+
 def on_quit_callback(systray):
     """
     Function for the system tray menu to set the quit main loop and trigger the program shutdown
     :param systray:
     """
-    if maininst.bs1thr or maininst.bs2thr:
-        maininst.setstandby()
-    maininst.quit_main = True
+    if len(maininst.bsreg) > 0:
+        maininst.quitfuture = maininst.setstandby(maininst.bs_quit_timeout)
+    if maininst.quitfuture is not None:
+        maininst.quitfuture.add_done_callback(lambda _future: maininst.setquit())
+    else:
+        maininst.setquit()
 
 
-def updatepaneldata():
-    # self.status = {("ciao", "mondo"), ("ecco", "mano")}
-    # self.data = [[str(k)] + list(v) for k, v in self.status]
+def getpanelrows(_snapshots):
+    """
+    Build the status panel rows from the status bus snapshots
+    :param _snapshots:
+    :return: list of rows [index, item, characteristic, value]
+    """
+    rows = []
+
+    def addrow(r1, r2, r3):
+        rows.append([str(len(rows)), r1, r2, str(r3)])
+
+    addrow("Dashboard", "Status", maininst.panelupdate)
+    addrow("", "", "")
+    for hs in [snap for snap in _snapshots if isinstance(snap, HeadsetSnapshot)]:
+        addrow("Headset", "", "")
+        addrow("", "Status", hs.status)
+        if len(hs.vendor) > 0:
+            addrow("", "Vendor", hs.vendor)
+        if len(hs.product) > 0:
+            addrow("", "Product", hs.product)
+    for radio in [snap for snap in _snapshots if isinstance(snap, RadioSnapshot)]:
+        addrow("BLE radio", "", "")
+        addrow("", "Slots", radio.slots)
+        addrow("", "Wait time", radio.wait)
+    for bs in [snap for snap in _snapshots if isinstance(snap, StationSnapshot)]:
+        addrow("Basestation " + bs.label, "", "")
+        addrow("", "Status", bs.status)
+        addrow("", "Mode", bs.mode)
+        addrow("", "State", bs.state)
+        if bs.next is not None:
+            addrow("", "Next", bs.next)
+        if len(bs.serial) > 0:
+            addrow("", "Serial Hex", bs.snhx.upper()[-8:])
+            addrow("", "Serial Integer", bs.serial)
+        if len(bs.mac) > 0:
+            addrow("", "Connected", bs.connected)
+            addrow("", "Version", "v" + str(bs.version))
+            addrow("", "MAC", bs.mac)
+            addrow("", "Disconnections", bs.disconnects)
+            if bs.connection is not None:
+                addrow("", "Connection", bs.connection)
+            addrow("", "Last errors", bs.errors)
+            if len(bs.errclasses) > 0:
+                addrow("", "Errors by class", bs.errclasses)
+            if len(bs.lasterr) > 0:
+                addrow("", "Last error", "at " + bs.lasterr)
+            if len(bs.model) > 0:
+                addrow("", "Model", bs.model)
+            if len(bs.manufacturer) > 0:
+                addrow("", "Manufacturer", bs.manufacturer)
+            if len(bs.soc) > 0:
+                addrow("", "Chipset", bs.soc)
+            if len(bs.fw) > 0:
+                addrow("", "Firmware", bs.fw)
+            if len(bs.fw2) > 0:
+                addrow("", "", bs.fw2)
+    return rows
+
+
+def gettraylabel(_snapshots):
+    """
+    Build the system tray hover text from the status bus snapshots, Headset first then the Basestations
+    :param _snapshots:
+    :return:
+    """
+    labels = [snap.tray for snap in _snapshots if isinstance(snap, HeadsetSnapshot)]
+    labels += [snap.tray for snap in _snapshots if isinstance(snap, StationSnapshot)]
+    return " ".join(labels)
 
-    try:
-        while True:
-            if maininst.get_quit_main():
-                break
-            time.sleep(1)
-            if logthr.frame.IsShown():
-
-                idx = 0
-                status = {}
-
-                def addstatus( r1, r2 , r3, status, idx):
-                    nstatus = {}
-                    nstatus[idx] = r1, r2, r3
-                    status.update(nstatus)
-                    idx += 1
-                    return idx
-
-                def addstatusbs(thisbs, status, idx):
-                    idx = addstatus("Basestation " + thisbs.label, "", "", status, idx)
-                    idx = addstatus("", "Status", str(thisbs.getstatus()), status, idx)
-                    idx = addstatus("", "Mode", str(thisbs.mode), status, idx)
-                    if len(thisbs.getserial()) > 0:
-                        idx = addstatus("", "Serial Hex", str(thisbs.getsnhx()).upper()[-8:], status, idx)
-                        idx = addstatus("", "Serial Integer", str(thisbs.getserial()), status, idx)
-                    if len(thisbs.getmac()) > 0:
-                        idx = addstatus("", "Connected", str(thisbs.is_connected()), status, idx)
-                        idx = addstatus("", "Version", "v" + str(thisbs.bs_version), status, idx)
-                        idx = addstatus("", "MAC", str(thisbs.getmac()), status, idx)
-                        idx = addstatus("", "Disconnections", str(thisbs.bs_disconnects), status, idx)
-                        idx = addstatus("", "Last errors", str(len(thisbs.errque)) + " in " + str(thisbs.toomanysecs)
-                                        + " seconds", status, idx)
-                        if len(thisbs.getlasterrsecs()) > 0:
-                            idx = addstatus("", "Last error", str(thisbs.getlasterrsecs()) + " seconds ago", status, idx)
-                        if len(thisbs.bs_model) > 0:
-                            idx = addstatus("", "Model", str(thisbs.bs_model), status, idx)
-                        if len(thisbs.bs_manufacturer) > 0:
-                            idx = addstatus("", "Manufacturer", str(thisbs.bs_manufacturer), status, idx)
-                        if len(thisbs.bs_soc) > 0:
-                            idx = addstatus("", "Chipset", str(thisbs.bs_soc), status, idx)
-                        if len(thisbs.bs_fw) > 0:
-                            idx = addstatus("", "Firmware", str(thisbs.bs_fw), status, idx)
-                        if len(thisbs.bs_fw2) > 0:
-                            idx = addstatus("", "", str(thisbs.bs_fw2), status, idx)
-                    return idx
-
-                idx = addstatus("Dashboard", "Status", maininst.panelupdate, status, idx)
-                idx = addstatus("", "", "", status, idx)
-                idx = addstatus("Headset", "", "", status, idx)
-                idx = addstatus("", "Status", str(maininst.hsthr.getstatus()), status, idx)
-                if len(maininst.hsthr.hs_vendor) > 0:
-                    idx = addstatus("", "Vendor", str(maininst.hsthr.hs_vendor), status, idx)
-                if len(maininst.hsthr.hs_product) > 0:
-                    idx = addstatus("", "Product", str(maininst.hsthr.hs_product), status, idx)
-                idx = addstatusbs(maininst.bs1thr, status, idx)
-                idx = addstatusbs(maininst.bs2thr, status, idx)
-                maininst.panelstatus = status
-                try:
-                    status = sorted(status.items())
-                    maininst.paneldata = [[str(k)] + list(v) for k, v in status]
-                    #time.sleep(0.2)
-                    logthr.frame.model = StatusModel(maininst.paneldata)
-                    logthr.frame.dvc.AssociateModel(logthr.frame.model)
-                    #time.sleep(0.2)
-                    maininst.panelupdate = "Updating"
-                    logthr.frame.dvc.Refresh()
-                    #logging.debug("Panel update=" + str(status))
-                except Exception as err:
-                    if not maininst.quit_main:
-                        toast_err("Update panel inner thread exception: " + str(err))
-                        logging.debug("Panel inner closed: " + str(err))
-                        maininst.panelupdate = "Error"
-                        logthr.frame.model = StatusModel(maininst.get_dashboard_except())
-                        logthr.frame.dvc.AssociateModel(logthr.frame.model)
-                        #logthr.frame.dvc.Refresh()
-                    pass
-    except Exception as err:
-        if not maininst.quit_main:
-            logging.debug("Panel inner exception: " + str(err))
-            toast_err("Update panel thread exception: " + str(err))
-            maininst.panelupdate = "Error"
-            logthr.frame.model = StatusModel(maininst.get_dashboard_except())
-            logthr.frame.dvc.AssociateModel(logthr.frame.model)
-            #logthr.frame.dvc.Refresh()
 
+class TrayStatus:
+
+    def __init__(self, _systray, _bus):
+        """
+        Status bus subscriber updating the system tray hover text, only when the text changes
+        :param _systray:
+        :param _bus:
+        """
+        self.systray = _systray
+        self.bus = _bus
+        self.lock = threading.Lock()
+        self.label = None
+        self.bus.subscribe(self.onstatus)
+        self.onstatus(None, None)
+
+    def onstatus(self, _topic, _snapshot):
+        """
+        Status bus callback
+        :param _topic:
+        :param _snapshot:
+        """
+        label = gettraylabel(self.bus.getall())
+        with self.lock:
+            if label == self.label:
+                return
+            self.label = label
+        self.systray.update(hover_text=label)
 
-def getpaneldata():
-    return maininst.paneldata
 
 def toast_err(_msg):
     """
     Function to display the error message as a Windows 10 toast notification
     :param _msg:
     """
-    toaster.show_toast("PIMAX_BSAW",
-                       _msg,
-                       icon_path=maininst.tray_icon,
-                       duration=5,
-                       threaded=True)
-    while toaster.notification_active():
-        time.sleep(0.1)
+    maininst.toast_err(_msg)
 
 
-def main(_logger):
+def main(_logger, _argv=None):
     """
     Main loop for the program
     :param _logger:
+    :param _argv: command line arguments, sys.argv if None
     """
+    maininst.startup.end("import")
     try:
         parser = argparse.ArgumentParser()
         parser.add_argument("--debug_ignore_usb", help="Disable the USB search for headset", action="store_true")
         parser.add_argument("--debug_logs", help="Enable DEBUG level logs", action="store_true")
         parser.add_argument("--version", help="Print version", action="store_true")
+        parser.add_argument("--dump_gatt", help="Dump all the BS GATT services in DEBUG logs", action="store_true")
+        parser.add_argument("--startup_timing", help="Dump the startup phases timing as JSON in this file",
+                            metavar="FILE", default="")
 
-        args = parser.parse_args()
+        args = parser.parse_args(_argv)
 
         maininst.debug_bypass_usb = args.debug_ignore_usb
         maininst.debug_logs = args.debug_logs
+        maininst.dump_gatt = args.dump_gatt
+        maininst.startup_file = args.startup_timing
 
         if args.version:
             toast_err("Version: " + str(maininst.version))
@@ -1746,7 +3596,7 @@ def main(_logger):
         h.setFormatter(log_formatter)
         h.setLevel(maininst.MIN_LEVEL)
 
-        wx_handler = WxLogHandler(lambda: logthr.frame)
+        wx_handler = WxLogHandler(maininst.logring)
         wx_handler.setFormatter(log_formatter)
         wx_handler.setLevel(maininst.MIN_LEVEL)
         wx_handler.addFilter(LevelFilter(maininst.MIN_LEVEL))
@@ -1760,63 +3610,74 @@ def main(_logger):
                         ('Version ' + maininst.version, None, do_nothing)
                         )
 
-        with SysTrayIcon(maininst.tray_icon, "Initializing...", menu_options, on_quit=on_quit_callback) as systray:
+        maininst.startup.begin("gui")
+        if maininst.tray_factory is None:
+            from infi.systray import SysTrayIcon
+            maininst.tray_factory = SysTrayIcon
+
+        with maininst.tray_factory(maininst.tray_icon, "Initializing...", menu_options,
+                                   on_quit=on_quit_callback) as systray:
             try:
+                maininst.startup.end("gui")
                 logging.info("Pimax_BSAW Version: " + maininst.version)
-                maininst.settoaster(toaster)
-                maininst.load_configuration(toaster)
+                with maininst.startup.phase("config"):
+                    maininst.load_configuration(maininst.toaster)
                 if maininst.get_quit_main():
                     raise Exception("Exiting due to configuration file load error")
                 logging.info("Configuration loaded")
+                if maininst.panel_preload:
+                    with maininst.startup.phase("panel"):
+                        loadpanel()
+
+                with maininst.startup.phase("engine"):
+                    bleengine = BleEngine(maininst)
+                    maininst.setengine(bleengine)
+                    bleengine.start()
 
-                bs1thr = BaseStations(maininst.bs1_label, maininst, maininst.bs_timeout_in_sec)
-                bs2thr = BaseStations(maininst.bs2_label, maininst, maininst.bs_timeout_in_sec)
                 hsthr = HeadSet(maininst.hs_label, maininst)
-                maininst.set_threads(systray, hsthr, bs1thr, bs2thr, logthr)
+                maininst.set_threads(systray, hsthr, maininst.logthr)
                 logging.debug("Threads initialized")
 
-                tray_label = hsthr.gettray() + " " + bs1thr.gettray() + " " + bs2thr.gettray()
-                systray.update(hover_text=tray_label)
+                TrayStatus(systray, maininst.statusbus)
 
                 hsthr.start()
 
-                updatethr = threading.Thread(target=updatepaneldata, args=())
-                updatethr.start()
-
-                maininst.discovery = threading.Thread(target=bs_discovery, args=(systray,))
+                maininst.discovery = threading.Thread(target=bs_discovery, args=(systray, True))
                 maininst.discovery.start()
                 maininst.discovery.join()
 
-                time.sleep(3)
-
                 logging.debug("Starting threads")
-                bs1thr.start()
-                time.sleep(1)
-                bs2thr.start()
+                maininst.bsreg.startall()
+                maininst.lhdb.watch(maininst.lh_db_watch, maininst.quitevent,
+                                    lambda _serials: lhdb_changed(_serials, systray))
                 logging.debug("Threads started")
 
                 while True:
                     if maininst.quit_main:
                         logging.debug("Quit main_loop, waiting for threads exiting")
+                        if maininst.quitfuture is not None:
+                            try:
+                                maininst.quitfuture.result(maininst.bs_quit_timeout + 1)
+                            except Exception as err:
+                                logging.debug("Quit main_loop, standby not completed: " + str(err))
                         timeref = time.time()
-                        while hsthr.is_alive() or bs1thr.is_alive() or bs2thr.is_alive():
+                        while hsthr.is_alive() or any(bsthr.is_alive() for bsthr in maininst.bsreg.all()):
                             time.sleep(0.1)
                             if time.time() - timeref > 5:
                                 break
+                        bleengine.stop()
+                        if not maininst.startup.saved:
+                            maininst.startup.save(maininst.startup_file)
                         logging.debug("Quit main_loop, systray status=" + str(maininst.quit_main))
                         break
 
-                    tray_label = hsthr.gettray() + " " + bs1thr.gettray() + " " + bs2thr.gettray()
-                    systray.update(hover_text=tray_label)
-
                     if not hsthr.is_alive():
                         raise Exception(hsthr.label + " thread has crashed!")
-                    if not bs1thr.is_alive():
-                        raise Exception(bs1thr.label + " thread has crashed!")
-                    if not bs2thr.is_alive():
-                        raise Exception(bs1thr.label + " thread has crashed!")
+                    for bsthr in maininst.bsreg.all():
+                        if not bsthr.is_alive():
+                            raise Exception(bsthr.label + " thread has crashed!")
 
-                    time.sleep(1)
+                    maininst.quitevent.wait(1)
 
             except Exception as err:
                 if not maininst.quit_main:
@@ -1832,7 +3693,5 @@ def main(_logger):
 
 
 if __name__ == "__main__":
-    toaster = ToastNotifier()
     maininst = MainObj()
-    logthr = runlogthread()
-    main(logger)
+    main(logging.getLogger("bleak"))
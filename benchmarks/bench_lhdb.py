@@ -0,0 +1,131 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# LightHouse DB parse benchmark: time and peak Python memory to pull the Basestation serial numbers out of
+# Lighthouse DB files with a growing number of universes, each one with its calibration data
+#   json       json.load of the whole file, the former discovery code
+#   stream     LighthouseDB.parse, ijson if installed or the built-in incremental parser
+#
+#   python benchmarks/bench_lhdb.py
+#   python benchmarks/bench_lhdb.py --universes 10 100 1000 --calibration 500
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+
+def writedb(_filename, _universes, _calibration):
+    """
+    Write a Lighthouse DB with _universes universes, each with _calibration rows of calibration data
+    :param _filename:
+    :param _universes:
+    :param _calibration:
+    """
+    rnd = random.Random(1)
+    with open(_filename, "w") as json_file:
+        json_file.write('{"known_universes": [')
+        for idx in range(_universes):
+            universe = {"base_stations": [{"base_serial_number": rnd.randint(1, 0xffffffff),
+                                           "dynamic": {"angles": [rnd.random() for _ in range(16)]}}
+                                          for _ in range(2)],
+                        "calibration": [[rnd.random() for _ in range(8)] for _ in range(_calibration)],
+                        "universe_id": 1000000 + idx}
+            json_file.write((", " if idx else "") + json.dumps(universe))
+        json_file.write('], "revision": 1}')
+
+
+def withjson(_filename):
+    """
+    Former code: load the whole file and pick the serial numbers
+    :param _filename:
+    :return:
+    """
+    with open(_filename) as json_file:
+        data = json.load(json_file)
+    return dict((str(universe["universe_id"]), [base_station["base_serial_number"]
+                                                for base_station in universe["base_stations"]])
+                for universe in data["known_universes"])
+
+
+def withstream(_filename):
+    return dict(bsaw.LighthouseDB(_filename).parse())
+
+
+def measure(_func, _filename):
+    """
+    Return the result, seconds and peak traced memory in bytes of _func(_filename)
+    The time is taken from a run without tracemalloc, which slows down the allocations
+    :param _func:
+    :param _filename:
+    :return:
+    """
+    t_start = time.perf_counter()
+    result = _func(_filename)
+    elapsed = time.perf_counter() - t_start
+    tracemalloc.start()
+    _func(_filename)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--universes", help="Universe counts to run", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--calibration", help="Calibration rows in each universe", type=int, default=200)
+    parser.add_argument("--json", help="Write the report as JSON in this file", default="")
+    args = parser.parse_args()
+
+    try:
+        import ijson
+        backend = "ijson " + getattr(ijson, "backend", "")
+    except ImportError:
+        backend = "built-in"
+
+    workdir = tempfile.mkdtemp(prefix="bsaw_lhdb_")
+    results = []
+    try:
+        print("stream parser: " + backend)
+        print("%9s %9s %10s %10s %12s %12s" % ("universes", "file MB", "json s", "stream s", "json MB",
+                                               "stream MB"))
+        for universes in args.universes:
+            filename = os.path.join(workdir, "lighthousedb.json")
+            writedb(filename, universes, args.calibration)
+            expected, t_json, m_json = measure(withjson, filename)
+            found, t_stream, m_stream = measure(withstream, filename)
+            if found != expected:
+                raise Exception("Serial numbers differ with " + str(universes) + " universes")
+            result = {"universes": universes, "file_mb": os.path.getsize(filename) / 1048576.0,
+                      "json_s": t_json, "stream_s": t_stream,
+                      "json_mb": m_json / 1048576.0, "stream_mb": m_stream / 1048576.0}
+            results.append(result)
+            print("%9d %9.1f %10.3f %10.3f %12.2f %12.2f" % (
+                universes, result["file_mb"], t_json, t_stream, result["json_mb"], result["stream_mb"]))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"backend": backend, "calibration": args.calibration, "results": results}, json_file,
+                      indent=2)
@@ -0,0 +1,130 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Logging microbenchmark: cost of one keepalive iteration of a Basestation (command lookup and the debug
+# lines of bs_loop and bs_pre_action) at INFO and DEBUG level
+#   eager      the former style, messages concatenated and the frame rebuilt and hexlified before logging.debug
+#   lazy       the current code, % arguments and precomputed frames
+#   no logs    the current code with logging disabled, the floor
+# The logging overhead at INFO is lazy minus no logs, it should be close to zero
+#
+#   python benchmarks/bench_logging.py
+#   python benchmarks/bench_logging.py --iterations 200000 --repeat 7
+
+import argparse
+import binascii
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+
+class DropHandler(logging.Handler):
+
+    def __init__(self):
+        """
+        Logging handler formatting the records and dropping them
+        """
+        logging.Handler.__init__(self)
+        self.setFormatter(logging.Formatter("%(asctime)s %(levelname)s (%(module)s): %(message)s", "%H:%M:%S"))
+
+    def emit(self, record):
+        self.format(record)
+
+
+def eager(_bsthr):
+    """
+    One iteration in the former style
+    :param _bsthr:
+    """
+    logging.debug(_bsthr.label + " build cmd for action=" + _bsthr.action)
+    logging.debug(_bsthr.label + " prebuild_cmd=" + _bsthr.action)
+    cmd = _bsthr.build_2_bs_ble_cmd(_bsthr.action)
+    logging.debug(_bsthr.label + " build2 action:" + _bsthr.action + " MAC=" + _bsthr.mac + " BLE CMD : " +
+                  str(binascii.hexlify(cmd)))
+    logging.debug(_bsthr.label + " MAC=" + _bsthr.mac + " BLE CMD : " + str(binascii.hexlify(cmd)) +
+                  " UUID: " + _bsthr.bs_cmd_ble_id)
+    logging.debug(_bsthr.label + " sending cmd for action=" + _bsthr.action + " next=" + _bsthr.action)
+    return cmd
+
+
+def lazy(_bsthr):
+    """
+    One iteration with the current code
+    :param _bsthr:
+    """
+    cmd, prevact, nextact = _bsthr.bs_pre_action()
+    logging.debug("%s sending cmd for action=%s next=%s", _bsthr.label, prevact, nextact)
+    return cmd
+
+
+def measure(_func, _bsthr, _iterations, _repeat):
+    """
+    Return the best time of _repeat runs in ns per iteration
+    :param _func:
+    :param _bsthr:
+    :param _iterations:
+    :param _repeat:
+    :return:
+    """
+    best = None
+    for run in range(_repeat):
+        t_start = time.perf_counter()
+        for idx in range(_iterations):
+            _func(_bsthr)
+        elapsed = time.perf_counter() - t_start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e9 / _iterations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", help="Iterations for each run", type=int, default=100000)
+    parser.add_argument("--repeat", help="Runs for each case, the best is reported", type=int, default=5)
+    parser.add_argument("--json", help="Write the report as JSON in this file", default="")
+    args = parser.parse_args()
+
+    # the records go through a handler that formats them like the real ones and drops the result
+    logging.root.addHandler(DropHandler())
+    logging.root.setLevel(logging.INFO)
+
+    bsaw.maininst = bsaw.MainObj()
+    bsthr = bsaw.BaseStations("BS1", bsaw.maininst, 60)
+    bsthr.setserial(0x1c2d3e4f)
+    bsthr.setpairing("AA:BB:CC:DD:EE:01", 1)
+    bsthr.action = "Ping"
+
+    result = {}
+    for levelname in ("INFO", "DEBUG"):
+        logging.root.setLevel(getattr(logging, levelname))
+        result[levelname] = {"eager": measure(eager, bsthr, args.iterations, args.repeat),
+                             "lazy": measure(lazy, bsthr, args.iterations, args.repeat)}
+    logging.disable(logging.CRITICAL)
+    floor = measure(lazy, bsthr, args.iterations, args.repeat)
+    logging.disable(logging.NOTSET)
+    for levelname in result:
+        result[levelname]["no logs"] = floor
+
+    print("%-8s %12s %12s %12s %14s" % ("level", "eager ns", "lazy ns", "no logs ns", "lazy overhead"))
+    for levelname, times in result.items():
+        print("%-8s %12.0f %12.0f %12.0f %14.0f" % (levelname, times["eager"], times["lazy"], times["no logs"],
+                                                    times["lazy"] - times["no logs"]))
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"iterations": args.iterations, "repeat": args.repeat, "ns": result}, json_file, indent=2)
@@ -0,0 +1,272 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Scale benchmark: runs the manager core (discovery, Basestations keepalive, Headset, status bus, log ring and
+# a panel consumer) against simulated Basestations, one fresh process for each station count
+# Time is accelerated by --speedup: the keepalive period, the Basestation timeout and its margin, the scheduler
+# stagger, the BLE latency and the v1 timeout of the simulated Basestations are divided by it, so --duration 36
+# --speedup 100 covers one simulated hour of keepalives with the same radio load
+# Reported for each station count:
+#   cmd p50/p95/p99   Wakeup/Standby broadcast latency per Basestation (wall ms), every --toggle seconds,
+#                     it is the manager overhead and the radio queueing, each BLE write takes --latency/--speedup
+#   late p50/p99      keepalive lateness, interval between two consecutive Pings minus the period (simulated s),
+#                     over the last commands of each Basestation kept in its bounded log
+#   standby           Basestations that went to standby at least once because their timeout expired, any is a
+#                     missed keepalive
+#   cpu %             process CPU over wall time in steady state
+#   cpu/st/h          CPU ms per Basestation per simulated hour
+#   threads           Python threads in steady state
+#   rss MB, growth    resident memory at the end and its growth per simulated hour (KB)
+#
+#   python benchmarks/bench_scale.py
+#   python benchmarks/bench_scale.py --stations 2 8 --duration 36 --speedup 100 --json scale.json
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bsaw_sim
+from bench_startup import writeconfig
+
+
+def getrss():
+    """
+    Return the resident memory in bytes, None if not available
+    :return:
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        return None
+
+
+def percentile(_values, _pct):
+    """
+    Return the _pct percentile of _values, None if empty
+    :param _values:
+    :param _pct:
+    :return:
+    """
+    if not _values:
+        return None
+    values = sorted(_values)
+    return values[min(len(values) - 1, int(round(_pct / 100.0 * (len(values) - 1))))]
+
+
+def child(_args):
+    """
+    One run with _args.stations Basestations in this process, the result is printed as JSON
+    :param _args:
+    """
+    os.chdir(_args.workdir)
+    import Pimax_BSAW as bsaw
+
+    maininst = bsaw.maininst = bsaw.MainObj()
+    radio, headset = bsaw_sim.install(maininst, bsaw_sim.getserials(_args.stations),
+                                      _latency=_args.latency / _args.speedup,
+                                      _droprate=_args.droprate, _seed=1, _timescale=_args.speedup)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    handler = bsaw.WxLogHandler(maininst.logring)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s (%(module)s): %(message)s", "%H:%M:%S"))
+    root.addHandler(handler)
+
+    maininst.load_configuration(maininst.toaster)
+    maininst.bs_disco_sleep = 0
+    period = 25.0 / _args.speedup
+
+    bleengine = bsaw.BleEngine(maininst)
+    maininst.setengine(bleengine)
+    bleengine.scheduler.stagger = bleengine.scheduler.stagger / _args.speedup
+    bleengine.start()
+    hsthr = bsaw.HeadSet(maininst.hs_label, maininst)
+    tray = bsaw_sim.SimTray(maininst.tray_icon, "Initializing...", ())
+    maininst.set_threads(tray, hsthr, None)
+    bsaw.TrayStatus(tray, maininst.statusbus)
+    hsthr.start()
+
+    dirty = threading.Event()
+    maininst.statusbus.subscribe(lambda _topic, _snapshot: dirty.set())
+    panelstats = {"refresh": 0}
+
+    def panel():
+        # same work as the status panel timer: drain the log ring and diff the status rows when changed
+        while not maininst.get_quit_main():
+            time.sleep(0.075)
+            maininst.logring.drain()
+            if dirty.is_set():
+                dirty.clear()
+                bsaw.getpanelrows(maininst.statusbus.getall())
+                panelstats["refresh"] += 1
+
+    threading.Thread(target=panel, daemon=True).start()
+
+    t_disco = time.monotonic()
+    bsaw.bs_discovery(tray, False)
+    t_disco = time.monotonic() - t_disco
+    for bsthr in maininst.bsreg.all():
+        bsthr.bs_loop_sleep = period
+        # the frames built at discovery keep the configured timeout, the simulated radio scales it
+        bsthr.bs_timeout_in_sec = maininst.bs_timeout_in_sec / _args.speedup
+        bsthr.bs_timeout_margin = bsthr.bs_timeout_margin / _args.speedup
+    maininst.bsreg.startall()
+    time.sleep(max(1.0, period * 2))
+
+    latencies = []
+    outcomes = {}
+    rss_start = getrss()
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    threads = threading.active_count()
+    toggles = 0
+    actions = (maininst.setstandby, maininst.setwakeup)
+    while time.monotonic() - wall_start < _args.duration:
+        time.sleep(min(_args.toggle, _args.duration - (time.monotonic() - wall_start)))
+        threads = max(threads, threading.active_count())
+        if time.monotonic() - wall_start >= _args.duration:
+            break
+        future = actions[toggles % 2](_args.toggle)
+        toggles += 1
+        result = future.result(_args.toggle * 2)
+        for outcome in result.outcomes:
+            outcomes[outcome.outcome] = outcomes.get(outcome.outcome, 0) + 1
+            if outcome.outcome == "Done":
+                latencies.append(outcome.latency * 1000)
+    if toggles % 2:
+        maininst.setwakeup(_args.toggle).result(_args.toggle * 2)
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    rss_end = getrss()
+    hours = wall * _args.speedup / 3600.0
+
+    lateness = []
+    for station in radio.stations.values():
+        station.getpower()
+        log = [(t, action) for t, action in station.log if t >= wall_start]
+        lateness += [(b[0] - a[0] - period) * _args.speedup for a, b in zip(log, log[1:])
+                     if a[1] == "Ping" and b[1] == "Ping"]
+
+    maininst.quitfuture = maininst.setstandby(5)
+    try:
+        maininst.quitfuture.result(10)
+    except Exception:
+        pass
+    maininst.setquit()
+    bleengine.stop()
+
+    result = {"stations": _args.stations, "sim_hours": round(hours, 3), "discovery_s": round(t_disco, 3),
+              "cmd_ms": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                         "p99": percentile(latencies, 99)},
+              "late_s": {"p50": percentile(lateness, 50), "p99": percentile(lateness, 99)},
+              "outcomes": outcomes, "pings": len(lateness) + len(radio.stations),
+              "cpu_pct": round(100.0 * cpu / wall, 2),
+              "cpu_ms_station_hour": round(cpu * 1000 / _args.stations / hours, 2) if hours else None,
+              "threads": threads,
+              "rss_mb": None if rss_end is None else round(rss_end / 1048576.0, 1),
+              "rss_growth_kb_hour": None if rss_end is None or not hours else
+              round((rss_end - rss_start) / 1024.0 / hours, 1),
+              "log_lines": len(maininst.logring), "log_dropped": maininst.logring.dropped,
+              "panel_refresh": panelstats["refresh"], "tray_updates": tray.updates,
+              "standby": sum(1 for station in radio.stations.values() if station.expired),
+              "timeouts": sum(station.expired for station in radio.stations.values()),
+              "drops": sum(station.drops for station in radio.stations.values()),
+              "rejected": sum(station.rejected for station in radio.stations.values())}
+    print(json.dumps(result))
+
+
+def runchild(_args, _stations):
+    """
+    Run one station count in a new process and return its result
+    :param _args:
+    :param _stations:
+    :return:
+    """
+    workdir = tempfile.mkdtemp(prefix="bsaw_scale_")
+    try:
+        writeconfig(workdir, _stations)
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", "--workdir", workdir,
+               "--stations", str(_stations), "--duration", str(_args.duration), "--speedup", str(_args.speedup),
+               "--toggle", str(_args.toggle), "--latency", str(_args.latency), "--droprate", str(_args.droprate)]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=None if _args.verbose else subprocess.DEVNULL,
+                              timeout=_args.duration * 4 + 120, universal_newlines=True)
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def fmt(_value, _format="%.1f"):
+    return "-" if _value is None else _format % _value
+
+
+def parent(_args):
+    """
+    Run every station count and print the report
+    :param _args:
+    """
+    results = []
+    print("%8s %7s %8s %8s %8s %8s %8s %8s %7s %9s %7s %7s %9s" % (
+        "stations", "sim h", "cmd p50", "cmd p95", "cmd p99", "late p50", "late p99", "standby", "cpu %",
+        "cpu/st/h", "threads", "rss MB", "growth KB"))
+    for stations in _args.stations:
+        result = runchild(_args, stations)
+        results.append(result)
+        print("%8d %7.2f %8s %8s %8s %8s %8s %8d %7.2f %9s %7d %7s %9s" % (
+            result["stations"], result["sim_hours"], fmt(result["cmd_ms"]["p50"]), fmt(result["cmd_ms"]["p95"]),
+            fmt(result["cmd_ms"]["p99"]), fmt(result["late_s"]["p50"], "%.2f"), fmt(result["late_s"]["p99"], "%.2f"),
+            result["standby"], result["cpu_pct"], fmt(result["cpu_ms_station_hour"]), result["threads"], fmt(result["rss_mb"]),
+            fmt(result["rss_growth_kb_hour"])))
+        sys.stdout.flush()
+    if _args.json:
+        with open(_args.json, "w") as json_file:
+            json.dump({"speedup": _args.speedup, "duration": _args.duration, "latency": _args.latency,
+                       "droprate": _args.droprate, "results": results}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", help="Station counts to run", type=int, nargs="+", default=[2, 8, 32, 128])
+    parser.add_argument("--duration", help="Wall seconds of steady state for each station count", type=float,
+                        default=36)
+    parser.add_argument("--speedup", help="Simulated seconds per wall second", type=float, default=100)
+    parser.add_argument("--toggle", help="Wall seconds between two Standby/Wakeup broadcasts", type=float,
+                        default=3)
+    parser.add_argument("--latency", help="Simulated seconds per BLE operation", type=float, default=0.05)
+    parser.add_argument("--droprate", help="Probability of a simulated BLE operation failing", type=float,
+                        default=0.0)
+    parser.add_argument("--json", help="Write the report as JSON in this file", default="")
+    parser.add_argument("--verbose", help="Show the log output of the runs", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS, action="store_true")
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        args.stations = args.stations[0]
+        child(args)
+    else:
+        parent(args)
@@ -0,0 +1,150 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Cold start benchmark: runs the whole Pimax_BSAW startup against simulated Basestations and headset
+# Every run is a fresh process, the phase timing (import, gui, config, engine, discovery, scan, gatt,
+# first_wakeup) is collected with --startup_timing and the median/min/max of each phase end are reported
+#
+#   python benchmarks/bench_startup.py --stations 2 --runs 5
+#   python benchmarks/bench_startup.py --warm  (discovery cache filled by a first run)
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bsaw_sim
+
+
+def writeconfig(_workdir, _stations):
+    """
+    Write configuration.ini and a Lighthouse DB with _stations Basestations in _workdir
+    :param _workdir:
+    :param _stations:
+    """
+    with open(os.path.join(ROOT, "configuration.ini")) as ini_file:
+        lines = ini_file.read().splitlines()
+    for idx, line in enumerate(lines):
+        if line.startswith("LH_DB_FILE"):
+            lines[idx] = "LH_DB_FILE = " + os.path.join(_workdir, "lighthousedb.json")
+        elif line.startswith("DISCOVERY_CACHE_FILE"):
+            lines[idx] = "DISCOVERY_CACHE_FILE = " + os.path.join(_workdir, "discoverycache.json")
+    with open(os.path.join(_workdir, "configuration.ini"), "w") as ini_file:
+        ini_file.write("\n".join(lines) + "\n")
+    bsaw_sim.writelighthousedb(os.path.join(_workdir, "lighthousedb.json"), bsaw_sim.getserials(_stations))
+
+
+def child(_args):
+    """
+    One startup run in this process, the report is written in _args.report
+    :param _args:
+    """
+    os.chdir(_args.workdir)
+    import Pimax_BSAW as bsaw
+
+    bsaw.maininst = bsaw.MainObj()
+    bsaw.maininst.bs_disco_sleep = _args.disco_sleep
+    bsaw_sim.install(bsaw.maininst, bsaw_sim.getserials(_args.stations), _latency=_args.latency)
+
+    argv = ["--startup_timing", _args.report]
+    mainthr = threading.Thread(target=bsaw.main, args=(logging.getLogger("bleak"), argv))
+    mainthr.start()
+    timeref = time.monotonic()
+    while not bsaw.maininst.startup.saved and time.monotonic() - timeref < _args.timeout:
+        time.sleep(0.01)
+    if bsaw.maininst.systray is not None:
+        bsaw.maininst.systray.quit()
+    mainthr.join(_args.timeout)
+
+
+def parent(_args):
+    """
+    Spawn the runs and print the report
+    :param _args:
+    """
+    keep = tempfile.mkdtemp(prefix="bsaw_bench_")
+    ends = {}
+    try:
+        if _args.warm:
+            writeconfig(keep, _args.stations)
+            runchild(_args, keep)
+        for run in range(_args.runs):
+            workdir = keep if _args.warm else tempfile.mkdtemp(prefix="bsaw_bench_", dir=keep)
+            if not _args.warm:
+                writeconfig(workdir, _args.stations)
+            report = runchild(_args, workdir)
+            for phase in report["phases"]:
+                if phase["end"] is not None:
+                    ends.setdefault(phase["name"], []).append(phase["end"])
+    finally:
+        shutil.rmtree(keep, ignore_errors=True)
+
+    result = {"stations": _args.stations, "runs": _args.runs, "warm": _args.warm,
+              "phases": dict((name, {"median": round(statistics.median(values), 4),
+                                     "min": round(min(values), 4), "max": round(max(values), 4)})
+                             for name, values in ends.items())}
+    print("%-14s %10s %10s %10s" % ("phase end (s)", "median", "min", "max"))
+    for name, stats in result["phases"].items():
+        print("%-14s %10.3f %10.3f %10.3f" % (name, stats["median"], stats["min"], stats["max"]))
+    if "first_wakeup" not in result["phases"]:
+        print("No wakeup recorded, check the logs with --verbose")
+    if _args.json:
+        with open(_args.json, "w") as json_file:
+            json.dump(result, json_file, indent=2)
+
+
+def runchild(_args, _workdir):
+    """
+    Run one startup in a new process and return its report
+    :param _args:
+    :param _workdir:
+    :return:
+    """
+    report = os.path.join(_workdir, "startup.json")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--workdir", _workdir, "--report", report,
+           "--stations", str(_args.stations), "--latency", str(_args.latency),
+           "--disco_sleep", str(_args.disco_sleep), "--timeout", str(_args.timeout)]
+    subprocess.run(cmd, stdout=None if _args.verbose else subprocess.DEVNULL,
+                   stderr=None if _args.verbose else subprocess.DEVNULL, timeout=_args.timeout * 2)
+    with open(report) as json_file:
+        return json.load(json_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", help="Simulated Basestations", type=int, default=2)
+    parser.add_argument("--runs", help="Number of runs", type=int, default=5)
+    parser.add_argument("--warm", help="Run with the discovery cache filled", action="store_true")
+    parser.add_argument("--latency", help="Seconds per simulated BLE operation", type=float, default=0.005)
+    parser.add_argument("--disco_sleep", help="Seconds to wait after a discovery scan", type=float, default=5)
+    parser.add_argument("--timeout", help="Seconds to wait for the first wakeup", type=float, default=60)
+    parser.add_argument("--json", help="Write the report as JSON in this file", default="")
+    parser.add_argument("--verbose", help="Show the output of the runs", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS, action="store_true")
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--report", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        parent(args)
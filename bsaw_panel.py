@@ -0,0 +1,481 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Status panel of Pimax_BSAW, imported the first time the panel is opened to keep wxPython
+# out of the startup path, the log lines are buffered in the main instance LogRing until then
+
+import atexit
+import logging
+import sys
+import threading
+
+import wx
+import wx.lib
+import wx.lib.colourdb
+import wx.dataview as dv
+
+
+class LogListBox(wx.VListBox):
+
+    def __init__(self, parent, _ring, size):
+        """
+        Virtualized log view over the ring buffer, only the visible lines are drawn
+        :param parent:
+        :param _ring:
+        :param size:
+        """
+        wx.VListBox.__init__(self, parent, wx.ID_ANY, size=size, style=wx.BORDER_THEME)
+        self.ring = _ring
+        self.dropped = _ring.dropped
+        self.SetFont(wx.Font(9, wx.FONTFAMILY_MODERN, wx.NORMAL, wx.FONTWEIGHT_NORMAL))
+        dc = wx.ClientDC(self)
+        dc.SetFont(self.GetFont())
+        self.lineheight = dc.GetTextExtent("Wg")[1] + 2
+        self.colours = ((40, wx.RED), (30, wx.Colour("ORANGE RED")), (20, wx.BLACK), (10, wx.Colour("DARK GREEN")))
+        self.SetItemCount(len(_ring))
+
+    def getcolour(self, _levelno):
+        """
+        Return the text colour for the log level
+        :param _levelno:
+        :return:
+        """
+        for levelno, colour in self.colours:
+            if _levelno >= levelno:
+                return colour
+        return self.colours[-1][1]
+
+    def OnMeasureItem(self, n):
+        return self.lineheight
+
+    def OnDrawItem(self, dc, rect, n):
+        try:
+            levelno, line = self.ring[n]
+        except IndexError:
+            return
+        dc.SetFont(self.GetFont())
+        if self.IsSelected(n):
+            dc.SetTextForeground(wx.SystemSettings.GetColour(wx.SYS_COLOUR_HIGHLIGHTTEXT))
+        else:
+            dc.SetTextForeground(self.getcolour(levelno))
+        dc.DrawText(line, rect.x + 2, rect.y + 1)
+
+    def refreshlines(self):
+        """
+        Update the view after the ring buffer changed
+        Autoscroll is enabled if the last line is visible, otherwise the first visible line is kept in place
+        """
+        count = len(self.ring)
+        autoscroll = self.GetVisibleRowsEnd() >= self.GetItemCount()
+        shifted = self.ring.dropped - self.dropped
+        self.dropped = self.ring.dropped
+        first = self.GetVisibleRowsBegin()
+        self.SetItemCount(count)
+        if autoscroll:
+            self.ScrollToRow(max(0, count - 1))
+        elif shifted:
+            self.ScrollToRow(max(0, first - shifted))
+        self.RefreshAll()
+
+
+class LogWnd(wx.Frame):
+
+    def __init__(self, _app):
+        """
+        wxPython logging window
+        :param _app: main module, gives access to the main instance and the tray actions
+        """
+        self.app = _app
+        self.maininst = _app.maininst
+        #import wx.lib.inspection
+        #wx.lib.inspection.InspectionTool().Show()
+
+        try:
+            frame_style = wx.DEFAULT_FRAME_STYLE | wx.RESIZE_BORDER
+            frame_style = frame_style & ~ (wx.RESIZE_BORDER | wx.MAXIMIZE_BOX)
+
+            wx.lib.colourdb.updateColourDB()
+
+            wx.Frame.__init__(self, None,
+                              title="Status panel", style=frame_style)
+
+            self.logtimer = wx.Timer(self)
+            self.Bind(wx.EVT_TIMER, self.on_log_timer, self.logtimer)
+
+            self.Bind(wx.EVT_CLOSE, self.oncloseevt)
+
+            self.SetIcon(wx.Icon("pimax.ico"))
+
+            (self.display_width_, self.display_height_) = wx.GetDisplaySize()
+
+            frame_width = self.display_width_ * 90 / 100
+            frame_height = self.display_height_ * 85 / 100
+            self.SetSize(wx.Size(frame_width, frame_height))
+
+            panel_width = self.GetClientSize().GetWidth()-2
+            panel_height = self.GetClientSize().GetHeight()-46
+
+            status_width = 500
+            text_width = panel_width - status_width
+            text_height = panel_height
+            if text_width < 1:
+                text_width = 100
+
+            value_width = panel_width - text_width
+            unit_width = value_width/10
+            c0_width = int(unit_width*2)
+            c1_width = int(unit_width*2)
+            if c0_width < 120:
+                c0_width = 120
+            if c1_width < 120:
+                c1_width = 120
+            c2_width = int(unit_width*6)
+            delta = (c0_width+c1_width+c2_width)-value_width
+            if delta > 10:
+                c2_width = c2_width - delta
+            if c2_width < 260:
+                c2_width = 260
+
+            status_width = c0_width + c1_width + c2_width
+
+            self.dvc = dv.DataViewCtrl(self,
+                                       style=wx.BORDER_THEME
+                                       | dv.DV_ROW_LINES # nice alternating bg colors
+                                       #| dv.DV_HORIZ_RULES
+                                       | dv.DV_VERT_RULES
+                                       | dv.DV_MULTIPLE
+                                       | dv.DV_NO_HEADER
+                                       , size=(status_width, text_height)
+                                       )
+
+            self.statuspending = False
+            self.model = StatusModel(self.app.getpanelrows(self.maininst.statusbus.getall()))
+            self.maininst.statusbus.subscribe(self.onstatus)
+
+            self.dvc.AssociateModel(self.model)
+
+            c0 = self.dvc.AppendTextColumn("Item " + str(c0_width) + " " + str(value_width),  1, width=c0_width, align=wx.ALIGN_RIGHT, mode=dv.DATAVIEW_CELL_INERT)
+            c1 = self.dvc.AppendTextColumn("Characteristic " + str(c1_width),   2, width=c1_width, align=wx.ALIGN_RIGHT, mode=dv.DATAVIEW_CELL_INERT)
+            c2 = self.dvc.AppendTextColumn("Value " + str(c2_width-4),   3, width=c2_width-4, align=wx.ALIGN_LEFT, mode=dv.DATAVIEW_CELL_INERT)
+
+            for c in self.dvc.Columns:
+                c.Sortable = False
+                c.Reorderable = False
+
+            panel = wx.Panel(self, wx.ID_ANY)
+
+            self.text = LogListBox(panel, self.maininst.logring, size=(text_width, text_height))
+
+            sizer = wx.BoxSizer(wx.VERTICAL)
+            wbox = wx.BoxSizer(wx.HORIZONTAL)
+            hbox = wx.BoxSizer(wx.HORIZONTAL)
+            wbox.Add(self.text, 0, wx.ALL | wx.EXPAND | wx.LEFT, 0)
+            wbox.Add(self.dvc, 0, wx.ALL | wx.EXPAND | wx.RIGHT, 0)
+
+            self.closebtn = wx.Button(panel, wx.ID_ANY, 'Close')
+            self.closebtn.Bind(wx.EVT_BUTTON, self.onclosebutton)
+            self.Bind(wx.EVT_BUTTON, self.onclosebutton, self.closebtn)
+            self.copybtn = wx.Button(panel, wx.ID_ANY, label="Copy to clipboard")
+            self.copybtn.Bind(wx.EVT_BUTTON, self.oncopybutton)
+            self.Bind(wx.EVT_BUTTON, self.oncopybutton, self.copybtn)
+            self.debugbtn = wx.Button(panel, wx.ID_ANY, label="Headset Debug")
+            self.debugbtn.Bind(wx.EVT_BUTTON, self.ondebugbutton)
+            self.Bind(wx.EVT_BUTTON, self.ondebugbutton, self.debugbtn)
+            self.bsmodebtn = wx.Button(panel, wx.ID_ANY, label="BS Switch mode")
+            self.bsmodebtn.Bind(wx.EVT_BUTTON, self.onbsmodebutton)
+            self.Bind(wx.EVT_BUTTON, self.onbsmodebutton, self.bsmodebtn)
+            self.wakeupbtn = wx.Button(panel, wx.ID_ANY, label="BS Wakeup")
+            self.wakeupbtn.Bind(wx.EVT_BUTTON, self.onwakeupbutton)
+            self.Bind(wx.EVT_BUTTON, self.onwakeupbutton, self.wakeupbtn)
+            self.standbybtn = wx.Button(panel, wx.ID_ANY, label="BS Standby")
+            self.standbybtn.Bind(wx.EVT_BUTTON, self.onstandbybutton)
+            self.Bind(wx.EVT_BUTTON, self.onstandbybutton, self.standbybtn)
+            self.discobtn = wx.Button(panel, wx.ID_ANY, label="Run BS discovery")
+            self.discobtn.Bind(wx.EVT_BUTTON, self.ondiscobutton)
+            self.Bind(wx.EVT_BUTTON, self.ondiscobutton, self.discobtn)
+
+            hbox.Add(self.copybtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
+            hbox.Add(self.debugbtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
+            hbox.Add(self.bsmodebtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
+            hbox.Add(self.standbybtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
+            hbox.Add(self.wakeupbtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
+            hbox.Add(self.discobtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
+            hbox.Add(self.closebtn, 1, wx.ALL | wx.ALIGN_CENTER, 5)
+            sizer.Add(wbox, flag=wx.ALL | wx.EXPAND)
+            sizer.Add(hbox, 1, flag=wx.ALL | wx.ALIGN_CENTER, border=5)
+            panel.SetSizer(sizer)
+            panel.Layout()
+            panel.Fit()
+
+            self.CenterOnScreen()
+            self.dataObj = None
+
+            self.logtimer.Start(75)
+
+            self.Raise()
+
+        except Exception as err:
+            self.app.toast_err("Status panel error: " + str(err))
+
+    def oncloseevt(self, e):
+        """
+        The close button will hide the window without destroying it to keep the logging messages flowing in
+        :param e:
+        """
+        e.Veto()
+        self.Show(False)
+        self.Hide()
+
+    def onclosebutton(self, e):
+        """
+        The close button will hide the window without destroying it to keep the logging messages flowing in
+        :param e:
+        """
+        self.Show(False)
+        self.Hide()
+
+    def ondiscobutton(self, e):
+        """
+        The close button will hide the window without destroying it to keep the logging messages flowing in
+        :param e:
+        """
+        self.app.call_bs_discovery(self.maininst.systray)
+
+    def oncopybutton(self, e):
+        """
+        The copy button will fill the clipboard with the logging messages in the window
+        :param e:
+        """
+        self.dataObj = wx.TextDataObject()
+        self.dataObj.SetText(self.maininst.logring.gettext())
+        if wx.TheClipboard.Open():
+            wx.TheClipboard.SetData(self.dataObj)
+            wx.TheClipboard.Close()
+        else:
+            wx.MessageBox("Unable to open the clipboard", "Error")
+
+    def ondebugbutton(self, e):
+        if self.maininst.debug_bypass_usb:
+            self.maininst.debug_bypass_usb = False
+            self.debugbtn.SetLabel("Headset Debug")
+        else:
+            self.maininst.debug_bypass_usb = True
+            self.debugbtn.SetLabel("Headset Auto")
+        self.maininst.hsthr.notify()
+
+    def onwakeupbutton(self, e):
+        self.maininst.setwakeup()
+
+    def onstandbybutton(self, e):
+        self.maininst.setstandby()
+
+    def onbsmodebutton(self, e):
+        self.maininst.setmode()
+
+    def on_log_timer(self, e):
+        """
+        This function is triggered by the log timer, the queued messages are drained in one batch
+        and the visible lines are refreshed once, only if the window is shown
+        :param e:
+        """
+        try:
+            if self.maininst.logring.drain() and self.IsShown():
+                self.text.refreshlines()
+        except Exception as err:
+            sys.stderr.write(
+                "Error: %s failed while responding to a log message: %s.\n" % (self.__class__.__name__, str(err)))
+
+    def onstatus(self, _topic, _snapshot):
+        """
+        Status bus callback, called from the publishing thread
+        A burst of snapshots is coalesced in one update on the GUI thread
+        :param _topic:
+        :param _snapshot:
+        """
+        if not self.statuspending:
+            self.statuspending = True
+            wx.CallAfter(self.refreshstatus)
+
+    def refreshstatus(self):
+        """
+        Diff the current snapshots into the status model, only if the window is shown
+        """
+        self.statuspending = False
+        if not self.IsShown():
+            return
+        try:
+            self.maininst.panelupdate = "Live"
+            self.model.update(self.app.getpanelrows(self.maininst.statusbus.getall()))
+        except Exception as err:
+            if not self.maininst.quit_main:
+                self.app.toast_err("Update panel exception: " + str(err))
+                logging.debug("Panel update exception: " + str(err))
+                self.maininst.panelupdate = "Error"
+                self.model.update(self.maininst.get_dashboard_except())
+
+    def showpanel(self):
+        """
+        Show the window with the log lines and the status received while hidden
+        """
+        self.maininst.logring.drain()
+        self.text.refreshlines()
+        self.Show(True)
+        self.refreshstatus()
+        self.Raise()
+
+
+class StatusModel(dv.DataViewIndexListModel):
+    def __init__(self, data):
+        dv.DataViewIndexListModel.__init__(self, len(data))
+        self.wxgray = wx.Colour(47, 79, 79)
+        self.data = [list(row) for row in data]
+
+    def GetColumnType(self, col):
+        return "string"
+
+    # This method is called to provide the data object for a
+    # particular row,col
+    def GetValueByRow(self, row, col):
+        return self.data[row][col]
+
+    # Report how many columns this model provides data for.
+    def GetColumnCount(self):
+        return 4
+
+    # Report the number of rows in the model
+    def GetCount(self):
+        return len(self.data)
+
+    # Called to check if non-standard attributes should be used in the
+    # cell at (row, col)
+    def GetAttrByRow(self, row, col, attr):
+        if col == 1:
+            attr.SetColour(self.wxgray)
+            attr.SetBold(True)
+            attr.SetItalic(True)
+            return True
+        if col == 3:
+            attr.SetColour('blue')
+            attr.SetBold(True)
+            return True
+        return False
+
+    def AddRow(self, value):
+        # update data structure
+        self.data.append(value)
+        # notify views
+        self.RowAppended()
+
+    def update(self, data):
+        """
+        Diff a new snapshot against the current rows and notify the views only
+        for the rows that changed, were appended or were removed.
+        Must be called from the GUI thread.
+        :param data: list of rows, each row [index, item, characteristic, value]
+        :return: number of rows notified
+        """
+        changed = 0
+        oldlen = len(self.data)
+        newlen = len(data)
+        for row in range(min(oldlen, newlen)):
+            if self.data[row] != data[row]:
+                self.data[row] = list(data[row])
+                self.RowChanged(row)
+                changed += 1
+        for row in range(oldlen, newlen):
+            self.AddRow(list(data[row]))
+            changed += 1
+        for row in range(oldlen - 1, newlen - 1, -1):
+            del self.data[row]
+            self.RowDeleted(row)
+            changed += 1
+        return changed
+
+
+class LogThread(threading.Thread):
+
+    def __init__(self, _app, autostart=True):
+        """
+        Run the log window in a thread.
+        Access the frame with self.frame
+
+        :param _app: main module
+        :type autostart: object
+        """
+        threading.Thread.__init__(self)
+        self.app = _app
+        self.setDaemon(True)
+        self.start_orig = self.start
+        self.start = self.start_local
+        self.frame = None  # to be defined in self.run
+        self.framepnl = None
+        self.status = ""
+        self.lock = threading.Lock()
+        self.lock.acquire()  # lock until variables are set
+
+        if autostart:
+            self.start()  # automatically start thread on init
+
+    def run(self):
+        """
+        Initialize the frame with with the wxPython class and run the window MainLoop
+        """
+        atexit.register(disable_asserts)
+
+        app = wx.App(False)
+
+        frame = LogWnd(self.app)
+
+        # define frame and release lock
+        self.frame = frame
+        self.lock.release()
+
+        app.MainLoop()
+
+    def showpanel(self):
+        """
+        Show the window from any thread
+        """
+        wx.CallAfter(self.frame.showpanel)
+
+    def destroy(self):
+        """
+         Override the destroy adding frame destroy first
+        """
+        self.frame.Destroy()
+
+    def start_local(self):
+        """
+        Start the thread with original run and acquire the lock
+        """
+        self.start_orig()
+        self.lock.acquire()
+
+
+def runlogthread(_app):
+    """
+    Run the Logging window thread and makes the frame accessible
+    :param _app: main module
+    :return:
+    """
+    lt = LogThread(_app)  # run wx MainLoop as thread
+    #frame = lt.frame  # access to wx Frame
+    lt.frame.Show(False)
+    return lt
+
+
+def disable_asserts():
+    """
+    Disable wxPython error messages when destroying the windows
+    """
+    wx.DisableAsserts()
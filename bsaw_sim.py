@@ -0,0 +1,519 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Simulated Basestations, Headset, system tray and toaster to run Pimax_BSAW without Bluetooth, USB or Windows
+# The main instance has one extension point for each of them, install() sets them all:
+#   maininst.ble_backend       BLE engine backend, BleakBackend by default -> SimRadio
+#   maininst.presence_backend  Headset presence backend, picked by PRESENCE by default -> SimHeadset
+#   maininst.tray_factory      system tray, infi.systray SysTrayIcon by default -> SimTray
+#   maininst.toaster           toast notifications, win10toast ToastNotifier by default -> SimToaster
+
+import asyncio
+import collections
+import json
+import random
+import threading
+import time
+
+CMD_UUID_V1 = "0000cb01-0000-1000-8000-00805f9b34fb"
+CMD_UUID_V2 = "00000012-0000-1000-8000-00805f9b34fb"
+CMD_V1_WAKEUP_NO_TIMEOUT = 0x1200
+CMD_V1_WAKEUP_DEFAULT_TIMEOUT = 0x1201
+CMD_V1_WAKEUP_TIMEOUT = 0x1202
+CMD_V1_BROADCAST_ID = 0xffffffff
+CMD_V2_SLEEP = 0x00
+CMD_V2_WAKEUP = 0x01
+
+
+class SimDrop(Exception):
+    pass
+
+
+class SimStation:
+
+    def __init__(self, _serial, _version=1, _mac=None, _latency=None, _droprate=None, _logsize=256):
+        """
+        Virtual Basestation: advertises its name, accepts the v1/v2 command frames and models the power state
+        :param _serial: serial number as stored in the Lighthouse DB
+        :param _version: 1 for HTC v1, 2 for Valve v2
+        :param _mac: MAC address, derived from the serial number if None
+        :param _latency: seconds per BLE operation, the radio default if None
+        :param _droprate: probability of a BLE operation failing, the radio default if None
+        :param _logsize: (time, action) entries kept in the command log, the oldest are dropped
+        """
+        self.serial = int(_serial)
+        self.version = int(_version)
+        if _mac is None:
+            _mac = ":".join("%02X" % byte for byte in (0xC0 | self.version, 0x5A) + tuple(
+                self.serial.to_bytes(4, byteorder="big")))
+        self.address = _mac
+        if self.version == 2:
+            self.name = "LHB-%08X" % (self.serial & 0xffffffff)
+        else:
+            self.name = "HTC BS %06X" % (self.serial & 0xffffff)
+        self.latency = _latency
+        self.droprate = _droprate
+        self.lock = threading.Lock()
+        self.power = "Standby"
+        self.expires = None
+        self.writes = 0
+        self.rejected = 0
+        self.drops = 0
+        self.connects = 0
+        self.expired = 0
+        self.commands = {}
+        self.log = collections.deque(maxlen=_logsize)
+
+    def getpower(self):
+        """
+        Return the power state, a v1 Basestation goes back to standby when its timeout expires
+        :return:
+        """
+        with self.lock:
+            self.expire(time.monotonic())
+            return self.power
+
+    def expire(self, _t_now):
+        """
+        Go back to standby if the v1 timeout expired before _t_now, the lock must be held
+        :param _t_now:
+        """
+        if self.power == "On" and self.expires is not None and _t_now > self.expires:
+            self.power = "Standby"
+            self.expires = None
+            self.expired += 1
+
+    def decode(self, _uuid, _data):
+        """
+        Decode a command frame
+        :param _uuid:
+        :param _data:
+        :return: (action, timeout) with action Wakeup, Ping or Standby
+        :raise ValueError: the frame is not valid for this Basestation
+        """
+        data = bytes(_data)
+        if self.version == 2:
+            if _uuid != CMD_UUID_V2 or len(data) != 1 or data[0] not in (CMD_V2_SLEEP, CMD_V2_WAKEUP):
+                raise ValueError("invalid v2 frame " + data.hex() + " on " + str(_uuid))
+            return ("Wakeup" if data[0] == CMD_V2_WAKEUP else "Standby"), None
+        if _uuid != CMD_UUID_V1 or len(data) != 20 or any(data[8:]):
+            raise ValueError("invalid v1 frame " + data.hex() + " on " + str(_uuid))
+        cmd_id = int.from_bytes(data[0:2], byteorder="big")
+        cmd_timeout = int.from_bytes(data[2:4], byteorder="big")
+        cmd_bs_id = int.from_bytes(data[4:8], byteorder="little")
+        if cmd_bs_id not in (CMD_V1_BROADCAST_ID, self.serial & 0xffffffff):
+            raise ValueError("v1 frame for id " + hex(cmd_bs_id))
+        if cmd_id == CMD_V1_WAKEUP_TIMEOUT and cmd_timeout <= 10:
+            return "Standby", cmd_timeout
+        if cmd_id == CMD_V1_WAKEUP_NO_TIMEOUT:
+            return "Wakeup", None
+        if cmd_id in (CMD_V1_WAKEUP_DEFAULT_TIMEOUT, CMD_V1_WAKEUP_TIMEOUT):
+            return ("Wakeup" if cmd_bs_id == CMD_V1_BROADCAST_ID else "Ping"), cmd_timeout
+        raise ValueError("unknown v1 command " + hex(cmd_id))
+
+    def write(self, _uuid, _data, _timescale=1.0):
+        """
+        Execute a command frame
+        :param _uuid:
+        :param _data:
+        :param _timescale: simulated seconds per wall second, the v1 timeout expires _timescale times faster
+        :raise ValueError: the frame is rejected
+        """
+        try:
+            action, timeout = self.decode(_uuid, _data)
+        except ValueError:
+            with self.lock:
+                self.rejected += 1
+            raise
+        t_now = time.monotonic()
+        with self.lock:
+            self.expire(t_now)
+            self.writes += 1
+            self.commands[action] = self.commands.get(action, 0) + 1
+            self.log.append((t_now, action))
+            if action == "Standby":
+                self.power = "Standby"
+                self.expires = None
+            else:
+                self.power = "On"
+                self.expires = None if timeout is None else t_now + timeout / _timescale
+
+    def getstats(self):
+        """
+        Return dict with the counters of the Basestation
+        :return:
+        """
+        with self.lock:
+            return {"power": self.power, "writes": self.writes, "rejected": self.rejected, "drops": self.drops,
+                    "connects": self.connects, "expired": self.expired, "commands": dict(self.commands)}
+
+
+class SimCharacteristic:
+
+    def __init__(self, _uuid, _value):
+        self.uuid = _uuid
+        self.value = _value
+        self.properties = ["read"]
+        self.description = _uuid
+        self.descriptors = []
+
+
+class SimService:
+
+    def __init__(self, _uuid, _description, _characteristics):
+        self.uuid = _uuid
+        self.description = _description
+        self.characteristics = _characteristics
+
+
+class SimClient:
+
+    def __init__(self, _radio, _mac, loop=None):
+        """
+        BleakClient stand-in bound to a virtual Basestation, same coroutine API as bleak 0.10
+        A dropped write loses the link like a real Basestation out of range
+        :param _radio:
+        :param _mac:
+        :param loop:
+        """
+        self.radio = _radio
+        self.address = _mac
+        self.loop = loop
+        self.station = None
+        self.connected = False
+        self.services = []
+
+    async def operation(self, _station):
+        """
+        Wait the latency of one BLE operation, raise SimDrop if the operation is dropped
+        :param _station:
+        """
+        await asyncio.sleep(self.radio.getlatency(_station))
+        if self.radio.isdropped(_station):
+            with _station.lock:
+                _station.drops += 1
+            raise SimDrop("simulated BLE drop on " + _station.address)
+
+    async def connect(self, timeout=10):
+        station = self.radio.get(self.address)
+        if station is None or not self.radio.isreachable(station):
+            await asyncio.sleep(timeout)
+            raise Exception("Device with address " + self.address + " was not found")
+        await self.operation(station)
+        with station.lock:
+            station.connects += 1
+        self.station = station
+        if station.version == 2:
+            chars = [SimCharacteristic("00002a00-0000-1000-8000-00805f9b34fb", station.name.encode()),
+                     SimCharacteristic("00002a29-0000-1000-8000-00805f9b34fb", b"Valve Corporation"),
+                     SimCharacteristic("00002a24-0000-1000-8000-00805f9b34fb", b"sim-fw"),
+                     SimCharacteristic("00002a25-0000-1000-8000-00805f9b34fb", b"sim-fw2")]
+        else:
+            chars = [SimCharacteristic("00002a00-0000-1000-8000-00805f9b34fb", station.name.encode()),
+                     SimCharacteristic("00002a23-0000-1000-8000-00805f9b34fb", b"HTC"),
+                     SimCharacteristic("00002a24-0000-1000-8000-00805f9b34fb", b"sim-fw")]
+        self.services = [SimService("0000180a-0000-1000-8000-00805f9b34fb", "Device Information", chars)]
+        self.connected = True
+        return True
+
+    async def is_connected(self):
+        return self.connected and self.radio.isreachable(self.station)
+
+    async def disconnect(self):
+        self.connected = False
+        return True
+
+    async def write_gatt_char(self, _uuid, _data, response=False):
+        if not await self.is_connected():
+            raise Exception("Not connected")
+        try:
+            await self.operation(self.station)
+        except SimDrop:
+            self.connected = False
+            raise
+        self.station.write(str(_uuid).lower(), _data, self.radio.timescale)
+
+    async def read_gatt_char(self, _uuid):
+        if not await self.is_connected():
+            raise Exception("Not connected")
+        await self.operation(self.station)
+        for service in self.services:
+            for char in service.characteristics:
+                if char.uuid == _uuid:
+                    return bytearray(char.value)
+        raise Exception("Characteristic " + _uuid + " not found")
+
+    async def read_gatt_descriptor(self, _handle):
+        raise Exception("Descriptor " + str(_handle) + " not found")
+
+
+class SimAdvertisement:
+
+    def __init__(self, _station):
+        self.address = _station.address
+        self.name = _station.name
+
+
+class SimScanner:
+
+    def __init__(self, _radio, detection_callback=None):
+        """
+        BleakScanner stand-in, each reachable Basestation advertises once per advertising interval
+        :param _radio:
+        :param detection_callback:
+        """
+        self.radio = _radio
+        self.callback = detection_callback
+        self.task = None
+
+    async def advertise(self):
+        while True:
+            for station in list(self.radio.stations.values()):
+                if self.callback is not None and self.radio.isreachable(station):
+                    self.callback(SimAdvertisement(station))
+                await asyncio.sleep(self.radio.advinterval / max(1, len(self.radio.stations)))
+
+    async def start(self):
+        self.task = asyncio.ensure_future(self.advertise())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
+class SimRadio:
+
+    name = "sim"
+
+    def __init__(self, _stations, _latency=0.005, _jitter=0.2, _droprate=0.0, _advinterval=0.1, _seed=None,
+                 _timescale=1.0):
+        """
+        Virtual BLE adapter, same attributes as the BleakBackend of the BLE engine
+        :param _stations: list of SimStation
+        :param _latency: default seconds per BLE operation
+        :param _jitter: latency spread, the latency is uniform in +/- _jitter * latency
+        :param _droprate: default probability of a BLE operation failing
+        :param _advinterval: seconds for all the Basestations to advertise once
+        :param _seed: seed of the random generator for repeatable runs
+        :param _timescale: simulated seconds per wall second, the v1 Basestation timeouts expire faster
+        """
+        self.stations = dict((station.address, station) for station in _stations)
+        self.latency = _latency
+        self.jitter = _jitter
+        self.droprate = _droprate
+        self.advinterval = _advinterval
+        self.random = random.Random(_seed)
+        self.timescale = _timescale
+        self.unreachable = set()
+
+    def get(self, _mac):
+        return self.stations.get(str(_mac).upper())
+
+    def getlatency(self, _station):
+        latency = self.latency if _station.latency is None else _station.latency
+        return latency * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def isdropped(self, _station):
+        droprate = self.droprate if _station.droprate is None else _station.droprate
+        return droprate > 0 and self.random.random() < droprate
+
+    def isreachable(self, _station):
+        return _station is not None and _station.address not in self.unreachable
+
+    def setreachable(self, _mac, _reachable):
+        """
+        Move a Basestation in or out of range
+        :param _mac:
+        :param _reachable:
+        """
+        if _reachable:
+            self.unreachable.discard(str(_mac).upper())
+        else:
+            self.unreachable.add(str(_mac).upper())
+
+    def client_factory(self, _mac, loop=None):
+        return SimClient(self, _mac, loop=loop)
+
+    def scanner_factory(self, detection_callback=None):
+        return SimScanner(self, detection_callback=detection_callback)
+
+    def getstats(self):
+        """
+        Return dict MAC -> counters of all the Basestations
+        :return:
+        """
+        return dict((mac, station.getstats()) for mac, station in self.stations.items())
+
+
+class SimHidDevice:
+
+    def __init__(self, _vendor_id, _product_id=0x0101):
+        self.vendor_id = _vendor_id
+        self.product_id = _product_id
+        self.vendor_name = "Simulated"
+        self.product_name = "Simulated headset"
+        self.device_path = "sim:%04x:%04x" % (_vendor_id, _product_id)
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return self.device_path
+
+
+class SimHeadset:
+
+    name = "sim"
+
+    def __init__(self, _vendor_id, _plugged=True, _hotplug=True, _interval=60):
+        """
+        Virtual headset, same interface as the presence backends of the Headset thread
+        :param _vendor_id:
+        :param _plugged: headset connected at start
+        :param _hotplug: deliver change notifications, otherwise the Headset thread polls every _interval
+        :param _interval:
+        """
+        self.device = SimHidDevice(_vendor_id)
+        self.plugged = _plugged
+        self.hotplug = _hotplug
+        self.interval = _interval
+        self.settle = 0
+        self.notify = None
+        self.enumerations = 0
+
+    def start(self, _notify):
+        self.notify = _notify if self.hotplug else None
+        return self.hotplug
+
+    def stop(self):
+        self.notify = None
+
+    def getdevices(self, _all=False):
+        self.enumerations += 1
+        return [self.device] if self.plugged else []
+
+    def plug(self):
+        """
+        Connect the headset
+        """
+        self.setplugged(True)
+
+    def unplug(self):
+        """
+        Disconnect the headset
+        """
+        self.setplugged(False)
+
+    def setplugged(self, _plugged):
+        self.plugged = _plugged
+        if self.notify is not None:
+            self.notify()
+
+
+class SimTray:
+
+    def __init__(self, _icon, _hover_text, _menu_options, on_quit=None):
+        """
+        SysTrayIcon stand-in recording the hover text updates
+        """
+        self.hover_text = _hover_text
+        self.menu_options = _menu_options
+        self.on_quit = on_quit
+        self.updates = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def update(self, icon=None, hover_text=None):
+        if hover_text is not None:
+            self.hover_text = hover_text
+            self.updates += 1
+
+    def shutdown(self):
+        pass
+
+    def menu(self, _text):
+        """
+        Run the tray menu entry _text like a click on it
+        :param _text:
+        """
+        for text, icon, action in self.menu_options:
+            if text == _text:
+                threading.Thread(target=action, args=(self,)).start()
+                return
+        raise KeyError(_text)
+
+    def quit(self):
+        """
+        Same as the tray menu Quit entry
+        """
+        if self.on_quit is not None:
+            threading.Thread(target=self.on_quit, args=(self,)).start()
+
+
+class SimToaster:
+
+    def __init__(self):
+        self.toasts = []
+
+    def show_toast(self, _title, _msg, icon_path=None, duration=5, threaded=False):
+        self.toasts.append(_msg)
+
+    def notification_active(self):
+        return False
+
+
+def getserials(_count, _base=0x2A5B0000):
+    """
+    Return _count distinct Basestation serial numbers
+    :param _count:
+    :param _base:
+    :return:
+    """
+    return [_base + idx * 0x1111 for idx in range(_count)]
+
+
+def writelighthousedb(_filename, _serials):
+    """
+    Write a Lighthouse DB with one universe holding the Basestations _serials
+    :param _filename:
+    :param _serials:
+    """
+    universe = {"base_stations": [{"base_serial_number": serial} for serial in _serials]}
+    with open(_filename, "w") as json_file:
+        json.dump({"known_universes": [universe]}, json_file)
+
+
+def install(_maininst, _serials, _version=1, _plugged=True, **radio_args):
+    """
+    Install the simulated backends in the main instance, before main() runs
+    :param _maininst:
+    :param _serials: serial numbers of the virtual Basestations
+    :param _version: Basestations version
+    :param _plugged: headset connected at start
+    :param radio_args: SimRadio arguments (_latency, _jitter, _droprate, _advinterval, _seed, _timescale)
+    :return: the SimRadio and the SimHeadset
+    """
+    radio = SimRadio([SimStation(serial, _version) for serial in _serials], **radio_args)
+    headset = SimHeadset(_maininst.pimax_usb_vendor_id or 0x0483, _plugged)
+    _maininst.ble_backend = radio
+    _maininst.presence_backend = headset
+    _maininst.tray_factory = SimTray
+    _maininst.settoaster(SimToaster())
+    return radio, headset
@@ -0,0 +1,107 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# BLE radio arbiter on a private event loop, no BLE engine thread needed
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+
+def test_cancel_while_handed_slot():
+    async def scenario():
+        arbiter = bsaw.BleArbiter(1)
+        await arbiter.acquire()
+        waiter = asyncio.ensure_future(arbiter.acquire())
+        await asyncio.sleep(0)
+        # the slot is handed over and the waiter cancelled in the same loop iteration
+        arbiter.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert arbiter.active == 0
+        assert not arbiter.waiters
+
+    asyncio.run(scenario())
+
+
+def test_timeout_frees_queue():
+    async def scenario():
+        arbiter = bsaw.BleArbiter(1)
+        await arbiter.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await arbiter.acquire(0.01)
+        assert arbiter.timeouts == 1
+        assert not arbiter.waiters
+        arbiter.release()
+        await asyncio.wait_for(arbiter.acquire(), 1)
+        assert arbiter.active == 1
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("concurrency", [1, 2, 3])
+def test_fifo_order_and_concurrency(concurrency):
+    async def scenario():
+        arbiter = bsaw.BleArbiter(concurrency)
+        order = []
+        active = []
+
+        async def operation(_idx):
+            order.append(_idx)
+            active.append(arbiter.active)
+            await asyncio.sleep(0.01)
+
+        tasks = []
+        for idx in range(8):
+            tasks.append(asyncio.ensure_future(arbiter.run(operation(idx))))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == list(range(8))
+        assert max(active) == concurrency
+        assert arbiter.active == 0
+        assert arbiter.acquired == 8
+        assert arbiter.wait_max >= 0.01 * (8 // concurrency - 1) * 0.9
+        assert arbiter.timeouts == 0
+
+    asyncio.run(scenario())
+
+
+def test_run_closes_coroutine_when_cancelled():
+    async def scenario():
+        arbiter = bsaw.BleArbiter(1)
+        await arbiter.acquire()
+        ran = []
+
+        async def operation():
+            ran.append(True)
+
+        coro = operation()
+        task = asyncio.ensure_future(arbiter.run(coro))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert coro.cr_frame is None
+        assert not ran
+        assert not arbiter.waiters
+
+    asyncio.run(scenario())
@@ -0,0 +1,220 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Shared BLE engine driven by the simulated BleakClient of bsaw_sim, runs on Linux without Bluetooth
+#
+#   python -m pytest tests
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bsaw_sim
+import Pimax_BSAW as bsaw
+
+STATIONS = 8
+
+
+class ThreadClient(bsaw_sim.SimClient):
+    """
+    SimClient recording the threads the BLE operations run on
+    """
+    threads = set()
+    clients = []
+
+    def __init__(self, _radio, _mac, loop=None):
+        bsaw_sim.SimClient.__init__(self, _radio, _mac, loop=loop)
+        ThreadClient.clients.append(self)
+
+    async def connect(self, timeout=10):
+        ThreadClient.threads.add(threading.get_ident())
+        return await bsaw_sim.SimClient.connect(self, timeout)
+
+    async def write_gatt_char(self, _uuid, _data, response=False):
+        ThreadClient.threads.add(threading.get_ident())
+        return await bsaw_sim.SimClient.write_gatt_char(self, _uuid, _data, response)
+
+
+def writeconfig(_workdir, _serials):
+    """
+    Write configuration.ini and a Lighthouse DB with the Basestations _serials in _workdir
+    :param _workdir:
+    :param _serials:
+    """
+    with open(os.path.join(ROOT, "configuration.ini")) as ini_file:
+        lines = ini_file.read().splitlines()
+    for idx, line in enumerate(lines):
+        if line.startswith("LH_DB_FILE"):
+            lines[idx] = "LH_DB_FILE = " + os.path.join(_workdir, "lighthousedb.json")
+        elif line.startswith("DISCOVERY_CACHE_FILE"):
+            lines[idx] = "DISCOVERY_CACHE_FILE = " + os.path.join(_workdir, "discoverycache.json")
+    with open(os.path.join(_workdir, "configuration.ini"), "w") as ini_file:
+        ini_file.write("\n".join(lines) + "\n")
+    bsaw_sim.writelighthousedb(os.path.join(_workdir, "lighthousedb.json"), _serials)
+
+
+def waitfor(_condition, _timeout=10):
+    """
+    Return True when _condition() is true, False after _timeout seconds
+    :param _condition:
+    :param _timeout:
+    :return:
+    """
+    timeref = time.monotonic()
+    while time.monotonic() - timeref < _timeout:
+        if _condition():
+            return True
+        time.sleep(0.02)
+    return _condition()
+
+
+@pytest.fixture(params=[1, 2], ids=["v1", "v2"])
+def engine(request, tmp_path, monkeypatch):
+    """
+    Manager core with STATIONS simulated Basestations discovered and keepalives started
+    :return: (maininst, bleengine, radio, threads before the keepalives started)
+    """
+    monkeypatch.chdir(tmp_path)
+    serials = bsaw_sim.getserials(STATIONS)
+    writeconfig(str(tmp_path), serials)
+    ThreadClient.threads = set()
+    ThreadClient.clients = []
+
+    maininst = bsaw.maininst = bsaw.MainObj()
+    radio, headset = bsaw_sim.install(maininst, serials, request.param, _latency=0.001, _seed=1)
+    radio.client_factory = lambda _mac, loop=None: ThreadClient(radio, _mac, loop=loop)
+    maininst.load_configuration(maininst.toaster)
+    maininst.bs_disco_sleep = 0
+
+    bleengine = bsaw.BleEngine(maininst)
+    maininst.setengine(bleengine)
+    bleengine.start()
+    hsthr = bsaw.HeadSet(maininst.hs_label, maininst)
+    tray = bsaw_sim.SimTray(maininst.tray_icon, "Initializing...", ())
+    maininst.set_threads(tray, hsthr, None)
+    hsthr.start()
+    bsaw.bs_discovery(tray, False)
+    threads = threading.active_count()
+    maininst.bsreg.startall()
+    yield maininst, bleengine, radio, threads
+
+    maininst.setquit()
+    if bleengine.is_alive():
+        bleengine.stop()
+        bleengine.join(5)
+
+
+def test_keepalives_share_engine_thread(engine):
+    maininst, bleengine, radio, threads = engine
+    assert len(maininst.bsreg) == STATIONS
+    assert waitfor(lambda: all(station.writes > 0 for station in radio.stations.values()))
+    assert ThreadClient.threads == {bleengine.ident}
+    assert threading.active_count() - threads < STATIONS
+
+
+def test_broadcast_frames_reach_stations(engine):
+    maininst, bleengine, radio, threads = engine
+    assert waitfor(lambda: all(station.getpower() == "On" for station in radio.stations.values()))
+
+    result = maininst.setstandby(5).result(10)
+    assert [outcome.outcome for outcome in result.outcomes] == ["Done"] * STATIONS
+    for station in radio.stations.values():
+        assert station.getpower() == "Standby"
+        assert station.commands.get("Standby", 0) >= 1
+        assert station.rejected == 0
+
+    result = maininst.setwakeup(5).result(10)
+    assert [outcome.outcome for outcome in result.outcomes] == ["Done"] * STATIONS
+    for station in radio.stations.values():
+        assert station.getpower() == "On"
+        assert station.commands.get("Wakeup", 0) >= 2
+        assert station.rejected == 0
+
+
+def test_stop_shuts_down_loop(engine):
+    maininst, bleengine, radio, threads = engine
+    assert waitfor(lambda: all(station.writes > 0 for station in radio.stations.values()))
+
+    bleengine.stop()
+    bleengine.join(5)
+    assert not bleengine.is_alive()
+    assert not bleengine.loop.is_running()
+    assert not [task for task in asyncio.all_tasks(bleengine.loop) if not task.done()]
+    assert ThreadClient.clients
+    assert not any(client.connected for client in ThreadClient.clients)
+
+
+def test_remove_drops_connection(engine):
+    maininst, bleengine, radio, threads = engine
+    assert waitfor(lambda: all(station.getpower() == "On" for station in radio.stations.values()))
+    serials = [serial for serial, bsthr in maininst.bsreg.stations.items()]
+    bsthr = maininst.bsreg.get(serials[0])
+    station = radio.get(bsthr.mac)
+    standby = station.commands.get("Standby", 0)
+
+    maininst.bsreg.sync(serials[1:])
+    assert len(maininst.bsreg) == STATIONS - 1
+    assert waitfor(lambda: bsthr.mac not in bleengine.pool.clients and not bsthr.is_alive())
+    assert station.commands.get("Standby", 0) == standby
+
+
+def test_remove_standby_headset_off(engine):
+    maininst, bleengine, radio, threads = engine
+    assert waitfor(lambda: all(station.getpower() == "On" for station in radio.stations.values()))
+    maininst.presence_backend.unplug()
+    assert waitfor(lambda: all(station.getpower() == "Standby" for station in radio.stations.values()))
+    serials = [serial for serial, bsthr in maininst.bsreg.stations.items()]
+    bsthr = maininst.bsreg.get(serials[0])
+    station = radio.get(bsthr.mac)
+    # turned on by another host while the headset is off
+    with station.lock:
+        station.power = "On"
+
+    maininst.bsreg.sync(serials[1:])
+    assert waitfor(lambda: station.getpower() == "Standby")
+    assert waitfor(lambda: bsthr.mac not in bleengine.pool.clients and not bsthr.is_alive())
+
+
+def test_replaced_action_superseded(engine):
+    maininst, bleengine, radio, threads = engine
+    assert waitfor(lambda: all(station.getpower() == "On" for station in radio.stations.values()))
+    for mac in radio.stations:
+        radio.setreachable(mac, False)
+
+    standby = maininst.setstandby(10)
+    time.sleep(0.2)
+    wakeup = maininst.setwakeup(1)
+    result = standby.result(2)
+    assert [outcome.outcome for outcome in result.outcomes] == ["Superseded"] * STATIONS
+    assert wakeup.result(5).getdone() == 0
+
+
+def test_discovery_keeps_registry_on_broken_db(engine):
+    maininst, bleengine, radio, threads = engine
+    assert waitfor(lambda: all(station.getpower() == "On" for station in radio.stations.values()))
+    stations = maininst.bsreg.all()
+    # SteamVR rewriting the file while the discovery reads it
+    with open(maininst.lhdb.filename, "w") as json_file:
+        json_file.write('{"known_universes": [{"base_stations": [')
+
+    bsaw.bs_discovery(maininst.systray, False)
+    assert maininst.bsreg.all() == stations
+    assert all(bsthr.is_alive() and not bsthr.tlock for bsthr in stations)
+    assert not maininst.disco
@@ -0,0 +1,81 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Precomputed command frames of a Basestation, no BLE engine needed
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+ACTIONS = ("Wakeup", "Ping", "Standby")
+
+
+@pytest.fixture
+def bsthr():
+    bsaw.maininst = bsaw.MainObj()
+    bsthr = bsaw.BaseStations("BS1", bsaw.maininst, 60)
+    bsthr.setserial(0x1c2d3e4f)
+    bsthr.setpairing("AA:BB:CC:DD:EE:01", 1)
+    return bsthr
+
+
+def checktable(_bsthr):
+    for action in ACTIONS:
+        command = _bsthr.cmdtable[action]
+        assert command.action == action
+        assert command.frame == bytes(_bsthr.build_2_bs_ble_cmd(action))
+        assert isinstance(command.frame, bytes)
+
+
+def test_v1_frames(bsthr):
+    checktable(bsthr)
+    ping = bsthr.cmdtable["Ping"].frame
+    assert len(ping) == 20
+    assert int.from_bytes(ping[2:4], byteorder="big") == 60
+    assert int.from_bytes(ping[4:8], byteorder="little") == 0x1c2d3e4f
+    assert int.from_bytes(bsthr.cmdtable["Wakeup"].frame[4:8], byteorder="little") == 0xffffffff
+
+
+def test_rebuilt_on_serial(bsthr):
+    bsthr.setserial(0x0a0b0c0d)
+    checktable(bsthr)
+    assert int.from_bytes(bsthr.cmdtable["Ping"].frame[4:8], byteorder="little") == 0x0a0b0c0d
+
+
+def test_rebuilt_on_timeout(bsthr):
+    frames = dict((action, bsthr.cmdtable[action].frame) for action in ACTIONS)
+    bsthr.settimeout(45)
+    checktable(bsthr)
+    assert int.from_bytes(bsthr.cmdtable["Ping"].frame[2:4], byteorder="big") == 45
+    assert bsthr.cmdtable["Standby"].frame == frames["Standby"]
+
+
+def test_rebuilt_on_pairing(bsthr):
+    bsthr.setpairing("AA:BB:CC:DD:EE:02", 2)
+    checktable(bsthr)
+    assert bsthr.cmdtable["Wakeup"].frame == bytes([bsthr.bs_cmd_id_wakeup_v2])
+    assert bsthr.cmdtable["Standby"].frame == bytes([bsthr.bs_cmd_id_sleep_v2])
+
+
+def test_pre_action_uses_table(bsthr):
+    bsthr.action = "Ping"
+    bsthr.ping_cmd = True
+    frame, prevact, nextact = bsthr.bs_pre_action()
+    assert frame is bsthr.cmdtable["Ping"].frame
@@ -0,0 +1,72 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Sliding window error counter of the Basestations, the clock is simulated
+
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Simulated time module of Pimax_BSAW, advance it with clock.now += seconds
+    """
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(bsaw, "time", types.SimpleNamespace(monotonic=lambda: clock.now,
+                                                           time=lambda: 1600000000.0 + clock.now))
+    return clock
+
+
+def test_windows_expire(clock):
+    errors = bsaw.ErrorCounter((60, 180, 3600))
+    errors.add("write")
+    clock.now += 30
+    errors.add("connect")
+    assert [errors.count(window) for window in errors.windows] == [2, 2, 2]
+
+    clock.now += 31
+    assert [errors.count(window) for window in errors.windows] == [1, 2, 2]
+    clock.now += 150
+    assert [errors.count(window) for window in errors.windows] == [0, 0, 2]
+    assert errors.getsummary() == "0 in 1m, 0 in 3m, 2 in 1h"
+    clock.now += 3600
+    assert [errors.count(window) for window in errors.windows] == [0, 0, 0]
+    assert errors.total == 2
+    assert errors.getclasssummary() == ""
+
+
+def test_counts_per_class(clock):
+    errors = bsaw.ErrorCounter((60, 3600))
+    for errclass in ("write", "write", "radio", "connect", "write"):
+        errors.add(errclass)
+        clock.now += 10
+    assert errors.count(60, "write") == 3
+    assert errors.count(60, "radio") == 1
+    assert errors.count(60, "missing") == 0
+    assert errors.getclasses(3600) == {"write": 3, "radio": 1, "connect": 1}
+    assert errors.getclasssummary() == "connect 1, radio 1, write 3 in 1h"
+
+    clock.now += 20
+    assert errors.getclasses(60) == {"radio": 1, "connect": 1, "write": 1}
+    assert errors.last == 1040.0
+    assert errors.lastwall == 1600000000.0 + 1040.0
@@ -0,0 +1,81 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Built-in incremental JSON parser used for the Lighthouse DB when ijson is not installed
+
+import io
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+VALID = ['{"a": [1, 2.5, {"b": "x\\"y"}], "c": true, "d": null}', '[]', '{}', '[[], {}]', '"text"', '-3e2',
+         '[0, -0, 10, 0.5, -1.25e+3, 1E-2, 120]',
+         '{"known_universes": [{"base_stations": [{"base_serial_number": 1}], "universe_id": 7}]}']
+INVALID = ['[1,,2]', '{"a" 1}', '[1 2]', '{"a": 1 "b": 2}', '[1,]', '{"a": 1,}', '{,"a": 1}', '[,1]',
+           '{"a":: 1}', '{"a": 1]', '[1}', '1 2', '{} []', '{"a"}', '{1: 2}', '', '[1', '{"a": [}',
+           '[01]', '[1.]', '[.5]', '[-]', '[1e]', '[1e+]', '[+1]', '[1-2]', '[1.2.3]', '[-01]', '[00]']
+
+
+def build(_events):
+    """
+    Rebuild the document from the events
+    :param _events:
+    :return:
+    """
+    stack = [[]]
+    keys = []
+    for prefix, event, value in _events:
+        if event == "map_key":
+            keys.append(value)
+            continue
+        if event in ("start_map", "start_array"):
+            stack.append({} if event == "start_map" else [])
+            continue
+        if event in ("end_map", "end_array"):
+            value = stack.pop()
+        container = stack[-1]
+        if isinstance(container, dict):
+            container[keys.pop()] = value
+        else:
+            container.append(value)
+    return stack[0][0]
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 65536])
+@pytest.mark.parametrize("text", VALID)
+def test_valid_like_json(text, chunk):
+    assert build(bsaw.iterjson(io.StringIO(text), None, chunk)) == json.loads(text)
+
+
+@pytest.mark.parametrize("chunk", [1, 65536])
+@pytest.mark.parametrize("text", INVALID)
+def test_invalid_raises(text, chunk):
+    with pytest.raises(ValueError):
+        json.loads(text)
+    with pytest.raises(ValueError):
+        list(bsaw.iterjson(io.StringIO(text), None, chunk))
+
+
+def test_skipped_paths():
+    text = '{"known_universes": [{"calibration": [[1, 2], {"x": "]"}], "universe_id": 7}], "revision": 1}'
+    events = list(bsaw.iterjson(io.StringIO(text), [bsaw.LH_DB_UNIVERSE_ID], 4))
+    assert (bsaw.LH_DB_UNIVERSE_ID, "number", 7) in events
+    assert not [event for event in events if event[0].endswith("calibration")]
@@ -0,0 +1,78 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# LightHouse DB cache and watch, no BLE engine needed
+
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+
+def writedb(_filename, _serials, _universe=1000):
+    with open(_filename, "w") as json_file:
+        json.dump({"known_universes": [{"base_stations": [{"base_serial_number": sn} for sn in _serials],
+                                        "universe_id": _universe}], "revision": 1}, json_file)
+
+
+def test_parse_only_when_changed(tmp_path):
+    filename = str(tmp_path / "lighthousedb.json")
+    writedb(filename, [1, 2])
+    lhdb = bsaw.LighthouseDB(filename)
+    assert lhdb.getserials() == [1, 2]
+    assert lhdb.getserials() == [1, 2]
+    assert not lhdb.load()
+    assert lhdb.parses == 1
+
+    writedb(filename, [1, 2, 3])
+    assert lhdb.getserials() == [1, 2, 3]
+    assert lhdb.parses == 2
+
+
+def test_universe_selection(tmp_path):
+    filename = str(tmp_path / "lighthousedb.json")
+    writedb(filename, [7, 8], 42)
+    assert bsaw.LighthouseDB(filename, 42).getserials() == [7, 8]
+    assert bsaw.LighthouseDB(filename, 43).getserials() == []
+
+
+def test_watch_calls_until_true(tmp_path):
+    filename = str(tmp_path / "lighthousedb.json")
+    writedb(filename, [1])
+    lhdb = bsaw.LighthouseDB(filename)
+    lhdb.load()
+    calls = []
+    quitevent = threading.Event()
+
+    def callback(_serials):
+        calls.append(list(_serials))
+        return len(calls) >= 3
+
+    lhdb.watch(0.01, quitevent, callback)
+    time.sleep(0.1)
+    assert calls == []
+    writedb(filename, [1, 2])
+    timeref = time.monotonic()
+    while len(calls) < 3 and time.monotonic() - timeref < 5:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    quitevent.set()
+    lhdb.watcher.join(1)
+    assert calls == [[1, 2]] * 3
@@ -0,0 +1,65 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# Status panel log ring buffer, no wx needed
+
+import logging
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+
+def test_keeps_newest_lines():
+    ring = bsaw.LogRing(100)
+    for idx in range(150):
+        ring.put(logging.INFO, "line " + str(idx))
+    assert ring.drain() == 100
+    ring.append(logging.INFO, "first\nsecond")
+    assert len(ring) == 100
+    assert ring[-1] == (logging.INFO, "second")
+    assert ring[0] == (logging.INFO, "line 52")
+    assert ring.dropped == 2
+
+    ring.resize(10)
+    assert len(ring) == 10
+    assert ring.dropped == 92
+
+
+def test_resize_loses_no_queued_message():
+    ring = bsaw.LogRing(100000)
+    count = 2000
+
+    def producer():
+        for idx in range(count):
+            ring.put(logging.INFO, str(idx))
+
+    threads = [threading.Thread(target=producer) for _ in range(4)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for idx in range(2000):
+            ring.resize(100000 + idx)
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert ring.drain() == count * 4
+    assert len(ring) == count * 4
@@ -0,0 +1,54 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Keepalive scheduler stagger, no BLE engine loop needed
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Pimax_BSAW as bsaw
+
+PERIOD = 25
+SPREAD = 30
+
+
+def getspacing(_scheduler):
+    deadlines = sorted(d for d, r in _scheduler.deadlines.values())
+    return min(b - a for a, b in zip(deadlines, deadlines[1:]))
+
+
+def test_stagger_fits_few_stations():
+    scheduler = bsaw.KeepaliveScheduler(None)
+    deadlines = [scheduler.schedule("BS" + str(idx), PERIOD, "Ping", True, SPREAD, PERIOD) for idx in range(8)]
+    assert getspacing(scheduler) >= scheduler.stagger - 1e-6
+    assert max(deadlines) - min(deadlines) < PERIOD
+
+
+def test_stagger_shrinks_with_many_stations():
+    scheduler = bsaw.KeepaliveScheduler(None)
+    deadlines = [scheduler.schedule("BS" + str(idx), PERIOD, "Ping", True, SPREAD, PERIOD) for idx in range(128)]
+    assert max(deadlines) - min(deadlines) <= PERIOD + SPREAD
+    assert getspacing(scheduler) > 0.05
+
+
+def test_no_pileup_on_spread_limit():
+    # without the period hint the full stagger cannot fit, the late deadlines must still be spread out
+    scheduler = bsaw.KeepaliveScheduler(None)
+    for idx in range(128):
+        scheduler.schedule("BS" + str(idx), PERIOD, "Ping", True, SPREAD)
+    deadlines = sorted(d for d, r in scheduler.deadlines.values())
+    assert len(set(deadlines)) == len(deadlines)
+    assert getspacing(scheduler) > 0.01